@@ -17,6 +17,7 @@ import scipy.integrate as integrate
 import numpy as np
 import sciconv
 import complex_integration as ci
+import pulses
 import res_anal_integ as aires
 import dir_anal_integ as aidir
 import in_out
@@ -151,8 +152,10 @@ FX_t1 = lambda t1: - A0X * np.cos(Omega_au * t1) * fp_t(t1) + A0X * Omega_au * n
 # IR pulse
 A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
                       * np.cos(omega_au * t3 + phi)
-integ_IR = lambda t3: (p_au + A_IR(t3))**2
-integ_IR_off = lambda t3, t1: (p_au + A_IR(t3) - A_IR(t1))**2
+#integ_IR = lambda t3: (p_au + A_IR(t3))**2
+IR_phase = pulses.VolkovPhase(pulses.IRPulse(A0L, omega_au, 'sinsq', TL_au=TL_au,
+                                             delta_t_au=delta_t_au, phi=phi))
+#integ_IR_off = lambda t3, t1: (p_au + A_IR(t3) - A_IR(t1))**2
 
 #-------------------------------------------------------------------------
 # technical defintions of functions
@@ -176,15 +179,13 @@ fun_TX2_dir_1 = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
                                      * np.exp(1j * (p_au - A_IR(t1))**2
                                      * (t1-TX_au/2) / 2)
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]
-dress_I1 = lambda t1: integrate.quad(integ_IR_off,delta_t_au - TL_au/2, t_au,
-                                     args=(t1,))[0]
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))
+# int_(delta_t - TL/2)^t (p_au + A_IR(t3) - A_IR(t1))**2 dt3 = phase of the momentum p_au - A_IR(t1)
+dress_I1 = lambda t1: IR_phase(p_au - A_IR(t1), delta_t_au - TL_au/2, t_au)
 dress = lambda t1: np.exp(-1j/2 * dress_I1(t1))
 
 #dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]
-dress_I_after = lambda t1: integrate.quad(integ_IR_off,(delta_t_au-TL_au/2),
-                                         (delta_t_au + TL_au/2), args=(t1,))[0]
+dress_I_after = lambda t1: IR_phase(p_au - A_IR(t1), delta_t_au - TL_au/2,
+                                    delta_t_au + TL_au/2)
 dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))
 #fun_dress_after = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
 #                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
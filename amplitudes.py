@@ -0,0 +1,321 @@
+##########################################################################
+#                       TRANSITION AMPLITUDES                            #
+##########################################################################
+# Purpose:                                                               #
+#          - Vectorized evaluation of the transition amplitudes of       #
+#            nuclear_dyn.py on the whole (E_kin, E_p, mu, lambda) grid.  #
+#                                                                        #
+##########################################################################
+# Notation as in nuclear_dyn.py, all quantities in atomic units.         #
+# With the analytic inner integral, every outer time integral is of the  #
+# form  G(z) = int_(t_low)^(t_up) dt1 FX(t1) exp(z t1)  for some complex #
+# z, and the t dependence of the amplitudes only enters through          #
+# explicit phase factors:                                                #
+#   dir:     z = i (E_kin + E_fin + E_mu)                 (E_kin, mu)    #
+#   res_1:   z = pi W_l + i (Er + E_l + E_p)              (lambda, E_p)  #
+#   res_2:   z = i (E_kin + E_fin + E_mu + E_p)           (E_kin,E_p,mu) #
+# so all integrals at one time step are evaluated in a single            #
+# vector-valued quadrature over t1.                                      #
+##########################################################################
+
+import multiprocessing
+import warnings
+import numpy as np
+import scipy.integrate as integrate
+from scipy.special import wofz
+
+import complex_integration as ci
+
+#-------------------------------------------------------------------------
+#   outer time integrals
+
+def pulse_integrals(FX_t1, z, t_low, t_up, integ_outer='quadrature', **kwargs):
+    # G(z) = int_(t_low)^(t_up) dt1 FX(t1) exp(z t1) for an array of complex z
+    z = np.asarray(z, dtype=complex)
+    if (t_up <= t_low):
+        return np.zeros(z.shape, dtype=complex)
+
+    if (integ_outer == 'quadrature'):
+        eps = kwargs.get("epsabs", 1.49e-8)
+        epsrel = kwargs.get("epsrel", 1.49e-8)
+        lim = kwargs.get("limit", 50)
+        # one adaptive subdivision shared by all z, refined on the largest error
+        tmp = integrate.quad_vec(lambda t1: FX_t1(t1) * np.exp(z * t1), t_low, t_up,
+                                 epsabs=eps, epsrel=epsrel, norm='max', limit=lim)
+        return tmp[0]
+
+    elif (integ_outer == 'analytic'):
+        A0X, Omega_au, sigma = kwargs["gauss"]
+        return gauss_pulse_integrals(z, t_low, t_up, A0X, Omega_au, sigma)
+
+    elif (integ_outer == 'filon'):
+        # FX = sum_j g_j exp(i omega_j t1) with smooth envelopes g_j, kwargs["envelopes"] = [(g_j, omega_j), ...]
+        return ci.filon_integrals(kwargs["envelopes"], z, t_low, t_up,
+                                  kwargs.get("order", 10), kwargs.get("panels", 16))
+
+    elif (integ_outer == 'gauss-legendre'):
+        # composite Gauss-Legendre rule of fixed order for all z, checked against the rule with half the nodes
+        zs = z.ravel()
+        order = kwargs.get("order", 40)
+        panels = kwargs.get("panels", 16)
+        G, err = ci.batch_integrate(lambda t1, zb: FX_t1(t1) * np.exp(zb * t1), t_low, t_up, zs,
+                                    order, panels=panels, chunk=max(1, 2**22 // (order * panels)))
+        tol = max(kwargs.get("epsabs", 1.49e-8), kwargs.get("epsrel", 1.49e-8) * np.max(np.abs(G)))
+        if (np.max(err) > tol):
+            warnings.warn('Gauss-Legendre outer integrals not converged (error estimate '
+                          + str(np.max(err)) + '), increase order or panels.',
+                          integrate.IntegrationWarning, stacklevel=2)
+        return G.reshape(z.shape)
+
+    elif (integ_outer == 'romberg'):
+        # one Romberg tableau for all z, the integrand is evaluated on blocks of nodes      (t1, z)
+        func, romberg_kwargs = romberg_setup(FX_t1, z.ravel(), **kwargs)
+        G = ci.complex_romberg(func, t_low, t_up, **romberg_kwargs)
+        return np.asarray(G).reshape(z.shape)
+
+    else:
+        raise ValueError('Unknown integration scheme for the outer integral: ' + str(integ_outer))
+
+
+def romberg_setup(FX_t1, zs, **kwargs):
+    # integrand FX(t1) exp(z t1) on a block of nodes for all z of the flat array zs, and the
+    # keywords of complex_romberg (tol, rtol, divmax taken from kwargs, the rest is ignored)
+    func = lambda t1: FX_t1(t1)[:,None] * np.exp(np.outer(t1, zs))
+    return func, {"vec_func": True, "block": max(1, 2**22 // max(zs.size, 1)),
+                  "tol": kwargs.get("tol", 1.48e-8), "rtol": kwargs.get("rtol", 1.48e-8),
+                  "divmax": kwargs.get("divmax", 10)}
+
+
+def gauss_pulse_integrals(z, t_low, t_up, A0X, Omega_au, sigma):
+    # closed form of G(z) for the convoluted Gaussian pulse
+    #   FX = - A0X cos(Omega t) f'(t) + A0X Omega sin(Omega t) f(t) = - A0X d/dt [cos(Omega t) f(t)]
+    # integration by parts leaves Gaussian integrals of exp(w t) with w = z +- i Omega:
+    #   int_a^b dt f(t) exp(w t) = 1/2 exp(sigma**2 w**2 / 2) [erfc(u_a) - erfc(u_b)],  u = (t - sigma**2 w) / (sqrt(2) sigma)
+    # exp(sigma**2 w**2 / 2) erfc(u) = exp(-t**2 / (2 sigma**2) + t w) wofz(i u) stays finite
+    # also where the erf of the large complex arguments would overflow
+    z = np.asarray(z, dtype=complex)
+    f_t = lambda t: 1./ np.sqrt(2*np.pi * sigma**2) * np.exp(-t**2 / (2*sigma**2))
+    erfc_t = lambda t, w: (np.exp(-t**2 / (2*sigma**2) + t * w)
+                           * wofz(1j * (t - sigma**2 * w) / (np.sqrt(2) * sigma)))
+    gauss_int = lambda w: 0.5 * (erfc_t(t_low, w) - erfc_t(t_up, w))
+    return (- A0X * (np.cos(Omega_au * t_up) * f_t(t_up) * np.exp(z * t_up)
+                     - np.cos(Omega_au * t_low) * f_t(t_low) * np.exp(z * t_low))
+            + A0X * z * 0.5 * (gauss_int(z + 1j*Omega_au) + gauss_int(z - 1j*Omega_au)))
+
+
+def gauss_exp_erfc(t, w, sigma):
+    # exp(-sigma**2 w**2 / 2) erfc(u),  u = (t - i sigma**2 w) / (sqrt(2) sigma),  via the Faddeeva function:
+    #   = exp(-t**2 / (2 sigma**2) + i w t) wofz(i u)                                  for Re u >= 0
+    #   = 2 exp(-sigma**2 w**2 / 2) - exp(-t**2 / (2 sigma**2) + i w t) wofz(-i u)     for Re u < 0
+    # so that neither the erfc nor the exponential factor can overflow on their own
+    u = (t - 1j * sigma**2 * w) / (np.sqrt(2) * sigma)
+    pref = np.exp(-t**2 / (2*sigma**2) + 1j * w * t)
+    return np.where(u.real >= 0, pref * wofz(1j * u),
+                    2 * np.exp(-sigma**2 * w**2 / 2) - pref * wofz(-1j * u))
+
+
+def wp_res_ints(t, T_up, t_low, E_res, W, Eps, A0X, Omega_au, sigma):
+    # projection integrals of the wavepacket in the resonance state for the convoluted Gaussian XUV pulse
+    # (vectorized form of wp_res_int in nuclear_dyn.py), for all E_res = Er + E_lambda with widths W (lambda)
+    # and all photoelectron energies Eps at once                                                     (lambda, E_p)
+    #   w = E_res + E_p - i pi W,  t_+- = (t - i sigma**2 (w +- Omega)) / (sqrt(2) sigma)
+    #   I = A0X i/4 exp(-i t w) sum_+- exp(-sigma**2 (w +- Omega)**2 / 2)
+    #         * [ w (erf t_+-(T_up) - erf t_+-(t_low)) + i/sigma sqrt(2/pi) (exp(-t_+-(T_up)**2) - exp(-t_+-(t_low)**2)) ]
+    # with exp(-sigma**2 w'**2 / 2) exp(-t_+-(x)**2) = exp(-x**2 / (2 sigma**2) + i w' x) and the erf terms from gauss_exp_erfc
+    w = (np.asarray(E_res, dtype=float)[:,None] + np.asarray(Eps, dtype=float)[None,:]
+         - 1j * np.pi * np.asarray(W, dtype=float)[:,None])
+    I = np.zeros(w.shape, dtype=complex)
+    for wp in (w + Omega_au, w - Omega_au):
+        gauss = lambda x: np.exp(-x**2 / (2*sigma**2) + 1j * wp * x)
+        I += (w * (gauss_exp_erfc(t_low, wp, sigma) - gauss_exp_erfc(T_up, wp, sigma))
+              + 1j / sigma * np.sqrt(2/np.pi) * (gauss(T_up) - gauss(t_low)))
+    return A0X * 0.25j * np.exp(-1j * t * w) * I
+
+
+def wp_res_ints_pulse(t, T_up, t_low, E_res, W, Eps, FX_t1, **kwargs):
+    # the projection integrals of wp_res_ints for any XUV pulse (e.g. sinsq), which have no closed form:
+    #   I = exp(-i t w) int_(t_low)^(T_up) dt1 FX(t1) exp(i w t1) = exp(-i t w) G(i w)               (lambda, E_p)
+    # G from the Gauss-Legendre outer integrals (keywords order, panels, epsabs, epsrel as in pulse_integrals)
+    w = (np.asarray(E_res, dtype=float)[:,None] + np.asarray(Eps, dtype=float)[None,:]
+         - 1j * np.pi * np.asarray(W, dtype=float)[:,None])
+    return np.exp(-1j * t * w) * pulse_integrals(FX_t1, 1j * w, t_low, T_up, 'gauss-legendre', **kwargs)
+
+
+#-------------------------------------------------------------------------
+#   amplitudes on a chunk of the energy grid
+
+class AmplitudeGrid:
+    # A chunk of E_kin values together with all E_p, mu and lambda.
+    #   Ekins, Eps:   E_kin and E_p values of the chunk
+    #   E_fins:       E_fin + E_mu for all final vibrational states mu
+    #   E_lambdas, W_lambda:  vibrational energies and decay widths of the resonance state
+    #   dir_coeffs:   prefac_dir1 <mu|kappa=0>                                 (mu)
+    #   nondir_coeffs: (prefac_res1 <lambda|kappa=0> + prefac_indir1 sum_mup <lambda|mup><mup|kappa=0>)
+    #                  * <mu|lambda>, zero for all excluded (lambda, mu)       (lambda, mu)
+    #   weights:      weight of |J_mu|**2 in the sum over mu (R-DOS for continuous mu)
+    #   FX_t1, integ_outer, integ_kwargs: passed on to pulse_integrals
+    def __init__(self, Ekins, Eps, E_fins, E_lambdas, W_lambda, Er,
+                 dir_coeffs, nondir_coeffs, weights,
+                 FX_t1, integ_outer='quadrature', **integ_kwargs):
+        self.Ekins = np.asarray(Ekins, dtype=float)
+        self.Eps = np.asarray(Eps, dtype=float)
+        self.E_lambdas = np.asarray(E_lambdas, dtype=float)
+        self.W_lambda = np.asarray(W_lambda, dtype=float)
+        self.Er = Er
+        self.dir_coeffs = np.asarray(dir_coeffs, dtype=complex)
+        self.nondir_coeffs = np.asarray(nondir_coeffs, dtype=complex)
+        self.weights = np.asarray(weights, dtype=float)
+        self.FX_t1 = FX_t1
+        self.integ_outer = integ_outer
+        self.integ_kwargs = integ_kwargs
+
+        E_fins = np.asarray(E_fins, dtype=float)
+        self.E_dir = self.Ekins[:,None] + E_fins[None,:]                    # (E_kin, mu)
+        self.E_tot = self.E_dir[:,None,:] + self.Eps[None,:,None]           # (E_kin, E_p, mu)
+        self.z_res = (np.pi * self.W_lambda[:,None]
+                      + 1j * (Er + self.E_lambdas[:,None] + self.Eps[None,:]))  # (lambda, E_p)
+        self.z_all = np.concatenate((1j * self.E_dir.ravel(),
+                                     1j * self.E_tot.ravel(),
+                                     self.z_res.ravel()))
+        self.G_last = None          # integrals from t_low_last to t_up_last, kept for cumulative integration
+        self.romberg = None         # CumulativeRomberg of all integrals for cumulative integration with romberg
+        self.t_low_last = None
+        self.t_up_last = None
+        self.after = None           # coefficients for times after the end of the pulse, see after_pulse
+
+    def integrals(self, t_low, t_up, cumulative=False):
+        # all outer integrals from t_low to t_up, returned as (G_dir, G_tot, G_res)
+        # cumulative: if the integrals up to an earlier t_up are stored, only integrate the new interval and add it
+        # (romberg: by a CumulativeRomberg, whose rtol refers to the accumulated integrals)
+        if (cumulative and self.integ_outer == 'romberg'):
+            if (self.romberg is None or self.romberg.a != t_low):
+                func, romberg_kwargs = romberg_setup(self.FX_t1, self.z_all, **self.integ_kwargs)
+                self.romberg = ci.CumulativeRomberg(func, t_low, **romberg_kwargs)
+            G = self.romberg(t_up) if (t_up > t_low) else np.zeros(self.z_all.shape, dtype=complex)
+        elif (cumulative and self.G_last is not None
+                and t_low == self.t_low_last and self.t_up_last <= t_up):
+            G = self.G_last + pulse_integrals(self.FX_t1, self.z_all, self.t_up_last, t_up,
+                                              self.integ_outer, **self.integ_kwargs)
+        else:
+            G = pulse_integrals(self.FX_t1, self.z_all, t_low, t_up, self.integ_outer,
+                                **self.integ_kwargs)
+        if cumulative:
+            self.G_last, self.t_low_last, self.t_up_last = G, t_low, t_up
+        n_dir, n_tot = self.E_dir.size, self.E_tot.size
+        return (G[:n_dir].reshape(self.E_dir.shape),
+                G[n_dir:n_dir+n_tot].reshape(self.E_tot.shape),
+                G[n_dir+n_tot:].reshape(self.z_res.shape))
+
+    def after_pulse(self, t_low, t_end, cumulative=False):
+        # For all t >= t_end, in particular once the pulse is over, the integrals up to t_end are constants and
+        #   exp(i t E_tot) J_mu = A exp(i t E_p) + C + sum_lambda G_res,lambda H_lambda exp(i t D_lambda - pi W_lambda t)
+        # with A = dir_coeffs G_dir, C = - sum_lambda nondir_coeffs G_tot / iDW_lambda, H_lambda = nondir_coeffs / iDW_lambda.
+        # The integrals and coefficients are calculated once, later time steps only need the phase factors.
+        if (self.after is not None and self.after[0] == (t_low, t_end)):
+            return self.after[1:]
+        G_dir, G_tot, G_res = self.integrals(t_low, t_end, cumulative)
+        iDW = (1j * (self.E_dir[None,:,:] - self.Er - self.E_lambdas[:,None,None])
+               - np.pi * self.W_lambda[:,None,None])                                  # (lambda, E_kin, mu)
+        H = np.zeros(iDW.shape, dtype=complex)
+        incl = np.any(self.nondir_coeffs, axis=1)       # lambdas without any included mu do not contribute
+        H[incl] = self.nondir_coeffs[incl,None,:] / iDW[incl]
+        A = self.dir_coeffs[None,:] * G_dir                                           # (E_kin, mu)
+        C = - np.einsum('lkm,kpm->kpm', H, G_tot)                                     # (E_kin, E_p, mu)
+        self.after = ((t_low, t_end), A, C, G_res, H, iDW)
+        return self.after[1:]
+
+    def squares(self, t, t_low, t_up, cumulative=False):
+        # |J|**2 = sum_mu weight_mu |J_mu|**2 at time t >= t_up with outer integrals up to t_up   (E_kin, E_p)
+        # (t_up = t during the pulse, the end of the pulse afterwards); only phase factors are evaluated
+        A, C, G_res, H, iDW = self.after_pulse(t_low, t_up, cumulative)
+        J = C + A[:,None,:] * np.exp(1j * t * self.Eps)[None,:,None]
+        J += np.einsum('lp,lkm->kpm', G_res, H * np.exp(t * iDW))
+        return np.sum(self.weights * np.abs(J)**2, axis=-1)
+
+
+def split_grid(Ekins, n_chunk, *args, **kwargs):
+    # list of AmplitudeGrids with at most n_chunk E_kin values each
+    return [AmplitudeGrid(Ekins[i:i+n_chunk], *args, **kwargs)
+            for i in range(0, len(Ekins), n_chunk)]
+
+
+#-------------------------------------------------------------------------
+#   parallel evaluation of the chunks
+
+def print_progress(cnt):
+    # for each finished chunk one '-', but for every fifth one '|' instead
+    # (with several processes the marks of all chunks of a process appear when its results arrive)
+    print('|' if (cnt % 5 == 4) else '-', end = '', flush = True)
+
+
+def _grid_worker(grids, conn):
+    # runs in a worker process: evaluate the own chunks for every time step sent through conn
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            conn.send([grid.squares(*task) for grid in grids])
+        except Exception as exc:
+            conn.send(exc)
+    conn.close()
+
+
+class GridWorkers:
+    # Evaluates the chunks of the energy grid in nworkers processes.
+    # Every process is forked once and keeps a fixed set of chunks (round robin) for the whole run,
+    # so the read-only FC arrays are shared with the parent and the stored integrals of the
+    # chunks (cumulative integration, integrals over the whole pulse) stay where they are needed.
+    # The results are merged in the original E_kin order.
+    def __init__(self, grids, nworkers=1):
+        self.grids = grids
+        self.nworkers = max(1, min(nworkers, len(grids)))
+        self.conns = []
+        self.procs = []
+        if (self.nworkers > 1):
+            ctx = multiprocessing.get_context('fork')
+            for w in range(self.nworkers):
+                conn, child_conn = ctx.Pipe()
+                proc = ctx.Process(target=_grid_worker, args=(grids[w::self.nworkers], child_conn),
+                                   daemon=True)
+                proc.start()
+                child_conn.close()
+                self.conns.append(conn)
+                self.procs.append(proc)
+
+    def squares(self, t, t_low, t_up, cumulative=False):
+        # |J|**2 on all chunks, concatenated along E_kin   (E_kin, E_p)
+        if (self.nworkers == 1):
+            squares = []
+            for cnt, grid in enumerate(self.grids):
+                print_progress(cnt)
+                squares.append(grid.squares(t, t_low, t_up, cumulative))
+            return np.concatenate(squares)
+
+        for conn in self.conns:
+            conn.send((t, t_low, t_up, cumulative))
+        results = []
+        cnt = 0
+        for conn in self.conns:
+            res = conn.recv()
+            if isinstance(res, Exception):
+                self.close()
+                raise res
+            for chunk in res:               # one mark per chunk, as with a single process
+                print_progress(cnt)
+                cnt += 1
+            results.append(res)
+        return np.concatenate([results[i % self.nworkers][i // self.nworkers]
+                               for i in range(len(self.grids))])
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for proc in self.procs:
+            proc.join()
+        self.conns = []
+        self.procs = []
@@ -10,16 +10,107 @@
 
 import numpy
 import scipy.integrate as integrate
+import warnings
 
 #-------------------------------------------------------------------------
 #   integration
 
 
+# Gauss-Kronrod 10-21 rule as in QUADPACK (qk21): abscissae and Kronrod weights for x >= 0,
+# Gauss weights belonging to the abscissae with odd index
+xgk21 = numpy.array([0.995657163025808080735527280689003, 0.973906528517171720077964012084452,
+                     0.930157491355708226001207180059508, 0.865063366688984510732096688423493,
+                     0.780817726586416897063717578345042, 0.679409568299024406234327365114874,
+                     0.562757134668604683339000099272694, 0.433395394129247190799265943165784,
+                     0.294392862701460198131126603103866, 0.148874338981631210884826001129720,
+                     0.000000000000000000000000000000000])
+wgk21 = numpy.array([0.011694638867371874278064396062192, 0.032558162307964727478818972459390,
+                     0.054755896574351996031381300244580, 0.075039674810919952767043140916190,
+                     0.093125454583697605535065465083366, 0.109387158802297641899210590325805,
+                     0.123491976262065851077208067966660, 0.134709217311473325928054001771707,
+                     0.142775938577060080797094273138717, 0.147739104901338491374841515972068,
+                     0.149445554002916905664936468389821])
+wg10  = numpy.array([0.066671344308688137593568809893332, 0.149451349150580593145776339657697,
+                     0.219086362515982043995534934228163, 0.269266719309996355091226921569469,
+                     0.295524224714752870173892994651146])
+nodes21 = numpy.concatenate((-xgk21[:-1], xgk21[::-1]))    # all 21 abscissae in [-1, 1]
+wk21 = numpy.concatenate((wgk21[:-1], wgk21[::-1]))
+wg21 = numpy.zeros(21)                                      # Gauss weights on the same abscissae
+wg21[1:10:2] = wg10
+wg21[11:20:2] = wg10[::-1]
+
+
+def gk21_error(K, G, f, hl):
+    # QUADPACK error estimate of a 21-point Kronrod sum K against the Gauss sum G (works on real or complex parts)
+    epmach = numpy.finfo(float).eps
+    resabs = abs(hl) * numpy.sum(wk21 * numpy.abs(f))
+    resasc = abs(hl) * numpy.sum(wk21 * numpy.abs(f - K / (2*hl)))
+    err = abs((K - G))
+    if (resasc != 0 and err != 0):
+        err = resasc * min(1, (200 * err / resasc)**1.5)
+    if (resabs > numpy.finfo(float).tiny / (50 * epmach)):
+        err = max(50 * epmach * resabs, err)
+    return err
+
+
 def complex_quadrature(func, a, b, **kwargs):
-    def real_func(x, **kwargs):
-        return numpy.real(func(x, **kwargs))
-    def imag_func(x, **kwargs):
-        return numpy.imag(func(x, **kwargs))
+    # Adaptive Gauss-Kronrod (21 points) quadrature of a complex function: each node is evaluated once,
+    # the interval with the largest error of the complex integral is bisected until
+    # err <= max(epsabs, epsrel |I|) or limit subintervals are used (like scipy.integrate.quad).
+    # Keywords: epsabs, epsrel, limit, args, points (break points) as in quad;
+    # vectorized=True evaluates func on the 21 nodes of an interval at once; other keywords raise TypeError.
+    # Returns (I, (err_real,), (err_imag,)), infinite limits are passed on to quad for each part.
+    unknown = sorted(set(kwargs) - set(("epsabs", "epsrel", "limit", "args", "points", "vectorized")))
+    if unknown:
+        raise TypeError('complex_quadrature() got unexpected keyword arguments: ' + ', '.join(unknown))
+    epsabs = kwargs.get("epsabs", 1.49e-8)
+    epsrel = kwargs.get("epsrel", 1.49e-8)
+    limit  = kwargs.get("limit", 50)
+    args   = kwargs.get("args", ())
+    points = kwargs.get("points", None)
+    if not (numpy.isfinite(a) and numpy.isfinite(b)):
+        return complex_quadrature_parts(func, a, b, **{k: v for k, v in kwargs.items() if k != "vectorized"})
+    if kwargs.get("vectorized", False):
+        feval = lambda x: numpy.asarray(func(x, *args), dtype=complex) * numpy.ones_like(x)
+    else:
+        feval = lambda x: numpy.array([complex(func(xi, *args)) for xi in x])
+
+    def gk21(lo, hi):
+        hl = 0.5 * (hi - lo)
+        f = feval(0.5 * (lo + hi) + hl * nodes21)
+        K = hl * numpy.sum(wk21 * f)
+        G = hl * numpy.sum(wg21 * f)
+        return [gk21_error(K, G, f, hl), lo, hi, K,
+                gk21_error(K.real, G.real, f.real, hl), gk21_error(K.imag, G.imag, f.imag, hl)]
+
+    edges = [a] + sorted((p for p in (points or []) if min(a,b) < p < max(a,b)), reverse=bool(b < a)) + [b]
+    intervals = [gk21(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    while True:
+        total = sum(iv[3] for iv in intervals)
+        error = sum(iv[0] for iv in intervals)
+        if (error <= max(epsabs, epsrel * abs(total))):
+            break
+        if (len(intervals) >= limit):
+            warnings.warn('The maximum number of subdivisions (' + str(limit) + ') has been achieved.',
+                          integrate.IntegrationWarning, stacklevel=2)
+            break
+        worst = max(range(len(intervals)), key=lambda i: intervals[i][0])
+        err, lo, hi = intervals[worst][:3]
+        mid = 0.5 * (lo + hi)
+        if not (min(lo,hi) < mid < max(lo,hi)):            # interval cannot be bisected any more in floating point
+            warnings.warn('Roundoff error prevents the requested tolerance from being achieved.',
+                          integrate.IntegrationWarning, stacklevel=2)
+            break
+        intervals[worst:worst+1] = [gk21(lo, mid), gk21(mid, hi)]
+    return (complex(total), (sum(iv[4] for iv in intervals),), (sum(iv[5] for iv in intervals),))
+
+
+def complex_quadrature_parts(func, a, b, **kwargs):
+    # two separate real quadratures (one for each part of func), used for infinite limits
+    def real_func(x, *args):
+        return numpy.real(func(x, *args))
+    def imag_func(x, *args):
+        return numpy.imag(func(x, *args))
     real_integral = integrate.quad(real_func, a, b, **kwargs)
     imag_integral = integrate.quad(imag_func, a, b, **kwargs)
     return (real_integral[0] + 1j*imag_integral[0], real_integral[1:],
@@ -27,35 +118,215 @@ def complex_quadrature(func, a, b, **kwargs):
 # This function was taken from:
 # https://stackoverflow.com/questions/5965583/use-scipy-integrate-quad-to-integrate-complex-numbers
 
+_gauss_legendre_rules = {}
+
+def gauss_legendre(order):
+    # nodes and weights of the Gauss-Legendre rule on [-1, 1], computed once per order
+    if order not in _gauss_legendre_rules:
+        _gauss_legendre_rules[order] = numpy.polynomial.legendre.leggauss(order)
+    return _gauss_legendre_rules[order]
+
+
+def batch_nodes(a, b, order, panels):
+    # nodes and weights of a composite Gauss-Legendre rule (panels equal panels) for each integral,
+    # a and b have shape (N,); both results have shape (panels*order, N)
+    x, w = gauss_legendre(order)
+    edges = a + (b - a) * numpy.linspace(0, 1, panels+1)[:,None]
+    hl = 0.5 * (edges[1:] - edges[:-1])
+    mid = 0.5 * (edges[1:] + edges[:-1])
+    nodes = mid[:,None,:] + hl[:,None,:] * x[None,:,None]
+    weights = hl[:,None,:] * w[None,:,None]
+    return nodes.reshape(panels*order, -1), weights.reshape(panels*order, -1)
+
+
+def batch_integrate(func, a, b, params_array, order=40, **kwargs):
+    # Fixed-order Gauss-Legendre quadrature of many (complex) integrals at once:
+    # func(x, params) has to be vectorized, it is called with x of shape (nodes, N) and
+    # params = params_array[chunk] (first axis of length N, one entry per integral)
+    # and returns the integrand of shape (nodes, N).
+    # a and b are scalars or arrays of length len(params_array).
+    # Keywords: panels  - number of equal subintervals with order nodes each (default 1)
+    #           chunk   - number of integrals evaluated together (memory), default all
+    # Returns (values, errors); the error is estimated from the rule with order//2 nodes.
+    panels = kwargs.get("panels", 1)
+    params = numpy.asarray(params_array)
+    N = len(params)
+    chunk = kwargs.get("chunk", None) or N
+    a = numpy.broadcast_to(numpy.asarray(a, dtype=float), (N,))
+    b = numpy.broadcast_to(numpy.asarray(b, dtype=float), (N,))
+    values = numpy.zeros(N, dtype=complex)
+    errors = numpy.zeros(N)
+    for lo in range(0, N, chunk):
+        sl = slice(lo, min(lo + chunk, N))
+        I = []
+        for n in (order, max(order // 2, 1)):
+            nodes, weights = batch_nodes(a[sl], b[sl], n, panels)
+            I.append(numpy.sum(weights * func(nodes, params[sl]), axis=0))
+        values[sl] = I[0]
+        errors[sl] = numpy.abs(I[0] - I[1])
+    return values, errors
+
+
+def filon_moments(c, n):
+    # M_k(c) = int_-1^1 dx x**k exp(c x) for k < n and an array of complex c          (c, k)
+    # upward recursion M_k = (exp(c) - (-1)**k exp(-c) - k M_(k-1)) / c where it is stable (|c| > n),
+    # Gauss-Legendre quadrature of the then smooth integrand otherwise
+    c = numpy.asarray(c, dtype=complex).ravel()
+    M = numpy.empty((len(c), n), dtype=complex)
+    big = numpy.abs(c) > n
+    if numpy.any(big):
+        cb = c[big]
+        ep, em = numpy.exp(cb), numpy.exp(-cb)
+        Mk = (ep - em) / cb
+        M[big,0] = Mk
+        for k in range(1, n):
+            Mk = (ep - (-1)**k * em - k * Mk) / cb
+            M[big,k] = Mk
+    if not numpy.all(big):
+        x, w = gauss_legendre(n + 40)
+        M[~big] = numpy.dot(w * numpy.exp(c[~big,None] * x), x[:,None] ** numpy.arange(n))
+    return M
+
+
+def filon_integrals(envelopes, z, a, b, order=10, panels=16):
+    # Filon quadrature of G(z) = int_a^b dt F(t) exp(z t) for an array of complex z with
+    #   F(t) = sum_j g_j(t) exp(i omega_j t),   envelopes = [(g_j, omega_j), ...]
+    # The smooth envelopes g_j (vectorized functions of t) are interpolated by polynomials at order
+    # Chebyshev points on each of panels equal subintervals, the oscillating factor
+    # exp((z + i omega_j) t) is integrated exactly. The number of envelope evaluations
+    # (panels * order) does not depend on z or omega_j.
+    z = numpy.asarray(z, dtype=complex)
+    x = numpy.cos(numpy.pi * (numpy.arange(order) + 0.5) / order)
+    Vinv = numpy.linalg.inv(x[:,None] ** numpy.arange(order))
+    hl = 0.5 * (b - a) / panels
+    mid = a + hl * (2 * numpy.arange(panels) + 1)
+    t = mid[:,None] + hl * x[None,:]                                        # (panel, node)
+    G = numpy.zeros(z.size, dtype=complex)
+    for g, omega in envelopes:
+        coef = numpy.dot(g(t) * numpy.ones(t.shape), Vinv.T)                # (panel, k)
+        w = z.ravel() + 1j * omega
+        M = filon_moments(w * hl, order)                                    # (z, k)
+        G += hl * numpy.sum(numpy.dot(numpy.exp(numpy.outer(w, mid)), coef) * M, axis=1)
+    return G.reshape(z.shape)
+
+
+def trapezoid_levels(func, a, b, **kwargs):
+    # generator of the trapezoidal sums T_k with 2**k intervals on [a, b] (k = 0, 1, ...),
+    # each level only evaluates func on its 2**(k-1) new nodes and reuses T_(k-1)
+    # vec_func: func takes an array of nodes and returns values of shape (nodes,) + shape of the integrand,
+    #           evaluated in blocks of at most block nodes
+    vec_func = kwargs.get("vec_func", False)
+    args = kwargs.get("args", ())
+    block = kwargs.get("block", 1024)
+
+    def fsum(x):
+        if not vec_func:
+            return sum(numpy.asarray(func(xi, *args), dtype=complex) for xi in x)
+        return sum(numpy.sum(numpy.asarray(func(x[i:i+block], *args), dtype=complex), axis=0)
+                   for i in range(0, len(x), block))
+
+    h = b - a
+    T = 0.5 * h * fsum(numpy.array([a, b]))
+    yield T
+    n = 1
+    while True:
+        h = 0.5 * h
+        T = 0.5 * T + h * fsum(a + h * (2 * numpy.arange(n) + 1))
+        n = 2 * n
+        yield T
+
+
 def complex_romberg(func, a, b, **kwargs):
-    def real_func(x):
-        return numpy.real(func(x))
-    def imag_func(x):
-        return numpy.imag(func(x))
-    real_integral = integrate.romberg(real_func, a, b, **kwargs)
-    imag_integral = integrate.romberg(imag_func, a, b, **kwargs)
-    return real_integral + 1j*imag_integral
+    # Romberg integration (Richardson extrapolation of the trapezoidal rule) of a complex function,
+    # replaces the two real scipy.integrate.romberg calls (romberg was removed from scipy).
+    # Keywords as in scipy.integrate.romberg: tol, rtol, divmax, vec_func, args (show is ignored);
+    # with vec_func=True the integrand may also be array valued (one tableau for all entries,
+    # the convergence is checked on the largest deviation, relative to the largest entry of the
+    # whole block), block limits the nodes per call. Hitting divmax gives an IntegrationWarning.
+    tol = kwargs.get("tol", 1.48e-8)
+    rtol = kwargs.get("rtol", 1.48e-8)
+    divmax = kwargs.get("divmax", 10)
+    if (a == b):
+        return 0j
+    levels = trapezoid_levels(func, a, b, **kwargs)
+    row = [next(levels)]
+    err = numpy.inf
+    for i in range(1, divmax+1):
+        prev = row
+        row = [next(levels)]
+        for m in range(1, i+1):
+            row.append(row[m-1] + (row[m-1] - prev[m-1]) / (4.**m - 1))
+        err = numpy.max(numpy.abs(row[i] - prev[i-1]))
+        if (err < tol or err < rtol * numpy.max(numpy.abs(row[i]))):
+            break
+    else:
+        warnings.warn('divmax (' + str(divmax) + ') exceeded. Latest difference = ' + str(err),
+                      integrate.IntegrationWarning, stacklevel=2)
+    return row[-1]
+
+
+class CumulativeRomberg:
+    # int_a^b func(t) dt for an upper limit b that grows step by step (e.g. with t_au):
+    # the integral up to the last b is kept, only the new interval is integrated by complex_romberg
+    #   I = CumulativeRomberg(func, a, **kwargs);  I(b1), I(b2), ...   (b2 >= b1)
+    # a smaller b than before starts again from a.
+    # rtol refers to the accumulated integral (largest entry), so that a small new piece
+    # is not resolved relative to itself only.
+    def __init__(self, func, a, **kwargs):
+        self.func = func
+        self.a = a
+        self.kwargs = kwargs
+        self.b_last = a
+        self.I_last = 0j
+
+    def __call__(self, b):
+        if (b < self.b_last):
+            self.b_last, self.I_last = self.a, 0j
+        if (b > self.b_last):
+            kwargs = dict(self.kwargs)
+            kwargs["tol"] = max(self.kwargs.get("tol", 1.48e-8),
+                                self.kwargs.get("rtol", 1.48e-8) * numpy.max(numpy.abs(self.I_last)))
+            self.I_last = self.I_last + complex_romberg(self.func, self.b_last, b, **kwargs)
+            self.b_last = b
+        return self.I_last
+
 
 def complex_double_quadrature(outer, inner, a, b, gfun, hfun, **kwargs):
-    first_real = lambda y,x: numpy.real(outer(x)) * numpy.real(inner(y))
-    sec_real   = lambda y,x: - numpy.imag(outer(x)) * numpy.imag(inner(y))
-    first_imag = lambda y,x: numpy.imag(outer(x)) * numpy.real(inner(y))
-    sec_imag   = lambda y,x: numpy.real(outer(x)) * numpy.imag(inner(y))
-
-    def temp_ranges(*args):
-        return [gfun(args[0]) if callable(gfun) else gfun,
-                hfun(args[0]) if callable(hfun) else hfun]
-
-    first_real_integral = integrate.nquad(first_real, [temp_ranges, [a,b]])
-    sec_real_integral   = integrate.nquad(sec_real, [temp_ranges, [a,b]])
-    first_imag_integral = integrate.nquad(first_imag, [temp_ranges, [a,b]])
-    sec_imag_integral   = integrate.nquad(sec_imag, [temp_ranges, [a,b]])
-
-#    print first_real_integral
-#    print sec_real_integral
-#    print first_imag_integral
-#    print sec_real_integral
-
-    return (first_real_integral[0] + sec_real_integral[0]
-            + 1j*first_imag_integral[0] + 1j*sec_imag_integral[0],
-            first_real_integral[1:])
+    # int_a^b dx outer(x) int_gfun(x)^hfun(x) dy inner(y)   (gfun, hfun: numbers or functions of x,
+    # e.g. gfun = a, hfun = lambda x: x for the time ordered t2 < t1)
+    # Composite Gauss-Legendre rules in x and, for every x node, on [gfun(x), hfun(x)] in y;
+    # outer and inner are evaluated once per node (one call per node, or one call on the array of
+    # all nodes with vectorized=True) and the complex product is summed directly.
+    # The number of panels in both directions is doubled (up to maxpanels) until the difference
+    # to the rule with half the order is below max(epsabs, epsrel |I|).
+    # Keywords: order (20), panels (1), maxpanels (64), epsabs, epsrel, vectorized (False)
+    # Returns (I, (err,)).
+    order = kwargs.get("order", 20)
+    panels = kwargs.get("panels", 1)
+    maxpanels = kwargs.get("maxpanels", 64)
+    epsabs = kwargs.get("epsabs", 1.49e-8)
+    epsrel = kwargs.get("epsrel", 1.49e-8)
+    if not kwargs.get("vectorized", False):
+        outer = numpy.vectorize(outer, otypes=[complex])
+        inner = numpy.vectorize(inner, otypes=[complex])
+    limit = lambda fun, x: numpy.broadcast_to(numpy.asarray(fun(x) if callable(fun) else fun,
+                                                            dtype=float), x.shape)
+
+    def rule(n, p):
+        x, wx = batch_nodes(numpy.array([float(a)]), numpy.array([float(b)]), n, p)
+        x, wx = x[:,0], wx[:,0]
+        y, wy = batch_nodes(limit(gfun, x), limit(hfun, x), n, p)          # (y node, x node)
+        inner_int = numpy.sum(wy * inner(y), axis=0)
+        return numpy.sum(wx * outer(x) * inner_int)
+
+    while True:
+        I = rule(order, panels)
+        err = abs(I - rule(max(order // 2, 1), panels))
+        if (err <= max(epsabs, epsrel * abs(I))):
+            break
+        if (2 * panels > maxpanels):
+            warnings.warn('The requested accuracy was not reached with ' + str(panels) + ' panels.',
+                          integrate.IntegrationWarning, stacklevel=2)
+            break
+        panels = 2 * panels
+    return (complex(I), (float(err),))
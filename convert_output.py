@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+# This script converts the binary output of nuclear_dyn.py (--output-format npz, hdf5 or npy-mmap)
+# into the legacy text files full.dat, movie.dat and wp_res.dat, e.g. for cinema.py or res_wavepacket.py.
+
+import argparse
+import os
+
+import in_out
+
+
+# set up argument parser
+parser = argparse.ArgumentParser(
+        description='''This script writes the text files full.dat, movie.dat and wp_res.dat
+        from the binary output of nuclear_dyn.py.''',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('infile', nargs='?', default='full.npz',
+                    help='''Binary output: full.npz, full.h5 or, for npy-mmap, the prefix full
+                    (or any of the full_*.npy files).''')
+parser.add_argument('-o', '--outdir', default='.', help='Directory for the text files.')
+parser.add_argument('--no-full', action='store_true', help='Do not write full.dat.')
+parser.add_argument('--no-movie', action='store_true', help='Do not write movie.dat.')
+parser.add_argument('--no-wp', action='store_true', help='Do not write wp_res.dat.')
+args = parser.parse_args()
+
+data = in_out.read_binary_output(args.infile)
+print('Time steps in', args.infile, ':', len(data['t_au']))
+
+spectrum = data['squares'].ndim == 3 and data['squares'].shape[1] > 0     # not written in wavepacket-only runs
+files = {}
+for key, name, skip in (('full', 'full.dat', args.no_full or not spectrum),
+                        ('movie', 'movie.dat', args.no_movie or not spectrum),
+                        ('wp_res', 'wp_res.dat', args.no_wp)):
+    files[key] = None if skip else open(os.path.join(args.outdir, name), mode='w')
+
+in_out.binary_to_text(data, **files)
+
+for f in files.values():
+    if f:
+        print('written:', f.name)
+        f.close()
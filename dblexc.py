@@ -176,7 +176,7 @@ res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * VEr_au**2 + 1j*(Er_au))) \
                            * IR_during(t2)
 
 if (integ == 'romberg'):
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
+    res_inner = lambda t1: ci.complex_romberg(res_inner_fun, t1, t_au)
 elif (integ == 'quadrature'):
     res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
 elif (integ == 'analytic'):
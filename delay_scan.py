@@ -0,0 +1,91 @@
+##########################################################################
+#              DELAY SCAN FROM THE FOURIER COEFFICIENTS                  #
+##########################################################################
+# Purpose:                                                               #
+#          - Spectra after both pulses for all delays of a scan at once  #
+#            (loop_delta.py --fourier) instead of integrating every      #
+#            delay anew.                                                 #
+#                                                                        #
+##########################################################################
+# With the IR phase after the pulse as a Fourier series in tau,          #
+#   f(tau) = 1/N sum_k c_k exp(i nu_k tau),  nu_k = 2 pi sort_freq[k],   #
+# the delay delta_t only enters res_I through exp(-i nu_k delta_t):      #
+#   res_I = C(delta_t) exp(-i t (E_kin + E_fin)) / N sum_k c_k           #
+#           exp(-i nu_k delta_t) b_k,                                    #
+#   b_k = (exp(i t (nu_k - gamma)) G(z_r) - G(z_k)) / (i (nu_k - gamma)) #
+# with G(z) = int dt1 FX(t1) exp(z t1) over the XUV pulse,               #
+# z_k = i (E_kin + E_fin + nu_k), z_r = pi VEr**2 + i Er and |C| = 1.    #
+# The sums over k for the equidistant delays are one chirp z-transform.  #
+# The direct term is integrated with the exact phase f(t1 - delta_t)     #
+# (the Fourier series is periodic in tau, the phase of the gauss IR      #
+# pulse is not) on one table of the phase for all delays and E_kin.      #
+##########################################################################
+
+import warnings
+
+import numpy as np
+import scipy.integrate as integrate
+from scipy.signal import czt
+
+import complex_integration as ci
+
+
+def delay_sums(b, sort_freq, T_coeff, delta_ts):
+    # sum_k b[k,...] exp(-2 pi i sort_freq[k] delta_ts[m]) for the equidistant delta_ts       (m, ...)
+    # sort_freq: the fftshift-ed frequencies sort_freq[0] + k / T_coeff of the Fourier series
+    delta_ts = np.asarray(delta_ts, dtype=float)
+    d_delta = delta_ts[1] - delta_ts[0] if (len(delta_ts) > 1) else 0.
+    S = czt(b, m=len(delta_ts), w=np.exp(-2j*np.pi * d_delta / T_coeff),
+            a=np.exp(2j*np.pi * delta_ts[0] / T_coeff), axis=0)
+    phase = np.exp(-2j*np.pi * sort_freq[0] * delta_ts)
+    return phase.reshape(phase.shape + (1,) * (S.ndim - 1)) * S
+
+
+def resonant_sums(coeffs, sort_freq, T_coeff, G, G_res, gammas, t_au, delta_ts):
+    # res_I / (C(delta_t) exp(-i t (E_kin + E_fin))) of all delays delta_ts and all E_kin       (delay, E_kin)
+    #   coeffs: Fourier coefficients c_k of the IR phase                                        (k, E_kin)
+    #   G:      G(z_k) of all frequencies and E_kin (k, E_kin),  G_res = G(z_r)
+    #   gammas: Er - E_kin - E_fin - i pi VEr**2                                                (E_kin)
+    nu = 2*np.pi * np.asarray(sort_freq)[:,None]
+    b_res = (np.exp(1j * t_au * (nu - gammas)) * G_res - G) / (1j * (nu - gammas))
+    return delay_sums(coeffs / len(sort_freq) * b_res, sort_freq, T_coeff, delta_ts)
+
+
+def direct_integrals(FX_t1, t_low, t_up, E_dir, alphas, phase, delta_ts, **kwargs):
+    # I1[m,E] = int_(t_low)^(t_up) dt1 FX(t1) exp(i E_dir[E] t1) exp(i alphas[E] phase(t1 - delta_ts[m]))
+    # with composite Gauss-Legendre rules, phase(t1 - delta_t) is tabulated once for all E.         (delay, E)
+    # The number of panels is doubled (up to maxpanels) until the difference to the rule with half
+    # the order is below max(epsabs, epsrel max|I1|), otherwise an IntegrationWarning is given.
+    # Keywords: order (40), panels (16), maxpanels (256), epsabs (0), epsrel (1.49e-8)
+    # Returns (I1, err).
+    order = kwargs.get("order", 40)
+    panels = kwargs.get("panels", 16)
+    maxpanels = kwargs.get("maxpanels", 256)
+    epsabs = kwargs.get("epsabs", 0.)
+    epsrel = kwargs.get("epsrel", 1.49e-8)
+    E_dir = np.asarray(E_dir, dtype=float)
+    alphas = np.asarray(alphas, dtype=float)
+    delta_ts = np.asarray(delta_ts, dtype=float)
+
+    def rule(n, p):
+        t1, w = ci.batch_nodes(np.array([float(t_low)]), np.array([float(t_up)]), n, p)
+        t1, w = t1[:,0], w[:,0]
+        phase_tab = phase(t1[:,None] - delta_ts[None,:])                       # (t1, delay)
+        g = (w * FX_t1(t1))[:,None] * np.exp(1j * np.outer(t1, E_dir))         # (t1, E)
+        I1 = np.empty((len(delta_ts), len(E_dir)), dtype=complex)
+        for E_ind in range (0,len(E_dir)):
+            I1[:,E_ind] = np.dot(g[:,E_ind], np.exp(1j * alphas[E_ind] * phase_tab))
+        return I1
+
+    while True:
+        I1 = rule(order, panels)
+        err = np.max(np.abs(I1 - rule(max(order // 2, 1), panels)))
+        if (err <= max(epsabs, epsrel * np.max(np.abs(I1)))):
+            break
+        if (2 * panels > maxpanels):
+            warnings.warn('Direct term of the delay scan not converged with ' + str(panels)
+                          + ' panels (error estimate ' + str(err) + '), increase order or maxpanels.',
+                          integrate.IntegrationWarning, stacklevel=2)
+            break
+        panels = 2 * panels
+    return I1, err
@@ -0,0 +1,69 @@
+##########################################################################
+#                  FRANCK-CONDON OVERLAP CACHE                           #
+##########################################################################
+# Purpose:                                                               #
+#          - Persistent on-disk store (sqlite) of Franck-Condon overlap  #
+#            integrals, so that runs with identical potentials but       #
+#            e.g. other pulse parameters do not redo the quadratures.    #
+#                                                                        #
+##########################################################################
+# Every overlap is stored under a hash of the name of the FC function,   #
+# all its arguments (quantum numbers, potential parameters, red_mass,    #
+# R_start, R_min, R_max), the working precision of mpmath and a tag      #
+# describing V_of_R. Overlaps that are not yet in the store are          #
+# computed and added immediately, so an interrupted run keeps them.      #
+##########################################################################
+
+import hashlib
+import os
+import sqlite3
+
+import mpmath
+
+
+def file_tag(path):
+    # tag for a V_of_R that is read from a file (-g/--gamma): hash of its content
+    with open(path, 'rb') as f:
+        return 'file:' + hashlib.sha256(f.read()).hexdigest()
+
+
+class FCCache:
+    # Use as   FC = cache(wf.mp_FCmor_mor, n1, alpha1, ..., V_of_R=V_of_R, V_tag='R6')
+    # V_tag has to identify V_of_R uniquely; the default 'const' belongs to V_of_R = 1.
+    # With path=None nothing is stored and the FC functions are simply called.
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path:
+            dirname = os.path.dirname(os.path.abspath(path))
+            os.makedirs(dirname, exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=60)     # several runs may share one store
+            self.db.execute('CREATE TABLE IF NOT EXISTS fc (key TEXT PRIMARY KEY, re REAL, im REAL)')
+            self.db.commit()
+
+    @staticmethod
+    def key(func, args, V_tag):
+        desc = repr((func.__name__, tuple(float(arg) for arg in args), V_tag, mpmath.mp.dps))
+        return hashlib.sha256(desc.encode()).hexdigest()
+
+    def __call__(self, func, *args, V_tag='const', **kwargs):
+        if self.db is None:
+            return func(*args, **kwargs)
+        key = self.key(func, args, V_tag + repr(sorted((k, v) for k, v in kwargs.items() if k != 'V_of_R')))
+        row = self.db.execute('SELECT re, im FROM fc WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            return float(row[0]) if row[1] is None else complex(row[0], row[1])
+        self.misses += 1
+        FC = func(*args, **kwargs)
+        self.db.execute('INSERT OR REPLACE INTO fc VALUES (?, ?, ?)',
+                        (key, FC.real, FC.imag if isinstance(FC, complex) else None))
+        self.db.commit()
+        return FC
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
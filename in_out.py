@@ -67,7 +67,7 @@ def read_input(inputfile, outfile):
     Ep_max_eV     =  11.0
     #
     integ         = "analytic"    # options: analytic, (quadrature, romberg - both currently unavailable)  
-    integ_outer   = "romberg"     # options: quadrature, romberg
+    integ_outer   = "romberg"     # options: quadrature, romberg, filon, gauss-legendre, analytic (only Gaussian convoluted pulse)
     Gamma_type    = "const"       # options: const, R6, exp
     #
     fc_precalc    = "False"       #
@@ -99,6 +99,10 @@ def read_input(inputfile, outfile):
     fin_pot_type  = 'morse'       # options: morse, hyperbel, hypfree
 #-------------------------------------------------------------------------
 
+    # the default process, if the input file has no prc line
+    X_ICD  = (prc == "ICD")
+    X_RICD = (prc == "RICD")
+
     f = open(inputfile, 'r')
     
     lines = f.readlines()
@@ -310,6 +314,18 @@ def read_input(inputfile, outfile):
                 integ_outer = 'quadrature'
                 print('Integration Scheme of the outer integral = Gaussian Quadrature')
                 outfile.write('Integration Scheme of the outer integral = Gaussian Quadrature \n')
+            elif (words[2] == 'analytic'):
+                integ_outer = 'analytic'
+                print('Integration Scheme of the outer integral = analytic (Gaussian pulse)')
+                outfile.write('Integration Scheme of the outer integral = analytic (Gaussian pulse) \n')
+            elif (words[2] == 'filon'):
+                integ_outer = 'filon'
+                print('Integration Scheme of the outer integral = Filon (oscillatory quadrature)')
+                outfile.write('Integration Scheme of the outer integral = Filon (oscillatory quadrature) \n')
+            elif (words[2] == 'gauss-legendre'):
+                integ_outer = 'gauss-legendre'
+                print('Integration Scheme of the outer integral = composite Gauss-Legendre (fixed order)')
+                outfile.write('Integration Scheme of the outer integral = composite Gauss-Legendre (fixed order) \n')
             else:
                 print('no integration scheme selected')
                 outfile.write('no integration scheme selected \n')
@@ -695,6 +711,49 @@ def read_input_old(inputfile, outfile):
             V_fin_ICD_a, V_fin_ICD_b
             )
 
+#-------------------------------------------------------------------------
+#   trajectory ensemble of the classical-nuclei scripts (measure_nucl, measure_nucl_TK)
+def read_ensemble_input(inputfile, outfile):
+#-------------------------------------------------------------------------
+    # ground state Morse potential (atomic units, as in read_input) for the Wigner sampling
+    gs_de         = 0
+    gs_a          = 0
+    gs_Req        = 0
+    n_traj        = 1             # 1: single trajectory starting at rest at R_eq_AA
+    ens_workers   = 1             # processes the trajectories are shared among
+    ens_seed      = 0             # random seed of the Wigner sampling
+
+    f = open(inputfile, 'r')
+    for line in f.readlines():
+        words = line.split()
+        if (len(words) < 3):
+            continue
+        if (words[0] == 'gs_de'):
+            gs_de = float(words[2])
+            outfile.write('gs_de = ' + str(gs_de) + '\n')
+        elif (words[0] == 'gs_a'):
+            gs_a = float(words[2])
+            outfile.write('gs_a = ' + str(gs_a) + '\n')
+        elif (words[0] == 'gs_Req'):
+            gs_Req = float(words[2])
+            outfile.write('gs_Req = ' + str(gs_Req) + '\n')
+        elif (words[0] == 'n_traj'):
+            n_traj = int(words[2])
+            print('n_traj = ', n_traj)
+            outfile.write('n_traj = ' + str(n_traj) + '\n')
+        elif (words[0] == 'ens_workers'):
+            ens_workers = int(words[2])
+            outfile.write('ens_workers = ' + str(ens_workers) + '\n')
+        elif (words[0] == 'ens_seed'):
+            ens_seed = int(words[2])
+            outfile.write('ens_seed = ' + str(ens_seed) + '\n')
+    f.close()
+
+    if (n_traj > 1 and (gs_de <= 0 or gs_a <= 0 or gs_Req <= 0)):
+        sys.exit('!!! n_traj > 1 needs the ground state Morse parameters gs_de, gs_a, gs_Req. Programme terminated.')
+
+    return (gs_de, gs_a, gs_Req, n_traj, ens_workers, ens_seed)
+
 #-------------------------------------------------------------------------
 def check_input(Er, E_fin, Gamma,
                 Omega, TX, n_X, A0X,
@@ -843,3 +902,218 @@ def doout_movie(filename, outlines):
     res_lines = '\n'.join(outlines)
     res_lines = res_lines + '\n' + '' + '\n' + '' + '\n'
     filename.write(res_lines)
+
+def prep_output_wp(nlambda, wp, t_au, Ep):
+    # line of wp_res.dat: lambda, E_p_eV, t_s, complex projection of the wavepacket in the resonance state
+    string = format(nlambda, 'd') + '   ' + format(sciconv.hartree_to_ev(Ep), '>8.5f') + '   ' + '   ' + format(sciconv.atu_to_second(t_au), ' .18f') \
+             + '   ' + format(complex(wp), ' .15e')
+    return string
+
+def prep_movie_header(t_au):
+    return '"' + format(sciconv.atu_to_second(t_au)*1E15, '.3f') + ' fs' + '"'
+
+
+#-------------------------------------------------------------------------
+#   streaming text output (full.dat, movie.dat, wp_res.dat)
+
+class SpectrumWriter:
+    # lines of full.dat and movie.dat, written as one block and flushed at the end of every time step,
+    # so that the files hold all completed time steps and nothing piles up in memory
+    #   grid mode (Ekins_au given): write(t_au, squares) with squares (E_kin, E_p), lines as prep_output;
+    #                               the E_kin, E_p columns are formatted once here
+    #   row mode:                   add(square, E_kin_au) for each point, then squares = write(t_au);
+    #                               lines E_kin_eV, t_s, |J|**2; the rows are kept in a preallocated
+    #                               array (n_rows, doubled if necessary), write returns the |J|**2 of the step;
+    #                               write(t_au, ensemble=N): the rows are N equal blocks (one per trajectory
+    #                               of an ensemble), which are averaged
+    # movie = None: no movie.dat
+    def __init__(self, full, movie=None, Ekins_au=None, Eps_au=None, n_rows=1024):
+        self.full = full
+        self.movie = movie
+        self.prefixes = None
+        if Ekins_au is not None:
+            Ekins_eV = sciconv.hartree_to_ev(np.asarray(Ekins_au, dtype=float))
+            Eps_eV = sciconv.hartree_to_ev(np.asarray(Eps_au, dtype=float))
+            self.prefixes = [format(Ekin, '>8.5f') + '   ' + format(Ep, '>8.5f') + '   '
+                             for Ekin in Ekins_eV for Ep in Eps_eV]
+        self.n = 0
+        self.Ekins_au = np.empty(max(n_rows, 1))
+        self.squares = np.empty(max(n_rows, 1))
+
+    def add(self, square, E_kin_au):
+        if (self.n == len(self.squares)):
+            self.Ekins_au = np.concatenate((self.Ekins_au, np.empty_like(self.Ekins_au)))
+            self.squares = np.concatenate((self.squares, np.empty_like(self.squares)))
+        self.Ekins_au[self.n] = E_kin_au
+        self.squares[self.n] = square
+        self.n += 1
+
+    def rows(self):
+        return self.Ekins_au[:self.n].copy(), self.squares[:self.n].copy()
+
+    def extend(self, Ekins_au, squares):
+        for E_kin_au, square in zip(Ekins_au, squares):
+            self.add(square, E_kin_au)
+
+    def write(self, t_au, squares=None, ensemble=1):
+        t_str = format(sciconv.atu_to_second(t_au), ' .18f') + '   '
+        if squares is None:
+            n_E = self.n // ensemble
+            squares = self.squares[:n_E*ensemble].reshape(ensemble, n_E).mean(axis=0)
+            prefixes = [format(Ekin, '>8.5f') + '   '
+                        for Ekin in sciconv.hartree_to_ev(self.Ekins_au[:n_E])]
+            self.n = 0
+        else:
+            squares = np.asarray(squares, dtype=float).ravel()
+            prefixes = self.prefixes
+        res_lines = '\n'.join([prefix + t_str + format(I, '.15e') for prefix, I in zip(prefixes, squares)])
+        self.full.write(res_lines + '\n' + '' + '\n')
+        self.full.flush()
+        if self.movie:
+            self.movie.write(prep_movie_header(t_au) + '\n' + res_lines + '\n' + '' + '\n' + '' + '\n')
+            self.movie.flush()
+        return squares
+
+
+class TextOutput:
+    # the legacy text files with the interface of BinaryOutput: write(t_au, squares, wp) for each time step
+    # full, movie, wp_res: open files; spectrum=False: only wp_res.dat is written (wavepacket-only runs)
+    def __init__(self, full, movie, wp_res, Ekins_au, Eps_au, n_lambda, spectrum=True):
+        self.spectrum = spectrum
+        self.spec = SpectrumWriter(full, movie, Ekins_au, Eps_au) if spectrum else None
+        self.wp_res = wp_res
+        Eps_eV = sciconv.hartree_to_ev(np.asarray(Eps_au, dtype=float))
+        self.wp_prefixes = [format(nlambda, 'd') + '   ' + format(Ep, '>8.5f') + '   ' + '   '
+                            for nlambda in range(n_lambda) for Ep in Eps_eV]
+
+    def write(self, t_au, squares, wp):
+        if self.spectrum:
+            self.spec.write(t_au, squares)
+        t_str = format(sciconv.atu_to_second(t_au), ' .18f') + '   '
+        wp_lines = '\n'.join([prefix + t_str + format(complex(value), ' .15e')
+                              for prefix, value in zip(self.wp_prefixes, np.ravel(wp))])
+        self.wp_res.write(wp_lines + '\n' + '' + '\n')
+        self.wp_res.flush()
+
+    def close(self):
+        pass
+
+
+#-------------------------------------------------------------------------
+#   binary output (--output-format npz, hdf5, npy-mmap)
+
+class BinaryOutput:
+    # |J|**2 on the (t, E_kin, E_p) grid and the wavepacket projections (t, lambda, E_p) as typed arrays,
+    # together with t_au, Ekins_au and Eps_au (atomic units, so that the text files can be restored exactly)
+    #   fmt = 'npz':      kept in memory, <prefix>.npz is written by close()
+    #         'hdf5':     datasets in <prefix>.h5, extended and flushed at every time step (needs h5py)
+    #         'npy-mmap': <prefix>_squares.npy, <prefix>_wp_res.npy, <prefix>_t_au.npy memory-mapped and
+    #                     preallocated for n_t time steps (unwritten t are NaN), grid in <prefix>_grid.npz
+    # spectrum=False: only the wavepacket projections are stored (wavepacket-only runs)
+    def __init__(self, fmt, Ekins_au, Eps_au, n_lambda, n_t, prefix='full', spectrum=True):
+        self.fmt = fmt
+        self.prefix = prefix
+        self.spectrum = spectrum
+        self.n = 0
+        self.Ekins_au = np.asarray(Ekins_au, dtype=float)
+        self.Eps_au = np.asarray(Eps_au, dtype=float)
+        sq_shape = (len(self.Ekins_au), len(self.Eps_au)) if spectrum else (0, 0)
+        wp_shape = (n_lambda, len(self.Eps_au))
+        if (fmt == 'npz'):
+            self.t, self.squares, self.wp = [], [], []
+        elif (fmt == 'hdf5'):
+            try:
+                import h5py
+            except ImportError:
+                sys.exit('!!! --output-format hdf5 needs the h5py package. Programme terminated.')
+            self.h5 = h5py.File(prefix + '.h5', 'w')
+            self.h5.create_dataset('Ekins_au', data=self.Ekins_au)
+            self.h5.create_dataset('Eps_au', data=self.Eps_au)
+            self.t = self.h5.create_dataset('t_au', (0,), maxshape=(None,), dtype='f8')
+            self.squares = self.h5.create_dataset('squares', (0,) + sq_shape, maxshape=(None,) + sq_shape,
+                                                  dtype='f8', chunks=(1,) + tuple(max(k, 1) for k in sq_shape))
+            self.wp = self.h5.create_dataset('wp', (0,) + wp_shape, maxshape=(None,) + wp_shape,
+                                             dtype='c16', chunks=(1,) + wp_shape)
+        elif (fmt == 'npy-mmap'):
+            open_memmap = np.lib.format.open_memmap
+            np.savez(prefix + '_grid.npz', Ekins_au=self.Ekins_au, Eps_au=self.Eps_au)
+            self.t = open_memmap(prefix + '_t_au.npy', mode='w+', dtype='f8', shape=(n_t,))
+            self.t[:] = np.nan
+            self.squares = open_memmap(prefix + '_squares.npy', mode='w+', dtype='f8', shape=(n_t,) + sq_shape)
+            self.wp = open_memmap(prefix + '_wp_res.npy', mode='w+', dtype='c16', shape=(n_t,) + wp_shape)
+        else:
+            raise ValueError('Unknown output format: ' + str(fmt))
+
+    def write(self, t_au, squares, wp):
+        # results of one time step: squares (E_kin, E_p) (None if spectrum=False), wp (lambda, E_p)
+        if not self.spectrum:
+            squares = np.zeros((0, 0))
+        if (self.fmt == 'npz'):
+            self.t.append(t_au)
+            self.squares.append(np.array(squares, dtype=float))
+            self.wp.append(np.array(wp, dtype=complex))
+        elif (self.fmt == 'hdf5'):
+            for dset, value in ((self.t, t_au), (self.squares, squares), (self.wp, wp)):
+                dset.resize(self.n + 1, axis=0)
+                dset[self.n] = value
+            self.h5.flush()
+        else:
+            self.t[self.n] = t_au
+            self.squares[self.n] = squares
+            self.wp[self.n] = wp
+            for arr in (self.t, self.squares, self.wp):
+                arr.flush()
+        self.n += 1
+
+    def close(self):
+        if (self.fmt == 'npz'):
+            np.savez(self.prefix + '.npz', Ekins_au=self.Ekins_au, Eps_au=self.Eps_au,
+                     t_au=np.array(self.t, dtype=float), squares=np.array(self.squares, dtype=float),
+                     wp=np.array(self.wp, dtype=complex))
+        elif (self.fmt == 'hdf5'):
+            self.h5.close()
+        else:
+            for arr in (self.t, self.squares, self.wp):
+                arr.flush()
+
+
+def read_binary_output(path):
+    # arrays written by BinaryOutput: dict with Ekins_au, Eps_au, t_au, squares (t, E_kin, E_p), wp (t, lambda, E_p)
+    # path: <prefix>.npz, <prefix>.h5 or (for npy-mmap) <prefix> or any of its .npy/.npz files
+    if path.endswith('.npz') and not path.endswith('_grid.npz'):
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    if path.endswith('.h5'):
+        import h5py
+        with h5py.File(path, 'r') as h5:
+            return {key: h5[key][()] for key in h5.keys()}
+    for suffix in ('_grid.npz', '_t_au.npy', '_squares.npy', '_wp_res.npy'):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+    with np.load(path + '_grid.npz') as grid:
+        data = {key: grid[key] for key in grid.files}
+    t = np.load(path + '_t_au.npy', mmap_mode='r')
+    n_t = int(np.sum(~np.isnan(t)))                     # time steps actually written
+    data['t_au'] = np.array(t[:n_t])
+    data['squares'] = np.load(path + '_squares.npy', mmap_mode='r')[:n_t]
+    data['wp'] = np.load(path + '_wp_res.npy', mmap_mode='r')[:n_t]
+    return data
+
+
+def binary_to_text(data, full=None, movie=None, wp_res=None):
+    # legacy text output (full.dat, movie.dat, wp_res.dat, as open files; None: skipped) from read_binary_output
+    Ekins_au, Eps_au = data['Ekins_au'], data['Eps_au']
+    for n, t_au in enumerate(data['t_au']):
+        squares = data['squares'][n]
+        if (squares.size and (full or movie)):
+            outlines = [prep_output(squares[i,j], Ekins_au[i], t_au, Eps_au[j])
+                        for i in range(len(Ekins_au)) for j in range(len(Eps_au))]
+            if full:
+                doout_1f(full, outlines)
+            if movie:
+                movie.write(prep_movie_header(t_au) + '\n')
+                doout_movie(movie, outlines)
+        if wp_res:
+            wp = data['wp'][n]
+            doout_1f(wp_res, [prep_output_wp(nlambda, wp[nlambda,j], t_au, Eps_au[j])
+                              for nlambda in range(wp.shape[0]) for j in range(len(Eps_au))])
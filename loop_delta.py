@@ -12,12 +12,15 @@
 # written by: Elke Fasshauer May 2018                                    #
 ##########################################################################
 
+import argparse
 import scipy
 import scipy.integrate as integrate
 from scipy.signal import argrelextrema
 import numpy as np
 import sciconv
+import amplitudes as amp
 import complex_integration as ci
+import delay_scan as ds
 import in_out
 import sys
 import warnings
@@ -30,7 +33,20 @@ from scipy import fft
 if not sys.warnoptions:
     warnings.simplefilter("ignore")
 
-infile = sys.argv[1]
+parser = argparse.ArgumentParser(
+        description='''ELDEST -- loop_delta.py :
+        Spectra after both pulses as a function of the delay between
+        the XUV and the IR pulse.''',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('infile', help='''Input file for simulation, probably photo.in; it has to set
+                    tau_a_s (prc defaults to RICD)''')
+parser.add_argument('--fourier', action='store_true', help='''Calculate the spectra of all delays at once
+                    from the Fourier coefficients of the IR phase (one chirp z-transform over the
+                    frequencies) instead of integrating every delay anew. Only with integ = analytic
+                    (the inner integral from the Fourier series of the IR phase).''')
+args = parser.parse_args()
+
+infile = args.infile
 print(infile)
 
 #-------------------------------------------------------------------------
@@ -42,14 +58,17 @@ outfile.write("The results were obtained with loop_delta.py \n")
 
 #-------------------------------------------------------------------------
 # read inputfile
-(rdg_au, cdg_au,
+(X_ICD, X_RICD,
+ rdg_au, cdg_au,
  Er_a_eV, Er_b_eV, tau_a_s, tau_b_s, E_fin_eV, tau_s, E_fin_eV_2, tau_s_2,
  interact_eV,
  Omega_eV, n_X, I_X, X_sinsq, X_gauss, Xshape,
  omega_eV, n_L, I_L, Lshape, delta_t_s, shift_step_s, phi, q, sigma_L,
- tmax_s, timestep_s, E_step_eV,
+ tmax_s, timestep_s, E_step_eV, Ep_step_eV,
  E_min_eV, E_max_eV,
- integ, integ_outer,
+ Ep_min_eV, Ep_max_eV,
+ integ, integ_outer, Gamma_type,
+ fc_precalc, partial_GamR, part_fc_pre, wavepac_only,
  mass1, mass2, grad_delta, R_eq_AA,
  gs_de, gs_a, gs_Req, gs_const,
  res_de, res_a, res_Req, res_const,
@@ -63,9 +82,24 @@ outfile.write("The results were obtained with loop_delta.py \n")
 Er_au          = sciconv.ev_to_hartree(Er_a_eV)
 E_fin_au       = sciconv.ev_to_hartree(E_fin_eV)
 
+if (tau_a_s <= 0):
+    # read_input has no default for the lifetime (photo.in only sets tau_s, tau_b_s, ...)
+    sys.exit('!!! tau_a_s (lifetime of the resonance) has to be set in ' + infile
+             + '. Programme terminated.')
 tau_au         = sciconv.second_to_atu(tau_a_s)
 Gamma_au       = 1. / tau_au
 
+# the delay loop has the outer integral by quadrature or romberg only, the Fourier scan all outer integrals
+# of amplitudes.pulse_integrals (analytic: closed form for the Gaussian XUV pulse)
+if (not args.fourier and integ_outer not in ('quadrature', 'romberg')):
+    sys.exit('!!! integ_outer = ' + integ_outer + ' is only available with --fourier, the delay loop'
+             + ' uses quadrature or romberg. Programme terminated.')
+if (args.fourier and integ != 'analytic'):
+    sys.exit('!!! --fourier uses the Fourier series of the IR phase for the inner integral, it needs'
+             + ' integ = analytic (not ' + integ + '). Programme terminated.')
+if (args.fourier and integ_outer == 'analytic' and not X_gauss):
+    sys.exit('!!! The analytic outer integral is only available for the Gaussian XUV pulse. Programme terminated.')
+
 # laser parameters
 Omega_au      = sciconv.ev_to_hartree(Omega_eV)
 if (X_sinsq):
@@ -285,11 +319,6 @@ fun_t_dir_1 = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
 fun_TX2_dir_1 = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
                                    * np.exp(1j * p_au**2/2 * (t1-TX_au/2))
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))
-
-dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]
-dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))
 #fun_dress_after = lambda t1: (FX_t1(t1)
 #                              * np.exp(1j * E_fin_au * t1) \
 #                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
@@ -379,14 +408,33 @@ integ_res = lambda t1: 1./(1j * 2*np.pi* sort_freq - 1j*gamma) \
 res_outer_fun = lambda t1: FX_t1(t1) * np.exp(t1 * (np.pi* VEr_au**2 + 1j*Er_au)) \
                            * res_inner(t1)
 
+# keywords of the numerical integrals: the amplitudes are far below the default absolute tolerances
+# of 1.49e-8 (quadrature) and 1.48e-8 (romberg), so only the relative ones are used; quad needs far
+# more than its default 50 subintervals for the XUV carrier (warnings are only shown with python -W)
+quad_opts = {'epsabs': 0., 'limit': 2000}
+romb_opts = {'tol': 0., 'divmax': 16}
+
+# keywords of amplitudes.pulse_integrals for the outer integrals of the Fourier scan
+if (integ_outer == 'quadrature'):
+    outer_opts = quad_opts
+elif (integ_outer == 'romberg'):
+    outer_opts = romb_opts
+elif (integ_outer == 'gauss-legendre'):
+    outer_opts = {'epsabs': 0.}
+elif (integ_outer == 'analytic'):     # closed form for the Gaussian pulse
+    outer_opts = {'gauss': (A0X, Omega_au, sigma)}
+elif (integ_outer == 'filon'):        # FX = sum of smooth envelopes times exp(+- i Omega t1)
+    outer_opts = {'envelopes': [(lambda t1: - A0X/2 * fp_t1(t1) + A0X*Omega_au/2j * f_t1(t1), Omega_au),
+                                (lambda t1: - A0X/2 * fp_t1(t1) - A0X*Omega_au/2j * f_t1(t1), -Omega_au)]}
+
 # after the pulse
 res_inner_after = lambda t2: np.exp(-t2 * (np.pi * VEr_au**2 + 1j*(Er_au))) \
                              * IR_after(t2)
 
 if (integ == 'romberg'):
-    res_inner_a = lambda t1: ci.complex_romberg(res_inner_after, t1, t_au)
+    res_inner_a = lambda t1: ci.complex_romberg(res_inner_after, t1, t_au, **romb_opts)
 elif (integ == 'quadrature'):
-    res_inner_a = lambda t1: ci.complex_quadrature(res_inner_after, t1, t_au)[0]
+    res_inner_a = lambda t1: ci.complex_quadrature(res_inner_after, t1, t_au, **quad_opts)[0]
 elif (integ == 'analytic'):
      res_inner_a = lambda t1: inner_prefac(t_au) \
                               * ( 1./N_coeff
@@ -476,9 +524,70 @@ prefac_indir = -1j * np.pi * VEr_au**2 * cdg_au
 prefac_dir = 1j * cdg_au
 
 
+#-------------------------------------------------------------------------
+# delay scan from the Fourier coefficients (--fourier), see delay_scan.py:
+# only C = inner_prefac / exp(-i t (E_kin + E_fin)) and the exponentials of the Fourier
+# series depend on delta_t, res_I of all delays is one chirp z-transform per E_kin
+def IR_phase(tau):
+    # f(tau) = exp(i alpha IR_phase(tau)), see f_grid
+    if (Lshape == "sinsq"):
+        return (np.sin((2*np.pi / TL_au + omega_au) * tau + phi) / (2*np.pi / TL_au + omega_au)
+                + np.sin((2*np.pi / TL_au - omega_au) * tau - phi) / (2*np.pi / TL_au - omega_au)
+                + 2 / omega_au * np.sin((omega_au) * tau + phi))
+    elif (Lshape == "gauss"):
+        return np.real(erf(tau/np.sqrt(2)/sigma_L + 1j*omega_au * sigma_L / np.sqrt(2)))
+
+def delay_scan_fourier(delta_ts):
+    # |J|**2 and |res_J|**2 for all delays delta_ts and all E_kin, each of shape (delay, E_kin)
+    E_kins = E_min_au + E_step_au * np.arange(N_Ekin)
+    p_aus = np.sqrt(2 * E_kins)
+    if (Lshape == "sinsq"):
+        alphas = A0L*p_aus/4
+        C = np.exp(-1j*alphas*8*(np.pi)**2/(omega_au*(4*(np.pi)**2 - omega_au**2*TL_au**2))
+                   *np.sin(omega_au*TL_au/2+phi)) * np.ones((len(delta_ts),1))
+    elif (Lshape == "gauss"):
+        alphas = p_aus * A0L * sigma_L * np.sqrt(np.pi/8) * np.exp(-omega_au**2 * sigma_L**2 / 2)
+        C = np.exp(-1j * alphas
+                   * np.real(erf((TL_au/2-delta_ts[:,None])/np.sqrt(2)/sigma_L
+                                 +1j*omega_au * sigma_L / np.sqrt(2))))
+    prefac = C * np.exp(-1j*t_au*(E_kins+E_fin_au))
+    gammas = Er_au - E_kins - E_fin_au - 1j*np.pi*VEr_au**2
+
+    # resonant part: outer integrals of all frequencies, one chirp z-transform over them
+    nu = 2*np.pi * sort_freq[:,None]
+    G = amp.pulse_integrals(FX_t1, 1j * (E_kins + E_fin_au + nu), -TX_au/2, TX_au/2,
+                            integ_outer, **outer_opts)
+    G_res = amp.pulse_integrals(FX_t1, np.array([np.pi * VEr_au**2 + 1j*Er_au]),
+                                -TX_au/2, TX_au/2, integ_outer, **outer_opts)[0]
+    res_I = prefac * ds.resonant_sums(fourier_coeffs.T, sort_freq, N_coeff * d_tau_var,
+                                      G, G_res, gammas, t_au, delta_ts)
+
+    # direct part: Gauss-Legendre rules in t1 refined until converged, the phase table is shared by all E_kin
+    I1, err = ds.direct_integrals(FX_t1, -TX_au/2, TX_au/2, E_kins + E_fin_au, alphas, IR_phase, delta_ts)
+    print('direct term: error estimate ', err, ' (max |I1| = ', np.max(np.abs(I1)), ')')
+    outfile.write('direct term: error estimate ' + str(err)
+                  + ' (max |I1| = ' + str(np.max(np.abs(I1))) + ') \n')
+
+    dir_J = prefac_dir * prefac * I1
+    res_J = prefac_res * res_I
+    indir_J = prefac_indir * res_I
+    return np.absolute(dir_J + res_J + indir_J)**2, np.absolute(res_J)**2
+
+if args.fourier:
+    n_delta = 0
+    delta_t_scan = delta_t_au
+    while (delta_t_scan <= delta_t_max):
+        n_delta = n_delta + 1
+        delta_t_scan = delta_t_scan + shift_step_au
+    scan_squares, scan_res_terms = delay_scan_fourier(delta_t_au + shift_step_au * np.arange(n_delta))
+    print('Fourier delay scan: ', n_delta, ' delays')
+    outfile.write('Fourier delay scan: ' + str(n_delta) + ' delays \n')
+
+
 #-------------------------------------------------------------------------
 # loop over the delta between pulses
 #while (delta_t_au <= TL_au/2 - TX_au/2):
+i_delta = 0
 while (delta_t_au <= delta_t_max):
 #-------------------------------------------------------------------------
     outfile.write('after both pulses \n')
@@ -491,7 +600,14 @@ while (delta_t_au <= delta_t_max):
     
     print('delta_t_s = ', sciconv.atu_to_second(delta_t_au))
     outfile.write('delta_t_s = ' + str(sciconv.atu_to_second(delta_t_au)) + '\n')
-    while (E_kin_au <= E_max_au):
+    if args.fourier:
+        squares = scan_squares[i_delta]
+        for E_ind in range (0,N_Ekin):
+            outlines.append(in_out.prep_output_comp(squares[E_ind], scan_res_terms[i_delta,E_ind],
+                                                    E_kin_au, delta_t_au))
+            E_kin_au = E_kin_au + E_step_au
+
+    while (not args.fourier and E_kin_au <= E_max_au):
 
         p_au = np.sqrt(2 * E_kin_au)
         if (Lshape == "sinsq"):
@@ -505,16 +621,16 @@ while (delta_t_au <= delta_t_max):
 
 # integral 1
         if (integ_outer == "quadrature"):
-            I1 = ci.complex_quadrature(fun_dress_after, (-TX_au/2), TX_au/2)
-            res_I = ci.complex_quadrature(res_outer_after, (-TX_au/2), TX_au/2)
+            I1 = ci.complex_quadrature(fun_dress_after, (-TX_au/2), TX_au/2, **quad_opts)
+            res_I = ci.complex_quadrature(res_outer_after, (-TX_au/2), TX_au/2, **quad_opts)
 
             dir_J = prefac_dir * I1[0]
             res_J = prefac_res * res_I[0]
             indir_J = prefac_indir * res_I[0]
 
         elif (integ_outer == "romberg"):
-            I1 = ci.complex_romberg(fun_dress_after, (-TX_au/2), TX_au/2)
-            res_I = ci.complex_romberg(res_outer_after, (-TX_au/2), TX_au/2)
+            I1 = ci.complex_romberg(fun_dress_after, (-TX_au/2), TX_au/2, **romb_opts)
+            res_I = ci.complex_romberg(res_outer_after, (-TX_au/2), TX_au/2, **romb_opts)
 
             dir_J = prefac_dir * I1
             res_J = prefac_res * res_I
@@ -548,6 +664,7 @@ while (delta_t_au <= delta_t_max):
             outfile.write(str(Ekins[max_pos[i]]) + ' ' + str(squares[max_pos[i]]) + '\n')
 
     delta_t_au = delta_t_au + shift_step_au
+    i_delta = i_delta + 1
     outfile.write('\n')
 
 
@@ -24,6 +24,7 @@ import in_out
 import sys
 import warnings
 import potentials
+import trajectory
 
 
 # don't print warnings unless python -W ... is used
@@ -38,6 +39,7 @@ print infile
 outfile = open("eldest.out", mode='w')
 pure_out = open('full.dat', mode='w')
 movie_out = open('movie.dat', mode='w')
+spec_out = in_out.SpectrumWriter(pure_out, movie_out)
 popfile = open("pop.dat", mode='w')
 
 outfile.write("The results were obtained with time_save_measure_TK.py \n")
@@ -60,7 +62,8 @@ Xshape = 'convoluted'
  V_RICD_in_a, V_RICD_in_b, V_RICD_in_c, V_RICD_in_d, 
  V_fin_RICD_a, V_fin_RICD_b,
  V_ICD_in_a, V_ICD_in_b, V_ICD_in_c, V_ICD_in_d,
- V_fin_ICD_a, V_fin_ICD_b) = in_out.read_input(infile, outfile)
+ V_fin_ICD_a, V_fin_ICD_b) = in_out.read_input_old(infile, outfile)
+(gs_de, gs_a, gs_Req, n_traj, ens_workers, ens_seed) = in_out.read_ensemble_input(infile, outfile)
 
 
 #-------------------------------------------------------------------------
@@ -199,7 +202,7 @@ elif (Xshape == 'infinite'):
 # IR pulse
 A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
                       * np.cos(omega_au * t3 + phi)
-integ_IR = lambda t3: (p_au + A_IR(t3))**2
+#integ_IR = lambda t3: (p_au + A_IR(t3))**2
 
 IR_during = lambda t2:  np.exp(-1j * (E_kin_au + E_fin_au) * (t_au - t2))# \
 
@@ -227,25 +230,13 @@ fun_t_TX2_1 = lambda t1: FX_t1(t1)   * np.exp(1j * (E_fin_au_TX2 + T_K_TX2) * t1
                                      * np.exp(1j * E_kin_au * (t1-t_au)) \
                                      * np.exp(-1j * (T_K_TX2 + E_fin_au_TX2) * t_au)
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))
-
-dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]
-dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))
-fun_dress_after = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
-                              * dress_after(t1)
-
-fun_IR_dir = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                                  * dress(t1)
-
 
 
 res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * (VEr_au**2) + 1j*(Er_au))) \
                            * IR_during(t2)
 
 if (integ == 'romberg'):
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
+    res_inner = lambda t1: ci.complex_romberg(res_inner_fun, t1, t_au)
 elif (integ == 'quadrature'):
     res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
 elif (integ == 'analytic'):
@@ -318,6 +309,36 @@ popfun = lambda t1: np.exp(-2* np.sqrt(2*Ip)**3 / 3 / A0L
 # initialization
 t_au = -TX_au/2
 
+# classical nuclear trajectory on the time grid of the loops below: frozen up to t = 0,
+# on the RICD resonance potential up to the second pulse, on the ICD one afterwards
+def nuc_grad(t, R):
+    if (t <= 0):
+        return np.zeros_like(R)
+    elif (t <= delta_t_au - a):
+        return potentials.expr6_grad(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R)
+    else:
+        return potentials.expr6_grad(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R)
+
+# n_traj > 1: ensemble of initial conditions from the Wigner function of the ground state,
+# the spectra of the trajectories are averaged
+if (n_traj > 1):
+    R0s, P0s = trajectory.morse_wigner(gs_de, gs_a, gs_Req, red_mass, n_traj, ens_seed)
+else:
+    R0s, P0s = np.array([R0]), np.array([red_mass * v0])
+t_grid = trajectory.time_grid(t_au, timestep_au, tmax_au)
+R_t, P_t = trajectory.propagate(R0s, P0s, red_mass, t_grid, nuc_grad)
+nuc = trajectory.NuclearTables(t_grid, R_t, P_t,
+            E_res_RICD = lambda R: potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R),
+            E_fin_RICD = lambda R: potentials.hyperbel(V_fin_RICD_a,V_fin_RICD_b,R),
+            V_res_RICD = lambda R: potentials.gammar6(gammar6_a,R),
+            E_res_ICD  = lambda R: potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R),
+            E_fin_ICD  = lambda R: potentials.hyperbel(V_fin_ICD_a,V_fin_ICD_b,R),
+            V_res_ICD  = lambda R: potentials.gammar6(gammar6_b,R))
+T_K_t = nuc.kinetic(red_mass)            # kinetic energy of the nuclei along each trajectory
+shards = trajectory.EnsembleShards(n_traj, ens_workers)
+# T_K of each trajectory at the latest time step before the second pulse, used from then on
+T_Ks = np.zeros(n_traj)
+
 # construct list of energy points
 # test different energy areas
 lower_E_min = sciconv.ev_to_hartree(0.45)
@@ -370,15 +391,12 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
     E_fin_laser_au = E_fin_au_1
     Er_laser_au = Er_a_au
@@ -428,17 +446,13 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
             #outfile.write("Ekin, Jres = " + str(E_kin_au) + '  ' + str(res_J1)+'\n')
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
     
     
     #print "vor dem Schreiben des Output"
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
 #    max_pos = argrelextrema(squares, np.greater)[0]
 #    #print "max_pos = ", max_pos
 #    #print "Ekins 2 = ", Ekins1[2], squares[2]
@@ -459,85 +473,77 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
-    E_kin_au = E_min_au
-    
     t_s = sciconv.atu_to_second(t_au)
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
-    Vplus   = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0+grad_delta)
-    Vminus  = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0-grad_delta)
-    Vgrad   = (Vplus - Vminus) / (2* grad_delta)
-    a       = - Vgrad / red_mass
-    R       = 0.5*a*timestep_au**2 + v0*timestep_au + R0
-    E_res_R = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R)
-    E_fin_R = potentials.hyperbel(V_fin_RICD_a,V_fin_RICD_b,R)
-    V_res_R = potentials.gammar6(gammar6_a,R)
+    n_R = nuc.index(t_au)
+    T_Ks = T_K_t[n_R]
+    print "R0 = ", sciconv.bohr_to_angstrom(nuc.R[n_R])
+    print "T_K [eV] = ", sciconv.hartree_to_ev(T_Ks)
+
+    def traj_step(j):
+        # spectrum of trajectory j at this time step (the integrands read these names as globals)
+        global E_res_R, E_fin_R, V_res_R, E_fin_laser_au, Er_laser_au, VEr_laser_au, TK_laser_au, E_fin_au
+        global Er_au, T_K, VEr_au, E_kin_au, p_au, square, I1, res_I
+        global dir_J1, res_J1, indir_J1, J
+        E_res_R = nuc.E_res_RICD[n_R,j]
+        E_fin_R = nuc.E_fin_RICD[n_R,j]
+        V_res_R = nuc.V_res_RICD[n_R,j]
+
+        E_fin_laser_au = E_fin_au_1
+        Er_laser_au = Er_a_au
+        VEr_laser_au = VEr_au_1
+        TK_laser_au = 0
+
+        E_fin_au = E_fin_R
+        Er_au = E_res_R
+        T_K = T_Ks[j]
+        if (E_res_R >= E_fin_R):
+           VEr_au = V_res_R
+        else:
+           VEr_au = 0
 
-    R0 = R
-    v0 = a * timestep_au + v0
-    print "R0 = ", sciconv.bohr_to_angstrom(R0)
+        E_kin_au = E_min_au
+        while (E_kin_au <= E_max_au):
+            p_au = np.sqrt(2*E_kin_au)
 
-    E_fin_laser_au = E_fin_au_1
-    Er_laser_au = Er_a_au
-    VEr_laser_au = VEr_au_1
-    TK_laser_au = 0
-    
-    E_fin_au = E_fin_R
-    Er_au = E_res_R
-    T_K = Er_a_au - E_res_R
-    print "T_K [eV] = ", sciconv.hartree_to_ev(T_K)
-    if (E_res_R >= E_fin_R):
-       VEr_au = V_res_R
-    else:
-       VEr_au = 0
+            if (E_kin_au < upper_E_min):
+                square = 0.0
+            else:
+# integral 1
+                if (integ_outer == "quadrature"):
+                    I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), t_au)
+                    res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), t_au)
 
-    while (E_kin_au <= E_max_au):
-        p_au = np.sqrt(2*E_kin_au)
+                    dir_J1 = prefac_dir1 * I1[0]
+                    res_J1 = prefac_res1 * res_I[0]
+                    indir_J1 = prefac_indir1 * res_I[0]
 
-        if (E_kin_au < upper_E_min):
-            square = 0.0
-        else:
-# integral 1
-            if (integ_outer == "quadrature"):
-                I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), t_au)
-                res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), t_au)
-    
-                dir_J1 = prefac_dir1 * I1[0]
-                res_J1 = prefac_res1 * res_I[0]
-                indir_J1 = prefac_indir1 * res_I[0]
-    
-            elif (integ_outer == "romberg"):
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
-    
-            J = (0
-                 + dir_J1
-                 + res_J1
-                 + indir_J1
-                 )
-    
-            #outfile.write("Ekin, Jres = " + str(E_kin_au) + '  ' + str(res_J1)+'\n')
+                elif (integ_outer == "romberg"):
+                    I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
+                    res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
 
-            square = np.absolute(J)**2
-            squares = np.append(squares, square)
+                    dir_J1 = prefac_dir1 * I1
+                    res_J1 = prefac_res1 * res_I
+                    indir_J1 = prefac_indir1 * res_I
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
-        
-        E_kin_au = E_kin_au + E_step_au
-    
-    
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+                J = (0
+                     + dir_J1
+                     + res_J1
+                     + indir_J1
+                     )
+
+                #outfile.write("Ekin, Jres = " + str(E_kin_au) + '  ' + str(res_J1)+'\n')
+
+                square = np.absolute(J)**2
+                spec_out.add(square, E_kin_au)
+
+            E_kin_au = E_kin_au + E_step_au
+
+    shards.run(traj_step, spec_out)
+    squares = spec_out.write(t_au, ensemble=n_traj)
     max_pos = argrelextrema(squares, np.greater)[0]
 #    if (len(max_pos > 0)):
 #        for i in range (0, len(max_pos)):
@@ -548,8 +554,9 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     t_au = t_au + timestep_au
 
 
-E_fin_au_TX2 = E_fin_R
-T_K_TX2      = T_K
+# E_fin and T_K of each trajectory at the end of the first pulse
+E_fin_au_TX2s = nuc.E_fin_RICD[n_R]
+T_K_TX2s      = T_K_t[n_R]
 
 #-------------------------------------------------------------------------
 while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
@@ -557,89 +564,78 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
     outfile.write('between the pulses \n')
     print 'between the pulses'
 
-    outlines = []
-    squares = np.array([])
-    E_kin_au = E_min_au
-    
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 
-    Vplus   = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0+grad_delta)
-    Vminus  = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0-grad_delta)
-    Vgrad   = (Vplus - Vminus) / (2* grad_delta)
-    a       = - Vgrad / red_mass
-    R       = 0.5*a*timestep_au**2 + v0*timestep_au + R0
-    E_res_R = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R)
-    E_fin_R = potentials.hyperbel(V_fin_RICD_a,V_fin_RICD_b,R)
-    V_res_R = potentials.gammar6(gammar6_a,R)
+    n_R = nuc.index(t_au)
+    T_Ks = T_K_t[n_R]
+    print "R0 = ", sciconv.bohr_to_angstrom(nuc.R[n_R])
+    print "T_K [eV] = ", sciconv.hartree_to_ev(T_Ks)
+
+    def traj_step(j):
+        # spectrum of trajectory j at this time step (the integrands read these names as globals)
+        global E_res_R, E_fin_R, V_res_R, E_fin_au_TX2, T_K_TX2, E_fin_laser_au, Er_laser_au, VEr_laser_au
+        global TK_laser_au, E_fin_au, Er_au, VEr_au, T_K, E_kin_au, p_au, square
+        global I1, res_I, dir_J1, res_J1, indir_J1, J
+        E_res_R = nuc.E_res_RICD[n_R,j]
+        E_fin_R = nuc.E_fin_RICD[n_R,j]
+        V_res_R = nuc.V_res_RICD[n_R,j]
+        E_fin_au_TX2 = E_fin_au_TX2s[j]
+        T_K_TX2      = T_K_TX2s[j]
+
+        E_fin_laser_au = E_fin_au_1
+        Er_laser_au = Er_a_au
+        VEr_laser_au = VEr_au_1
+        TK_laser_au = 0
+
+        E_fin_au = E_fin_R
+        Er_au = E_res_R
+        VEr_au = V_res_R
+        T_K = T_Ks[j]
+        if (E_res_R >= E_fin_R):
+           VEr_au = V_res_R
+        else:
+           VEr_au = 0
 
-    #print "E_res_R = ", E_res_R
-    #print "E_fin_R = ", E_fin_R
-    #print "V_res_R = ", V_res_R
+        E_kin_au = E_min_au
+        while (E_kin_au <= E_max_au):
+            p_au = np.sqrt(2*E_kin_au)
 
-    R0 = R
-    v0 = a * timestep_au + v0
-    print "R0 = ", sciconv.bohr_to_angstrom(R0)
+            if (E_kin_au < upper_E_min):
+                square = 0.0
+            else:
+# integral 1
+                if (integ_outer == "quadrature"):
+                    I1 = ci.complex_quadrature(fun_t_TX2_1, (-TX_au/2), TX_au/2)
+                    res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), TX_au/2)
 
-    E_fin_laser_au = E_fin_au_1
-    Er_laser_au = Er_a_au
-    VEr_laser_au = VEr_au_1
-    TK_laser_au = 0
-    
-    E_fin_au = E_fin_R
-    Er_au = E_res_R
-    VEr_au = V_res_R
-    T_K = Er_a_au - E_res_R
-    print "T_K [eV] = ", sciconv.hartree_to_ev(T_K)
-    if (E_res_R >= E_fin_R):
-       VEr_au = V_res_R
-    else:
-       VEr_au = 0
+                    dir_J1 = prefac_dir1 * I1[0]
+                    res_J1 = prefac_res1 * res_I[0]
+                    indir_J1 = prefac_indir1 * res_I[0]
 
-    while (E_kin_au <= E_max_au):
-        p_au = np.sqrt(2*E_kin_au)
+                elif (integ_outer == "romberg"):
+                    I1 = ci.complex_romberg(fun_t_TX2_1, (-TX_au/2), TX_au/2)
+                    res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
 
-        if (E_kin_au < upper_E_min):
-            square = 0.0
-        else:
-# integral 1
-            if (integ_outer == "quadrature"):
-                I1 = ci.complex_quadrature(fun_t_TX2_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), TX_au/2)
-    
-                dir_J1 = prefac_dir1 * I1[0]
-                res_J1 = prefac_res1 * res_I[0]
-                indir_J1 = prefac_indir1 * res_I[0]
-            
-            elif (integ_outer == "romberg"):
-                I1 = ci.complex_romberg(fun_t_TX2_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
-    
-            J = (0
-                 + dir_J1
-                 + res_J1
-                 + indir_J1
-                 )
-            #outfile.write("Ekin, Jres = " + str(E_kin_au) + '  ' + str(res_J1)+'\n')
-    
-            square = np.absolute(J)**2
-            squares = np.append(squares, square)
+                    dir_J1 = prefac_dir1 * I1
+                    res_J1 = prefac_res1 * res_I
+                    indir_J1 = prefac_indir1 * res_I
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
-        
-        E_kin_au = E_kin_au + E_step_au
+                J = (0
+                     + dir_J1
+                     + res_J1
+                     + indir_J1
+                     )
+                #outfile.write("Ekin, Jres = " + str(E_kin_au) + '  ' + str(res_J1)+'\n')
 
-    
-    
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+                square = np.absolute(J)**2
+                spec_out.add(square, E_kin_au)
+
+            E_kin_au = E_kin_au + E_step_au
+
+    shards.run(traj_step, spec_out)
+    squares = spec_out.write(t_au, ensemble=n_traj)
     max_pos = argrelextrema(squares, np.greater)[0]
 #    if (len(max_pos > 0)):
 #        for i in range (0, len(max_pos)):
@@ -656,12 +652,7 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     outfile.write('during the second pulse \n')
     print 'during the second pulse'
 
-    outlines = []
-    squares = np.array([])
-    E_kin_au = E_min_au
-    
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     rdg_decay_au = np.sqrt(N0) \
@@ -676,9 +667,7 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     print "sqrt N0 = ", np.sqrt(N0)
     print "rdg_decay_au = ", rdg_decay_au
     Mrt = np.sqrt(N0) - rdg_decay_au
-    prefac_res1 = VEr_au * rdg_decay_au
     #prefac_dir1 = 1j * rdg_decay_au / q / np.pi / VEr_au
-    prefac_indir1 = -1j * VEr_au * rdg_decay_au / q
 
     prefac_res2 = WEr_au * (np.sqrt(N0) - rdg_decay_au)
     #prefac_res2 = WEr_au * np.sqrt(N0)
@@ -688,114 +677,114 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     popfile.write(str(sciconv.atu_to_second(t_au)) + '   ' + str(rdg_decay_au**2)
                   + '   ' + str(Mrt**2) + '\n')
 
-    Vplus   = potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R0+grad_delta)
-    Vminus  = potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R0-grad_delta)
-    Vgrad   = (Vplus - Vminus) / (2* grad_delta)
-    a       = - Vgrad / red_mass
-    R       = 0.5*a*timestep_au**2 + v0*timestep_au + R0
-    E_res_R = potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R)
-    E_fin_R = potentials.hyperbel(V_fin_ICD_a,V_fin_ICD_b,R)
-    V_res_R = potentials.gammar6(gammar6_b,R)
+    n_R = nuc.index(t_au)
+    print "R0 = ", sciconv.bohr_to_angstrom(nuc.R[n_R])
+
+    def traj_step(j):
+        # spectrum of trajectory j at this time step (the integrands read these names as globals)
+        global T_K, E_res_R, E_fin_R, V_res_R, E_res_RICD, E_fin_RICD, V_res_RICD, prefac_res1
+        global prefac_indir1, E_kin_au, p_au, square, E_fin_laser_au, Er_laser_au, VEr_laser_au, E_fin_au
+        global Er_au, VEr_au, res_I, res_J2, I1, dir_J1, res_J1, indir_J1
+        global J
+        T_K = T_Ks[j]
+        E_res_R = nuc.E_res_ICD[n_R,j]
+        E_fin_R = nuc.E_fin_ICD[n_R,j]
+        V_res_R = nuc.V_res_ICD[n_R,j]
+
+        E_res_RICD = nuc.E_res_RICD[n_R,j]
+        E_fin_RICD = nuc.E_fin_RICD[n_R,j]
+        V_res_RICD = nuc.V_res_RICD[n_R,j]
+
+        # RICD coupling of this trajectory (the VEr_au left by the previous loop is not defined per trajectory)
+        prefac_res1 = V_res_RICD * rdg_decay_au
+        prefac_indir1 = -1j * V_res_RICD * rdg_decay_au / q
+
+        E_kin_au = E_min_au
+        while (E_kin_au <= E_max_au):
+            p_au = np.sqrt(2*E_kin_au)
+
+            if (E_kin_au < lower_E_min):
+                square = 0.0
+            elif (E_kin_au > lower_E_max and E_kin_au < upper_E_min):
+                square = 0.0
+            elif (E_kin_au >= lower_E_min and E_kin_au <= lower_E_max):
+# integral 1
+                if (integ_outer == "quadrature"):
+                    E_fin_laser_au = E_fin_au_2
+                    Er_laser_au = Er_b_au
+                    VEr_laser_au = WEr_au
 
-    E_res_RICD = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R)
-    E_fin_RICD = potentials.hyperbel(V_fin_RICD_a,V_fin_RICD_b,R)
-    V_res_RICD = potentials.gammar6(gammar6_a,R)
+                    E_fin_au = E_fin_R
+                    Er_au = E_res_R
+                    VEr_au = V_res_R
 
-    R0 = R
-    v0 = a * timestep_au + v0
-    print "R0 = ", sciconv.bohr_to_angstrom(R0)
+                    res_I = ci.complex_quadrature(second_outer_fun, (- a),
+                                                                    (t_au-delta_t_au))
+                    res_J2   = prefac_res2 * res_I[0]
 
-    while (E_kin_au <= E_max_au):
-        p_au = np.sqrt(2*E_kin_au)
+                elif (integ_outer == "romberg"):
+                    E_fin_laser_au = E_fin_au_2
+                    Er_laser_au = Er_b_au
+                    VEr_laser_au = WEr_au
 
-        if (E_kin_au < lower_E_min):
-            square = 0.0
-        elif (E_kin_au > lower_E_max and E_kin_au < upper_E_min):
-            square = 0.0
-        elif (E_kin_au >= lower_E_min and E_kin_au <= lower_E_max):
-# integral 1
-            if (integ_outer == "quadrature"):
-                E_fin_laser_au = E_fin_au_2
-                Er_laser_au = Er_b_au
-                VEr_laser_au = WEr_au
-                
-                E_fin_au = E_fin_R
-                Er_au = E_res_R
-                VEr_au = V_res_R
-
-                res_I = ci.complex_quadrature(second_outer_fun, (- a),
-                                                                (t_au-delta_t_au))
-                res_J2   = prefac_res2 * res_I[0]
-            
-            elif (integ_outer == "romberg"):
-                E_fin_laser_au = E_fin_au_2
-                Er_laser_au = Er_b_au
-                VEr_laser_au = WEr_au
-                
-                E_fin_au = E_fin_R
-                Er_au = E_res_R
-                VEr_au = V_res_R
-    
-                res_I = ci.complex_romberg(second_outer_fun, (- a),
-                                                             (t_au - delta_t_au))
-                res_J2   = prefac_res2 * res_I
-    
-            square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+                    E_fin_au = E_fin_R
+                    Er_au = E_res_R
+                    VEr_au = V_res_R
+
+                    res_I = ci.complex_romberg(second_outer_fun, (- a),
+                                                                 (t_au - delta_t_au))
+                    res_J2   = prefac_res2 * res_I
 
-        elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
+                square = np.absolute(res_J2)**2
+                spec_out.add(square, E_kin_au)
+
+            elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
-            if (integ_outer == "quadrature"):
-                E_fin_laser_au = E_fin_au_1
-                Er_laser_au = Er_a_au
-                VEr_laser_au = VEr_au_1
-                
-                E_fin_au = E_fin_RICD
-                Er_au = E_res_RICD
-                VEr_au = V_res_RICD
-
-                I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), TX_au/2)
-    
-                dir_J1 = prefac_dir1 * I1[0]
-                res_J1 = prefac_res1 * res_I[0]
-                indir_J1 = prefac_indir1 * res_I[0]
-            
-            elif (integ_outer == "romberg"):
-                E_fin_laser_au = E_fin_au_1
-                Er_laser_au = Er_a_au
-                VEr_laser_au = VEr_au_1
-                
-                E_fin_au = E_fin_RICD
-                Er_au = E_res_RICD
-                VEr_au = V_res_RICD
-
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
-    
-            J = (0
-                 + dir_J1
-                 + res_J1
-                 + indir_J1
-                 )
-    
-            square = np.absolute(J)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
-        
-        E_kin_au = E_kin_au + E_step_au
+                if (integ_outer == "quadrature"):
+                    E_fin_laser_au = E_fin_au_1
+                    Er_laser_au = Er_a_au
+                    VEr_laser_au = VEr_au_1
 
-    
-    
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+                    E_fin_au = E_fin_RICD
+                    Er_au = E_res_RICD
+                    VEr_au = V_res_RICD
+
+                    I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), TX_au/2)
+                    res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), TX_au/2)
+
+                    dir_J1 = prefac_dir1 * I1[0]
+                    res_J1 = prefac_res1 * res_I[0]
+                    indir_J1 = prefac_indir1 * res_I[0]
+
+                elif (integ_outer == "romberg"):
+                    E_fin_laser_au = E_fin_au_1
+                    Er_laser_au = Er_a_au
+                    VEr_laser_au = VEr_au_1
+
+                    E_fin_au = E_fin_RICD
+                    Er_au = E_res_RICD
+                    VEr_au = V_res_RICD
+
+                    I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
+                    res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
+
+                    dir_J1 = prefac_dir1 * I1
+                    res_J1 = prefac_res1 * res_I
+                    indir_J1 = prefac_indir1 * res_I
+
+                J = (0
+                     + dir_J1
+                     + res_J1
+                     + indir_J1
+                     )
+
+                square = np.absolute(J)**2
+                spec_out.add(square, E_kin_au)
+
+            E_kin_au = E_kin_au + E_step_au
+
+    shards.run(traj_step, spec_out)
+    squares = spec_out.write(t_au, ensemble=n_traj)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -815,112 +804,101 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
     outfile.write('after the pulses \n')
     print 'after the pulses'
 
-    outlines = []
-    squares = np.array([])
-    E_kin_au = E_min_au
-    
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 
-    Vplus   = potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R0+grad_delta)
-    Vminus  = potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R0-grad_delta)
-    Vgrad   = (Vplus - Vminus) / (2* grad_delta)
-    a       = - Vgrad / red_mass
-    R       = 0.5*a*timestep_au**2 + v0*timestep_au + R0
-    E_res_R = potentials.expr6(V_ICD_in_a,V_ICD_in_b,V_ICD_in_c,V_ICD_in_d,R)
-    E_fin_R = potentials.hyperbel(V_fin_ICD_a,V_fin_ICD_b,R)
-    V_res_R = potentials.gammar6(gammar6_b,R)
+    n_R = nuc.index(t_au)
+    print "R0 = ", sciconv.bohr_to_angstrom(nuc.R[n_R])
+
+    def traj_step(j):
+        # spectrum of trajectory j at this time step (the integrands read these names as globals)
+        global T_K, E_res_R, E_fin_R, V_res_R, E_res_RICD, E_fin_RICD, V_res_RICD, E_kin_au
+        global p_au, square, E_fin_laser_au, Er_laser_au, VEr_laser_au, E_fin_au, Er_au, VEr_au
+        global res_I, res_J2, I1, dir_J1
+        T_K = T_Ks[j]
+        E_res_R = nuc.E_res_ICD[n_R,j]
+        E_fin_R = nuc.E_fin_ICD[n_R,j]
+        V_res_R = nuc.V_res_ICD[n_R,j]
+
+        E_res_RICD = nuc.E_res_RICD[n_R,j]
+        E_fin_RICD = nuc.E_fin_RICD[n_R,j]
+        V_res_RICD = nuc.V_res_RICD[n_R,j]
+
+        E_kin_au = E_min_au
+        while (E_kin_au <= E_max_au):
+            p_au = np.sqrt(2*E_kin_au)
+
+            if (E_kin_au < lower_E_min):
+                square = 0.0
+            elif (E_kin_au > lower_E_max and E_kin_au < upper_E_min):
+                square = 0.0
+            elif (E_kin_au >= lower_E_min and E_kin_au <= lower_E_max):
+# integral 1
+                if (integ_outer == "quadrature"):
+                    E_fin_laser_au = E_fin_au_2
+                    Er_laser_au = Er_b_au
+                    VEr_laser_au = WEr_au
 
-    E_res_RICD = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R)
-    E_fin_RICD = potentials.hyperbel(V_fin_RICD_a,V_fin_RICD_b,R)
-    V_res_RICD = potentials.gammar6(gammar6_a,R)
+                    E_fin_au = E_fin_R
+                    Er_au = E_res_R
+                    VEr_au = V_res_R
 
-    R0 = R
-    v0 = a * timestep_au + v0
-    print "R0 = ", sciconv.bohr_to_angstrom(R0)
+                    res_I = ci.complex_quadrature(second_outer_fun, (- a),
+                                                                    (+a))
+                    res_J2   = prefac_res2 * res_I[0]
 
-    while (E_kin_au <= E_max_au):
-        p_au = np.sqrt(2*E_kin_au)
+                elif (integ_outer == "romberg"):
+                    E_fin_laser_au = E_fin_au_2
+                    Er_laser_au = Er_b_au
+                    VEr_laser_au = WEr_au
 
-        if (E_kin_au < lower_E_min):
-            square = 0.0
-        elif (E_kin_au > lower_E_max and E_kin_au < upper_E_min):
-            square = 0.0
-        elif (E_kin_au >= lower_E_min and E_kin_au <= lower_E_max):
-# integral 1
-            if (integ_outer == "quadrature"):
-                E_fin_laser_au = E_fin_au_2
-                Er_laser_au = Er_b_au
-                VEr_laser_au = WEr_au
-                
-                E_fin_au = E_fin_R
-                Er_au = E_res_R
-                VEr_au = V_res_R
-    
-                res_I = ci.complex_quadrature(second_outer_fun, (- a),
-                                                                (+a))
-                res_J2   = prefac_res2 * res_I[0]
-            
-            elif (integ_outer == "romberg"):
-                E_fin_laser_au = E_fin_au_2
-                Er_laser_au = Er_b_au
-                VEr_laser_au = WEr_au
-                
-                E_fin_au = E_fin_R
-                Er_au = E_res_R
-                VEr_au = V_res_R
-    
-                res_I = ci.complex_romberg(second_outer_fun, (- a),
-                                                             (a))
-                res_J2   = prefac_res2 * res_I
-    
-            square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
+                    E_fin_au = E_fin_R
+                    Er_au = E_res_R
+                    VEr_au = V_res_R
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
-        elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
+                    res_I = ci.complex_romberg(second_outer_fun, (- a),
+                                                                 (a))
+                    res_J2   = prefac_res2 * res_I
+
+                square = np.absolute(res_J2)**2
+                spec_out.add(square, E_kin_au)
+
+            elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
-            if (integ_outer == "quadrature"):
-                E_fin_laser_au = E_fin_au_1
-                Er_laser_au = Er_a_au
-                VEr_laser_au = VEr_au_1
-                
-                E_fin_au = E_fin_RICD
-                Er_au = E_res_RICD
-                VEr_au = V_res_RICD
-
-                I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), TX_au/2)
-    
-                dir_J1 = prefac_dir1 * I1[0]
-    
-            elif (integ_outer == "romberg"):
-                E_fin_laser_au = E_fin_au_1
-                Er_laser_au = Er_a_au
-                VEr_laser_au = VEr_au_1
-                
-                E_fin_au = E_fin_RICD
-                Er_au = E_res_RICD
-                VEr_au = V_res_RICD
-
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
-    
-                dir_J1 = prefac_dir1 * I1
-    
-            square = np.absolute(dir_J1)**2
-            squares = np.append(squares, square)
+                if (integ_outer == "quadrature"):
+                    E_fin_laser_au = E_fin_au_1
+                    Er_laser_au = Er_a_au
+                    VEr_laser_au = VEr_au_1
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
-        
-        E_kin_au = E_kin_au + E_step_au
+                    E_fin_au = E_fin_RICD
+                    Er_au = E_res_RICD
+                    VEr_au = V_res_RICD
 
-    
-    
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+                    I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), TX_au/2)
+
+                    dir_J1 = prefac_dir1 * I1[0]
+
+                elif (integ_outer == "romberg"):
+                    E_fin_laser_au = E_fin_au_1
+                    Er_laser_au = Er_a_au
+                    VEr_laser_au = VEr_au_1
+
+                    E_fin_au = E_fin_RICD
+                    Er_au = E_res_RICD
+                    VEr_au = V_res_RICD
+
+                    I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
+
+                    dir_J1 = prefac_dir1 * I1
+
+                square = np.absolute(dir_J1)**2
+                spec_out.add(square, E_kin_au)
+
+            E_kin_au = E_kin_au + E_step_au
+
+    shards.run(traj_step, spec_out)
+    squares = spec_out.write(t_au, ensemble=n_traj)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
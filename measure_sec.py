@@ -36,6 +36,7 @@ print infile
 # open outputfile
 outfile = open("eldest.out", mode='w')
 pure_out = open('full.dat', mode='w')
+spec_out = in_out.SpectrumWriter(pure_out)
 popfile = open("pop.dat", mode='w')
 
 outfile.write("The results were obtained with photoelectron.py \n")
@@ -180,7 +181,7 @@ elif (Xshape == 'infinite'):
 # IR pulse
 A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
                       * np.cos(omega_au * t3 + phi)
-integ_IR = lambda t3: (p_au + A_IR(t3))**2
+#integ_IR = lambda t3: (p_au + A_IR(t3))**2
 
 IR_during = lambda t2:  np.exp(-1j * (E_kin_au + E_fin_au) * (t_au - t2))# \
 
@@ -200,25 +201,13 @@ fun_t_dir_1 = lambda t1: FX_t1(t1)   * np.exp(1j * E_fin_au * (t1-t_au)) \
 fun_TX2_dir_1 = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * (t1-t_au)) \
                                      * np.exp(1j * E_kin_au * (t1-t_au))
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))
-
-dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]
-dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))
-fun_dress_after = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
-                              * dress_after(t1)
-
-fun_IR_dir = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                                  * dress(t1)
-
 
 
 res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * (VEr_au**2) + 1j*(Er_au))) \
                            * IR_during(t2)
 
 if (integ == 'romberg'):
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
+    res_inner = lambda t1: ci.complex_romberg(res_inner_fun, t1, t_au)
 elif (integ == 'quadrature'):
     res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
 elif (integ == 'analytic'):
@@ -283,8 +272,6 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     print 't_s = ', sciconv.atu_to_second(t_au)
@@ -324,15 +311,12 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
              )
 
         square = np.absolute(J)**2
-        squares = np.append(squares, square)
-
-        string = in_out.prep_output(square, E_kin_au, t_au)
-        outlines.append(string)
+        spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
     
     
-    in_out.doout_1f(pure_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -351,8 +335,6 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
     outfile.write('between the pulses \n')
     print 'between the pulses'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     print 't_s = ', sciconv.atu_to_second(t_au)
@@ -392,16 +374,13 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
              )
 
         square = np.absolute(J)**2
-        squares = np.append(squares, square)
-
-        string = in_out.prep_output(square, E_kin_au, t_au)
-        outlines.append(string)
+        spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -418,8 +397,6 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     outfile.write('during the second pulse \n')
     print 'during the second pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     print 't_s = ', sciconv.atu_to_second(t_au)
@@ -495,16 +472,13 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
              )
 
         square = np.absolute(J)**2 + np.absolute(res_J2)**2
-        squares = np.append(squares, square)
-
-        string = in_out.prep_output(square, E_kin_au, t_au)
-        outlines.append(string)
+        spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -523,8 +497,6 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
     outfile.write('after the pulses \n')
     print 'after the pulses'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     print 't_s = ', sciconv.atu_to_second(t_au)
@@ -574,16 +546,13 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
              )
 
         square = np.absolute(dir_J1)**2 + np.absolute(res_J2)**2
-        squares = np.append(squares, square)
-
-        string = in_out.prep_output(square, E_kin_au, t_au)
-        outlines.append(string)
+        spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -24,6 +24,7 @@ import in_out
 import sys
 import warnings
 import potentials
+import res_history
 
 
 # don't print warnings unless python -W ... is used
@@ -38,6 +39,7 @@ print infile
 outfile = open("eldest.out", mode='w')
 pure_out = open('full.dat', mode='w')
 movie_out = open('movie.dat', mode='w')
+spec_out = in_out.SpectrumWriter(pure_out, movie_out)
 popfile = open("pop.dat", mode='w')
 
 outfile.write("The results were obtained with time_measure_split.py \n")
@@ -60,7 +62,7 @@ Xshape = 'convoluted'
  V_RICD_in_a, V_RICD_in_b, V_RICD_in_c, V_RICD_in_d, 
  V_fin_RICD_a, V_fin_RICD_b,
  V_ICD_in_a, V_ICD_in_b, V_ICD_in_c, V_ICD_in_d,
- V_fin_ICD_a, V_fin_ICD_b) = in_out.read_input(infile, outfile)
+ V_fin_ICD_a, V_fin_ICD_b) = in_out.read_input_old(infile, outfile)
 
 
 #-------------------------------------------------------------------------
@@ -199,7 +201,7 @@ elif (Xshape == 'infinite'):
 # IR pulse
 A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
                       * np.cos(omega_au * t3 + phi)
-integ_IR = lambda t3: (p_au + A_IR(t3))**2
+#integ_IR = lambda t3: (p_au + A_IR(t3))**2
 
 IR_during = lambda t2:  np.exp(-1j * (E_kin_au + E_fin_au) * (t_au - t2))# \
 
@@ -230,25 +232,17 @@ fun_t_TX2_1 = lambda t1: FX_t1(t1)   * np.exp(1j * (E_fin_au_TX2 + T_K_TX2) * t1
                                      * np.exp(1j * E_kin_au * (t1-t_au)) \
                                      * np.exp(-1j * (T_K_TX2 + E_fin_au_TX2) * t_au)
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))
-
-dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]
-dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))
-fun_dress_after = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
-                              * dress_after(t1)
-
-fun_IR_dir = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                                  * dress(t1)
-
 
 
 res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * (VEr_au**2) + 1j*(Er_au))) \
                            * IR_during(t2)
 
+# keywords of the outer Romberg integrals: these integrals are orders of magnitude smaller than the
+# default absolute tolerance of 1.48e-8 (false convergence after a few levels), so only rtol is used
+romb_opts = {'tol': 0., 'divmax': 16}
+
 if (integ == 'romberg'):
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
+    res_inner = lambda t1: ci.complex_romberg(res_inner_fun, t1, t_au)
 elif (integ == 'quadrature'):
     res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
 elif (integ == 'analytic'):
@@ -367,8 +361,9 @@ Er_a_au = tmpEr
 #print "E_fin_au_1 = ", E_fin_au_1
 print "Er_a_au = ", sciconv.hartree_to_ev(Er_a_au)
 
-# initiate array of tuples
-res_tuples = []
+# running sums of the resonance amplitudes created at the earlier time steps
+# (each E_kin sums its own amplitudes; the former res_tuples loop read those of the first E_kin for all of them)
+res_hist = res_history.ResonanceHistory(len(Ekins2))
 
 #---------------------------------------------
 n = 0
@@ -376,15 +371,12 @@ n = 0
 outfile.write('first timestep \n')
 print 'first timestep'
 
-outlines = []
-squares = np.array([])
 E_kin_au = E_min_au
 
 t_s = sciconv.atu_to_second(t_au)
 print 't_s = ', sciconv.atu_to_second(t_au)
 outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 t_s = sciconv.atu_to_second(t_au)
-movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
 E_fin_laser_au = E_fin_au_1
 Er_laser_au = Er_a_au
@@ -420,14 +412,14 @@ while (E_kin_au <= E_max_au):
             Er_au = Er_a_au
             VEr_au = VEr_au_1
 
-            I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-            res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
+            I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au, **romb_opts)
+            res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au, **romb_opts)
     
             dir_J1 = prefac_dir1 * I1
             res_J1 = prefac_res1 * res_I
             indir_J1 = prefac_indir1 * res_I
 
-        res_tuples.append(tuple((n,res_J1 + indir_J1, E_fin_au)))
+        res_hist.add(E_index, n, res_J1 + indir_J1, 0, E_fin_au, coherent=False)
 
         J = (0
              + dir_J1
@@ -436,16 +428,12 @@ while (E_kin_au <= E_max_au):
              )
 
         square = np.absolute(J)**2
-        squares = np.append(squares, square)
-
-        string = in_out.prep_output(square, E_kin_au, t_au)
-        outlines.append(string)
+        spec_out.add(square, E_kin_au)
     
     E_kin_au = E_kin_au + E_step_au
     E_index = E_index + 1
 
-in_out.doout_1f(pure_out, outlines)
-in_out.doout_movie(movie_out, outlines)
+squares = spec_out.write(t_au)
 max_pos = argrelextrema(squares, np.greater)[0]
 if (len(max_pos > 0)):
     for i in range (0, len(max_pos)):
@@ -462,15 +450,12 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
 
     t_s = sciconv.atu_to_second(t_au)
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
     E_fin_laser_au = E_fin_au_1
     Er_laser_au = Er_a_au
@@ -521,39 +506,31 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
                 Er_au = Er_a_au
                 VEr_au = VEr_au_1
     
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
+                # one-element tuples, indexed like the results of complex_quadrature
+                I1 = (ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au, **romb_opts),)
+                Ires = (ci.complex_romberg(part1_integral, (-TX_au/2), t_au, **romb_opts),)
+                resstate1 = Ires[0] * part1const(Er_au, VEr_au, E_kin_au, E_fin_au, t_au)
+                resstate2 = I1[0] \
+                            * part2const(Er_au, VEr_au, E_kin_au, E_fin_au, timestep_au, n)
+                store = (prefac_res1 + prefac_indir1) * (resstate1 + resstate2)
+    
+                dir_J1 = prefac_dir1 * I1[0] * np.exp(-1j * (E_kin_au + T_K + E_fin_au) * t_au)
     
             #res_tuples.append(tuple((n,res_J1 + indir_J1, T_K + E_fin_au)))
-            res_tuples.append(tuple((n,store, T_K + E_fin_au)))
+            res_hist.add(E_index, n, store, 0, T_K + E_fin_au, coherent=False)
             
             #J = dir_J1
             #J = 0
             square = 0
-            for time in range(0,n+1):
-                #J = J + (res_tuples[len(Ekins1)*time][1]
-                #         * np.exp(-1j * t_au * (E_kin_au + res_tuples[len(Ekins1*time)][2]))
-                #        )
-                square = square + np.absolute(res_tuples[len(Ekins1)*time][1]
-                         * np.exp(-1j * t_au * (E_kin_au + res_tuples[len(Ekins1*time)][2]))
-                         + dir_J1 )**2
-                #print "J = ", J
+            square = square + res_hist.incoherent_sum(E_index, t_au, E_kin_au, 1, 1, dir_J1)
     
             #square = np.absolute(J)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
         E_index = E_index + 1
     
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -571,15 +548,12 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
     Vplus   = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0+grad_delta)
     Vminus  = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0-grad_delta)
@@ -645,42 +619,34 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
                 #                  - np.pi * (VEr_au**2))
     
             elif (integ_outer == "romberg"):
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
+                # one-element tuples, indexed like the results of complex_quadrature
+                I1 = (ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au, **romb_opts),)
+                Ires = (ci.complex_romberg(part1_integral, (-TX_au/2), t_au, **romb_opts),)
+                resstate1 = Ires[0] * part1const(Er_au, VEr_au, E_kin_au, E_fin_au, t_au)
+                resstate2 = I1[0] \
+                            * part2const(Er_au, VEr_au, E_kin_au, E_fin_au, timestep_au, n)
+                store = (prefac_res1 + prefac_indir1) * (resstate1 + resstate2)
+    
+                dir_J1 = prefac_dir1 * I1[0] * np.exp(-1j * (E_kin_au + T_K + E_fin_au) * t_au)
     
             #res_tuples.append(tuple((n,res_J1 + indir_J1, T_K + E_fin_au)))
-            res_tuples.append(tuple((n,store, T_K + E_fin_au)))
+            res_hist.add(E_index, n, store, 0, T_K + E_fin_au, coherent=False)
             
             J = dir_J1
             J = 0
             square = 0
-            for time in range(0,n+1):
-                #J = J + (res_tuples[len(Ekins1)*time][1]
-                #         * np.exp(-1j * t_au * (E_kin_au + res_tuples[len(Ekins1*time)][2]))
-                #        )
-                square = square + np.absolute(res_tuples[len(Ekins1)*time][1]
-                         * np.exp(-1j * t_au * (E_kin_au + res_tuples[len(Ekins1*time)][2]))
-                         + dir_J1 )**2
-                #print "time = ", time
-                #print "J = ", J
+            square = square + res_hist.incoherent_sum(E_index, t_au, E_kin_au, 1, 1, dir_J1)
     
             #square = np.absolute(J)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
             #print "square = ", square
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
         
         E_kin_au = E_kin_au + E_step_au
         E_index = E_index + 1
     
     
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -701,12 +667,9 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
     outfile.write('between the pulses \n')
     print 'between the pulses'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 
@@ -783,15 +746,18 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
                 #                  - np.pi * (VEr_au**2))
             
             elif (integ_outer == "romberg"):
-                I1 = ci.complex_romberg(fun_t_TX2_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
+                # one-element tuples, indexed like the results of complex_quadrature
+                I1 = (ci.complex_romberg(fun_t_TX2_1, (-TX_au/2), TX_au/2, **romb_opts),)
+                Ires = (ci.complex_romberg(part1_integral, (-TX_au/2), TX_au/2, **romb_opts),)
+                resstate1 = Ires[0] * part1const(Er_au, VEr_au, E_kin_au, E_fin_au, t_au)
+                resstate2 = I1[0] \
+                            * part2const(Er_au, VEr_au, E_kin_au, E_fin_au, timestep_au, n)
+                store = (prefac_res1 + prefac_indir1) * (resstate1 + resstate2)
+    
+                dir_J1 = prefac_dir1 * I1[0] * np.exp(-1j * (E_kin_au + T_K + E_fin_au) * t_au)
     
             #res_tuples.append(tuple((n,res_J1 + indir_J1, T_K + E_fin_au)))
-            res_tuples.append(tuple((n,store, T_K + E_fin_au)))
+            res_hist.add(E_index, n, store, 0, T_K + E_fin_au, coherent=False)
             
             J = dir_J1
             #print "dir_J1 = ", dir_J1
@@ -799,28 +765,17 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
             #print "indir_J1 = ", np.absolute(indir_J1)**2
             J = 0
             square = 0
-            for time in range(0,n+1):
-                #J = J + (res_tuples[len(Ekins1)*time][1]
-                #         * np.exp(-1j * t_au * (E_kin_au + res_tuples[len(Ekins1*time)][2]))
-                #        )
-                square = square + np.absolute(res_tuples[len(Ekins1)*time][1]
-                         * np.exp(-1j * t_au * (E_kin_au + res_tuples[len(Ekins1*time)][2]))
-                         + dir_J1 )**2
-                #print "J = ", J
+            square = square + res_hist.incoherent_sum(E_index, t_au, E_kin_au, 1, 1, dir_J1)
     
             #square = np.absolute(J)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
         E_index = E_index + 1
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -830,8 +785,6 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
     t_au = t_au + timestep_au
     n = n + 1
 
-for i in range(0,len(Ekins1) * (n-1)):
-    print res_tuples[i]
 
 
 #-------------------------------------------------------------------------
@@ -840,12 +793,9 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     outfile.write('during the second pulse \n')
     print 'during the second pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     rdg_decay_au = np.sqrt(N0) \
@@ -921,13 +871,11 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                 VEr_au = V_res_R
     
                 res_I = ci.complex_romberg(second_outer_fun, (- a),
-                                                             (t_au - delta_t_au))
+                                                             (t_au - delta_t_au), **romb_opts)
                 res_J2   = prefac_res2 * res_I
     
             square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
 
         elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
@@ -956,8 +904,8 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                 Er_au = E_res_RICD
                 VEr_au = V_res_RICD
 
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
+                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2, **romb_opts)
+                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2, **romb_opts)
         
                 dir_J1 = prefac_dir1 * I1
                 res_J1 = prefac_res1 * res_I
@@ -970,16 +918,13 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                  )
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -1000,12 +945,9 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
     outfile.write('after the pulses \n')
     print 'after the pulses'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 
@@ -1058,14 +1000,12 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
                 VEr_au = V_res_R
     
                 res_I = ci.complex_romberg(second_outer_fun, (- a),
-                                                             (a))
+                                                             (a), **romb_opts)
                 res_J2   = prefac_res2 * res_I
     
             square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
         elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
             if (integ_outer == "quadrature"):
@@ -1090,22 +1030,18 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
                 Er_au = E_res_RICD
                 VEr_au = V_res_RICD
 
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
+                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2, **romb_opts)
     
                 dir_J1 = prefac_dir1 * I1
     
             square = np.absolute(dir_J1)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
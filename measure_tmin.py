@@ -24,6 +24,7 @@ import in_out
 import sys
 import warnings
 import potentials
+import res_history
 
 
 # don't print warnings unless python -W ... is used
@@ -38,6 +39,7 @@ print infile
 outfile = open("eldest.out", mode='w')
 pure_out = open('full.dat', mode='w')
 movie_out = open('movie.dat', mode='w')
+spec_out = in_out.SpectrumWriter(pure_out, movie_out)
 popfile = open("pop.dat", mode='w')
 
 outfile.write("The results were obtained with measure_tmin.py \n")
@@ -60,7 +62,7 @@ Xshape = 'convoluted'
  V_RICD_in_a, V_RICD_in_b, V_RICD_in_c, V_RICD_in_d, 
  V_fin_RICD_a, V_fin_RICD_b,
  V_ICD_in_a, V_ICD_in_b, V_ICD_in_c, V_ICD_in_d,
- V_fin_ICD_a, V_fin_ICD_b) = in_out.read_input(infile, outfile)
+ V_fin_ICD_a, V_fin_ICD_b) = in_out.read_input_old(infile, outfile)
 
 
 #-------------------------------------------------------------------------
@@ -199,7 +201,7 @@ elif (Xshape == 'infinite'):
 # IR pulse
 A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
                       * np.cos(omega_au * t3 + phi)
-integ_IR = lambda t3: (p_au + A_IR(t3))**2
+#integ_IR = lambda t3: (p_au + A_IR(t3))**2
 
 IR_during = lambda t2:  np.exp(-1j * (E_kin_au + E_fin_au) * (t_au - t2))# \
 
@@ -224,25 +226,17 @@ Mr = lambda t1: N0 * (1
 fun_t_dir_1 = lambda t1: FX_t1(t1)   * np.exp(1j * (E_kin_au + E_fin_au_ini) * t1)
 fun_t_TX2_1 = lambda t1: FX_t1(t1)   * np.exp(1j * (E_kin_au + E_fin_au_ini) * t1)
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))
-
-dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]
-dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))
-fun_dress_after = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
-                              * dress_after(t1)
-
-fun_IR_dir = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                                  * dress(t1)
-
 
 
 res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * (VEr_au**2) + 1j*(Er_au))) \
                            * IR_during(t2)
 
+# keywords of the outer Romberg integrals: these integrals are orders of magnitude smaller than the
+# default absolute tolerance of 1.48e-8 (false convergence after a few levels), so only rtol is used
+romb_opts = {'tol': 0., 'divmax': 16}
+
 if (integ == 'romberg'):
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
+    res_inner = lambda t1: ci.complex_romberg(res_inner_fun, t1, t_au)
 elif (integ == 'quadrature'):
     res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
 elif (integ == 'analytic'):
@@ -368,8 +362,8 @@ Er_a_au = tmpEr
 #print "E_fin_au_1 = ", E_fin_au_1
 print "Er_a_au = ", sciconv.hartree_to_ev(Er_a_au)
 
-# initiate array of tuples
-res_tuples = []
+# running sums of the resonance amplitudes created at the earlier time steps
+res_hist = res_history.ResonanceHistory(len(Ekins2))
 
 #---------------------------------------------
 n = 0
@@ -377,15 +371,12 @@ n = 0
 outfile.write('first timestep \n')
 print 'first timestep'
 
-outlines = []
-squares = np.array([])
 E_kin_au = E_min_au
 
 t_s = sciconv.atu_to_second(t_au)
 print 't_s = ', sciconv.atu_to_second(t_au)
 outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 t_s = sciconv.atu_to_second(t_au)
-movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
 E_fin_laser_au = E_fin_au_1
 Er_laser_au = Er_a_au
@@ -421,14 +412,14 @@ while (E_kin_au <= E_max_au):
             Er_au = Er_a_au
             VEr_au = VEr_au_1
 
-            I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-            res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
+            I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au, **romb_opts)
+            res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au, **romb_opts)
     
             dir_J1 = prefac_dir1 * I1
             res_J1 = prefac_res1 * res_I
             indir_J1 = prefac_indir1 * res_I
 
-        res_tuples.append(tuple((n,res_J1, indir_J1, E_fin_au)))
+        res_hist.add(E_index, n, res_J1, indir_J1, E_fin_au)
 
         J = (0
              + dir_J1
@@ -437,16 +428,12 @@ while (E_kin_au <= E_max_au):
              )
 
         square = np.absolute(J)**2
-        squares = np.append(squares, square)
-
-        string = in_out.prep_output(square, E_kin_au, t_au)
-        outlines.append(string)
+        spec_out.add(square, E_kin_au)
     
     E_kin_au = E_kin_au + E_step_au
     E_index = E_index + 1
 
-in_out.doout_1f(pure_out, outlines)
-in_out.doout_movie(movie_out, outlines)
+squares = spec_out.write(t_au)
 max_pos = argrelextrema(squares, np.greater)[0]
 if (len(max_pos > 0)):
     for i in range (0, len(max_pos)):
@@ -463,15 +450,12 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
 
     t_s = sciconv.atu_to_second(t_au)
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
     E_fin_laser_au = E_fin_au_1
     Er_laser_au = Er_a_au
@@ -516,14 +500,23 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
                 Er_au = Er_a_au
                 VEr_au = VEr_au_1
     
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
+                # one-element tuples, indexed like the results of complex_quadrature
+                I1 = (ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au, **romb_opts),)
+                Ires = (ci.complex_romberg(part1_integral, (-TX_au/2), t_au, **romb_opts),)
+                resstate1 = part1const(Er_au, VEr_au, E_kin_au, E_fin_au, t_au) \
+                            * (prefac_res1 + prefac_indir1)
+                if (n!=1):
+                    resstate2 = part2const(Er_au, VEr_au,
+                                           E_kin_au, E_fin_au, timestep_au, n, t1min) \
+                                * (prefac_res1 + prefac_indir1)
+                else:
+                    resstate2 = part2const_1st(Er_au, VEr_au, E_kin_au,
+                                               E_fin_au, timestep_au, n) \
+                                * (prefac_res1 + prefac_indir1)
+    
+                dir_J1 = prefac_dir1 * I1[0] * np.exp(-1j * (E_kin_au + T_K + E_fin_au) * t_au)
     
-            res_tuples.append(tuple((n,resstate1, resstate2, T_K + E_fin_au)))
+            res_hist.add(E_index, n, resstate1, resstate2, T_K + E_fin_au)
             
             J = dir_J1
             #J = 0
@@ -542,30 +535,17 @@ while ((t_au <= 0) and (t_au <= tmax_au)):
             #    #square = square + np.absolute(new_part + dir_J1)**2
     
             #square = np.absolute(J)**2
-            for time in range(0,n+1):
-                first = res_tuples[len(Ekins1)*time + E_index][1] * Ires[0]
-                if (time !=1):
-                    sec = res_tuples[len(Ekins1)*time + E_index][2] * Ires[0]
-                else:
-                    sec = res_tuples[len(Ekins1)*time + E_index][2] * I1[0]
-                new_part = (first - sec) \
-                           * np.exp(-1j * t_au * (E_kin_au
-                                    + res_tuples[len(Ekins1*time) + E_index][3]))
-                J = J + new_part
-                #-------------------------------------------------------------------
+            J = J + res_hist.coherent_sum(E_index, t_au, E_kin_au, Ires[0], I1[0])
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
             outfile.write("n, Ekin, Jres = " + str(n) + '  ' + str(E_kin_au) + '  ' + str(J)+'\n')
         
         E_kin_au = E_kin_au + E_step_au
         E_index = E_index + 1
     
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -583,8 +563,6 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print 'during the first pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
@@ -592,7 +570,6 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     outfile.write('t_au = ' + str(t_au) + '\n')
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
 
     Vplus   = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0+grad_delta)
     Vminus  = potentials.expr6(V_RICD_in_a,V_RICD_in_b,V_RICD_in_c,V_RICD_in_d,R0-grad_delta)
@@ -651,50 +628,45 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
                          * np.exp(-1j * (E_kin_au + E_fin_au_ini) * t_au)
     
             elif (integ_outer == "romberg"):
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
+                # one-element tuples, indexed like the results of complex_quadrature
+                I1 = (ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au, **romb_opts),)
+                Ires = (ci.complex_romberg(part1_integral, (-TX_au/2), t_au, **romb_opts),)
+                resstate1 = part1const(Er_au, VEr_au, E_kin_au, E_fin_au, t_au) \
+                            * (prefac_res1 + prefac_indir1)
+                if (n!=1):
+                    resstate2 = part2const(Er_au, VEr_au,
+                                           E_kin_au, E_fin_au, timestep_au, n, t1min) \
+                                * (prefac_res1 + prefac_indir1)
+                else:
+                    resstate2 = part2const_1st(Er_au, VEr_au, E_kin_au,
+                                               E_fin_au, timestep_au, n) \
+                                * (prefac_res1 + prefac_indir1)
+    
+                dir_J1 = prefac_dir1 * I1[0] \
+                         * np.exp(-1j * (E_kin_au + E_fin_au_ini) * t_au)
     
             #res_tuples.append(tuple((n,resstate1, resstate2, T_K + E_fin_au)))
             if (E_res_R >= E_fin_R):
-                res_tuples.append(tuple((n,resstate1, resstate2, T_K + E_fin_au)))
+                res_hist.add(E_index, n, resstate1, resstate2, T_K + E_fin_au, coherent=False)
             else:
-                res_tuples.append(tuple((n,0, 0, T_K + E_fin_au)))
+                res_hist.add(E_index, n, 0, 0, T_K + E_fin_au, coherent=False)
             
             J = dir_J1
             square = 0
-            for time in range(0,n+1):
-                first = res_tuples[len(Ekins1)*time + E_index][1] * Ires[0]
-                if (time !=1):
-                    sec = res_tuples[len(Ekins1)*time + E_index][2] * Ires[0]
-                else:
-                    sec = res_tuples[len(Ekins1)*time + E_index][2] * I1[0]
-                new_part = (first - sec) \
-                           * np.exp(-1j * t_au * (E_kin_au
-                                    + res_tuples[len(Ekins1*time) + E_index][3]))
-                if (time < n_limit):
-                    J = J + new_part
-                else:
-                #-------------------------------------------------------------------
-                    square = square + np.absolute(new_part + dir_J1)**2
+            J = J + res_hist.coherent_sum(E_index, t_au, E_kin_au, Ires[0], I1[0])          # steps before n_limit
+            square = square + res_hist.incoherent_sum(E_index, t_au, E_kin_au, Ires[0], I1[0], dir_J1)
     
             square = square + np.absolute(J)**2
             #square = np.absolute(J)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
             outfile.write("n, Ekin, Jres = " + str(n) + '  ' + str(E_kin_au) + '  ' + str(J)+'\n')
         
         E_kin_au = E_kin_au + E_step_au
         E_index = E_index + 1
     
     
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -720,12 +692,9 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
     outfile.write('between the pulses \n')
     print 'between the pulses'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 
@@ -787,18 +756,28 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
                          * np.exp(-1j * (E_kin_au + E_fin_au_ini) * t_au)
             
             elif (integ_outer == "romberg"):
-                I1 = ci.complex_romberg(fun_t_TX2_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
-        
-                dir_J1 = prefac_dir1 * I1
-                res_J1 = prefac_res1 * res_I
-                indir_J1 = prefac_indir1 * res_I
+                # one-element tuples, indexed like the results of complex_quadrature
+                I1 = (ci.complex_romberg(fun_t_TX2_1, (-TX_au/2), TX_au/2, **romb_opts),)
+                Ires = (ci.complex_romberg(part1_integral, (-TX_au/2), TX_au/2, **romb_opts),)
+                resstate1 = part1const(Er_au, VEr_au, E_kin_au, E_fin_au, t_au) \
+                            * (prefac_res1 + prefac_indir1)
+                if (n!=1):
+                    resstate2 = part2const(Er_au, VEr_au,
+                                           E_kin_au, E_fin_au, timestep_au, n, t1min) \
+                                * (prefac_res1 + prefac_indir1)
+                else:
+                    resstate2 = part2const_1st(Er_au, VEr_au, E_kin_au,
+                                               E_fin_au, timestep_au, n) \
+                                * (prefac_res1 + prefac_indir1)
+    
+                dir_J1 = prefac_dir1 * I1[0] \
+                         * np.exp(-1j * (E_kin_au + E_fin_au_ini) * t_au)
     
             #res_tuples.append(tuple((n,resstate1, resstate2, T_K + E_fin_au)))
             if (E_res_R >= E_fin_R):
-                res_tuples.append(tuple((n,resstate1, resstate2, T_K + E_fin_au)))
+                res_hist.add(E_index, n, resstate1, resstate2, T_K + E_fin_au, coherent=False)
             else:
-                res_tuples.append(tuple((n,0, 0, T_K + E_fin_au)))
+                res_hist.add(E_index, n, 0, 0, T_K + E_fin_au, coherent=False)
             
             J = dir_J1
             #J = 0
@@ -817,34 +796,18 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
             #    square = square + np.absolute(new_part + dir_J1)**2
     
             #square = np.absolute(J)**2
-            for time in range(0,n+1):
-                first = res_tuples[len(Ekins1)*time + E_index][1] * Ires[0]
-                if (time !=1):
-                    sec = res_tuples[len(Ekins1)*time + E_index][2] * Ires[0]
-                else:
-                    sec = res_tuples[len(Ekins1)*time + E_index][2] * I1[0]
-                new_part = (first - sec) \
-                           * np.exp(-1j * t_au * (E_kin_au
-                                    + res_tuples[len(Ekins1*time) + E_index][3]))
-                if (time < n_limit):
-                    J = J + new_part
-                else:
-                #-------------------------------------------------------------------
-                    square = square + np.absolute(new_part + dir_J1)**2
+            J = J + res_hist.coherent_sum(E_index, t_au, E_kin_au, Ires[0], I1[0])          # steps before n_limit
+            square = square + res_hist.incoherent_sum(E_index, t_au, E_kin_au, Ires[0], I1[0], dir_J1)
     
             square = square + np.absolute(J)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
         E_index = E_index + 1
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -865,12 +828,9 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     outfile.write('during the second pulse \n')
     print 'during the second pulse'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     rdg_decay_au = np.sqrt(N0) \
@@ -946,13 +906,11 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                 VEr_au = V_res_R
     
                 res_I = ci.complex_romberg(second_outer_fun, (- a),
-                                                             (t_au - delta_t_au))
+                                                             (t_au - delta_t_au), **romb_opts)
                 res_J2   = prefac_res2 * res_I
     
             square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
 
         elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
@@ -981,8 +939,8 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                 Er_au = E_res_RICD
                 VEr_au = V_res_RICD
 
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
-                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
+                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2, **romb_opts)
+                res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2, **romb_opts)
         
                 dir_J1 = prefac_dir1 * I1
                 res_J1 = prefac_res1 * res_I
@@ -995,16 +953,13 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                  )
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -1025,12 +980,9 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
     outfile.write('after the pulses \n')
     print 'after the pulses'
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print 't_s = ', sciconv.atu_to_second(t_au)
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
 
@@ -1083,14 +1035,12 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
                 VEr_au = V_res_R
     
                 res_I = ci.complex_romberg(second_outer_fun, (- a),
-                                                             (a))
+                                                             (a), **romb_opts)
                 res_J2   = prefac_res2 * res_I
     
             square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
         elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
             if (integ_outer == "quadrature"):
@@ -1115,22 +1065,18 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
                 Er_au = E_res_RICD
                 VEr_au = V_res_RICD
 
-                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
+                I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2, **romb_opts)
     
                 dir_J1 = prefac_dir1 * I1
     
             square = np.absolute(dir_J1)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
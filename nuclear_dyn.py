@@ -18,16 +18,17 @@ import argparse
 from datetime import datetime
 import dill
 import mpmath as mp
+import multiprocessing
 import numpy as np
 from os import devnull
-import scipy
-import scipy.integrate as integrate
 from scipy.signal import argrelextrema
 import sys
 import warnings
 
-import complex_integration as ci
+import amplitudes as amp
+import fc_cache
 import in_out
+import pulses
 import sciconv
 import wellenfkt as wf
 
@@ -74,12 +75,47 @@ parser.add_argument('-F', '--FC', help='''Same as '-f' and '--fc', but for an ad
                     res-fin integrals with and without Gamma(R) dependence, the block with Gamma(R) must be deleted.
                     +++ This option is only available if partial_GamR is not None.''')
 #                    +++ This option is only available in combination with the -p/--partial option.''')
+parser.add_argument('-c', '--cumulative', action='store_true', help='''If this flag is given, the outer time integrals
+                    are not recalculated from the start of the XUV pulse at each time step. Instead, only the new interval
+                    (t_previous, t) is integrated and added to the stored integrals up to t_previous
+                    (only relevant for the numerical integ_outer schemes; with romberg the tolerance rtol refers to
+                    the accumulated integrals).''')
+parser.add_argument('--fc-cache', metavar='FILE', help='''Persistent store (sqlite file) of Franck-Condon overlap integrals.
+                    Overlaps computed before with the same potentials, integration bounds and Gamma(R) are read from it,
+                    only missing ones are calculated (and added). Only the overlaps calculated by mpmath quadrature are
+                    stored, i.e. those of --fc-engine mpmath and of hypfree final states; for these the store
+                    fc_cache.sqlite in the run directory is used by default. It does nothing for the grid engine
+                    (the default), which is faster than reading the overlaps from the store.''')
+parser.add_argument('--no-fc-cache', action='store_true', help='Do not use the Franck-Condon overlap store (overrides --fc-cache).')
+parser.add_argument('--fc-engine', choices=['grid', 'mpmath'], default='grid', help='''Calculation of the overlap integrals
+                    between Morse states: 'grid' tabulates all eigenfunctions on one Gauss-Legendre grid in R and forms all overlaps
+                    as matrix products, 'mpmath' does one mpmath quadrature per overlap. For the hyperbel final state
+                    the Coulomb functions are tabulated on the same grid; overlaps with hypfree final states always use mpmath.
+                    The grid overlaps with the lowest and highest quantum numbers of each block are checked against mpmath:
+                    a relative deviation above 1E-6 gives a warning, above 1E-3 the programme is terminated.''')
+parser.add_argument('--fc-check', action='store_true', help='''Print every overlap compared in the check of the grid engine
+                    against mpmath (otherwise only the largest deviation is printed).''')
+parser.add_argument('--no-fc-check', action='store_true', help='''Skip the check of the grid engine against mpmath
+                    (one mpmath quadrature for up to four overlaps per block).''')
+parser.add_argument('--workers', type=int, default=1, help='''Number of processes (at least 1) among which the E_kin x E_p grid
+                    is split. The results are merged in the original order.''')
+parser.add_argument('--output-format', choices=['text', 'npz', 'hdf5', 'npy-mmap'], default='text',
+                    help='''Format of the spectrum and of the wavepacket projections. 'text' writes full.dat, movie.dat and
+                    wp_res.dat; the binary formats store |J|**2 on the (t, E_kin, E_p) grid and the projections (t, lambda, E_p)
+                    as typed arrays in full.npz, full.h5 (needs h5py) or the memory-mapped full_*.npy files, appended at
+                    every time step (npz: written at the end). convert_output.py restores the text files.''')
+parser.add_argument('--wp-mpmath', action='store_true', help='''Calculate the projections of the wavepacket in the resonance
+                    state (wp_res.dat) point by point with mpmath instead of the vectorized Faddeeva-function form
+                    (high-precision check; only for the convoluted Gaussian XUV pulse, the other pulses always
+                    use the Gauss-Legendre outer integrals).''')
 #parser.add_argument('-w', '--wavepacket_only', action='store_true', help='''If this flag is given, only the projection
 #                    onto the vibrational states of the electronic resonance state (needed to reconstruct
 #                    the wavepacket in the resonance state) will be calculated, whereas the calculation of the projections
 #                    onto the final state (needed for the spectrum) will be skipped. Also, progress will be written
 #                    to eldest.out as usual, but existing full.dat and movie.dat files will not be altered.''')
 args = parser.parse_args()
+if (args.workers < 1):
+    parser.error('argument --workers: has to be at least 1')
 
 print(str(dt_start))
 outfile.write(str(dt_start) + '\n')
@@ -98,7 +134,7 @@ Xshape = 'convoluted'
 # (see next section for explanations of most symbols)
 # ( * X_sinsq, X_gauss are simply Booleans, created by in_out from X_shape)
 # ( * phi is the phase for the IR pulse potential cosine-oscillation, a remnant from PRA 2020)
-# ( * integ, integ_outer are integration schemes: [analytic,] quadrature, romberg)
+# ( * integ, integ_outer are integration schemes: [analytic,] quadrature, romberg[, filon, gauss-legendre]; analytic integ_outer only for convoluted Gaussian pulse, filon and gauss-legendre only for integ_outer)
 # (currently NOT in use: cdg_au, tau_a_s, tau_b_s interact_eV, Lshape, shift_step_s, phi, grad_delta, R_eq_AA, gs_const, res_const)
 # ( * Er_b_eV and E_fin_eV_2 will be converted to au, but these will not be used afterwards)
 # ( * tau_s_2 will be converted to au at this to Gamma, but this will not be used afterwards)
@@ -129,10 +165,11 @@ Xshape = 'convoluted'
 
 #-------------------------------------------------------------------------
 # open further output files
-pure_out = open('full.dat' if not wavepac_only else devnull, mode='w')
-movie_out = open('movie.dat' if not wavepac_only else devnull, mode='w')
+text_output = (args.output_format == 'text')
+pure_out = open('full.dat' if (text_output and not wavepac_only) else devnull, mode='w')
+movie_out = open('movie.dat' if (text_output and not wavepac_only) else devnull, mode='w')
 #popfile = open("pop.dat", mode='w')
-wp_res_out = open('wp_res.dat', mode='w')
+wp_res_out = open('wp_res.dat' if text_output else devnull, mode='w')
 
 def close_files():
     outfile.close
@@ -155,6 +192,10 @@ if partial_GamR:
         print('Additional res-fin overlap integrals without Gamma(R) dependence are calculated from scratch')
         outfile.write('Additional res-fin overlap integrals without Gamma(R) dependence are calculated from scratch\n')
 
+if args.cumulative:
+    print('The outer time integrals are accumulated over the time steps')
+    outfile.write('The outer time integrals are accumulated over the time steps\n')
+
 if wavepac_only:
     print('Only the resonance-state projections will be calculated, not the spectrum (final-state projections)')
     outfile.write('Only the resonance-state projections will be calculated, not the spectrum (final-state projections)' + '\n')
@@ -426,6 +467,15 @@ elif args.gamma:
     V_of_R = lambda R: np.sqrt(Gamma_of_R(R) / (2*np.pi))
 else:                           # For 'external' but from FC file
     V_of_R = lambda R: 1
+V_tag = fc_cache.file_tag(args.gamma) if args.gamma else Gamma_type      # identifies V_of_R in the FC store
+
+fc_path = args.fc_cache
+if (fc_path is None and (args.fc_engine == 'mpmath' or fin_pot_type == 'hypfree')):
+    fc_path = 'fc_cache.sqlite'         # default store wherever mpmath overlaps are calculated
+fc = fc_cache.FCCache(None if (args.no_fc_cache or args.fc) else fc_path)
+if fc.path:
+    print('Franck-Condon overlap store: ' + str(fc.path))
+    outfile.write('Franck-Condon overlap store: ' + str(fc.path) + '\n')
 
 if partial_GamR:
     res_fin_woVR = []
@@ -471,13 +521,17 @@ if not args.fc:                 # If, however, an FC input file is provided, FC
     outfile.write('Hope that is in order.' + '\n')
 
     # calc ground state - resonance state <lambda|kappa>
-    for k in range (0,n_gs_max+1):
-        tmp = []
-        for l in range (0,n_res_max+1):
-            FC = wf.mp_FCmor_mor(l,res_a,res_Req,res_de,red_mass,
-                                 k,gs_a,gs_Req,gs_de,R_min,R_max)
-            tmp.append(FC)
-        gs_res.append(tmp)
+    if (args.fc_engine == 'grid'):
+        gs_res = wf.grid_FCmor_mor(n_res_max,res_a,res_Req,res_de,red_mass,
+                                   n_gs_max,gs_a,gs_Req,gs_de,R_min,R_max).T.tolist()
+    else:
+        for k in range (0,n_gs_max+1):
+            tmp = []
+            for l in range (0,n_res_max+1):
+                FC = fc(wf.mp_FCmor_mor, l,res_a,res_Req,res_de,red_mass,
+                                         k,gs_a,gs_Req,gs_de,R_min,R_max)
+                tmp.append(FC)
+            gs_res.append(tmp)
     
 # read in FCs;      or calc ground state - final state <mu|kappa>   and   resonance state - final state <mu|lambda>
 if (fin_pot_type == 'morse'):
@@ -489,21 +543,30 @@ if (fin_pot_type == 'morse'):
                 outfile.write("gs_res: " + str(gs_res_woVR == gs_res) + ", gs_fin: " + str(gs_fin_woVR == gs_fin) + ", len(res_fin): " + str(len(res_fin) == len(res_fin_woVR)) + "\n")
                 close_files()
                 sys.exit('!!! Files of FC integrals with and without Gamma(R) dependence are incompatible. Programme terminated.')
+    elif (args.fc_engine == 'grid'):
+        gs_fin  = wf.grid_FCmor_mor(n_fin_max,fin_a,fin_Req,fin_de,red_mass,
+                                    n_gs_max,gs_a,gs_Req,gs_de,R_min,R_max).T.tolist()
+        res_fin = wf.grid_FCmor_mor(n_fin_max,fin_a,fin_Req,fin_de,red_mass,
+                                    n_res_max,res_a,res_Req,res_de,R_min,R_max,
+                                    V_of_R=V_of_R).T.tolist()       # Gamma(R) dependence only influences res-fin FC integrals (interaction mediated by V)
+        if partial_GamR:
+            res_fin_woVR = wf.grid_FCmor_mor(n_fin_max,fin_a,fin_Req,fin_de,red_mass,
+                                             n_res_max,res_a,res_Req,res_de,R_min,R_max).T.tolist()
     else:
         for m in range(0,n_fin_max+1):
             for k in range(0,n_gs_max+1):
-                FC = wf.mp_FCmor_mor(m,fin_a,fin_Req,fin_de,red_mass,
-                                     k,gs_a,gs_Req,gs_de,R_min,R_max)
+                FC = fc(wf.mp_FCmor_mor, m,fin_a,fin_Req,fin_de,red_mass,
+                                         k,gs_a,gs_Req,gs_de,R_min,R_max)
                 gs_fin[k].append(FC)
             for l in range(0,n_res_max+1):
-                FC = wf.mp_FCmor_mor(m,fin_a,fin_Req,fin_de,red_mass,
-                                     l,res_a,res_Req,res_de,R_min,R_max,
-                                     V_of_R=V_of_R)      # Gamma(R) dependence only influences res-fin FC integrals (interaction mediated by V)
+                FC = fc(wf.mp_FCmor_mor, m,fin_a,fin_Req,fin_de,red_mass,
+                                         l,res_a,res_Req,res_de,R_min,R_max,
+                                         V_of_R=V_of_R, V_tag=V_tag)      # Gamma(R) dependence only influences res-fin FC integrals (interaction mediated by V)
                 res_fin[l].append(FC)
                 if partial_GamR:
-                    FC = wf.mp_FCmor_mor(m,fin_a,fin_Req,fin_de,red_mass,
-                                         l,res_a,res_Req,res_de,R_min,R_max,
-                                         V_of_R=lambda R: 1)
+                    FC = fc(wf.mp_FCmor_mor, m,fin_a,fin_Req,fin_de,red_mass,
+                                             l,res_a,res_Req,res_de,R_min,R_max,
+                                             V_of_R=lambda R: 1)
                     res_fin_woVR[l].append(FC)
 
 
@@ -527,44 +590,103 @@ elif (fin_pot_type in ('hyperbel','hypfree')):
 
     else:
         FCfunc = wf.mp_FCmor_hyp if (fin_pot_type == 'hyperbel') else wf.mp_FCmor_freehyp
+        grid_hyp = (args.fc_engine == 'grid' and fin_pot_type == 'hyperbel')    # Coulomb final states on the R grid
+        hyp_states = [(n_gs_max,gs_a,gs_Req,gs_de,lambda R: 1), (n_res_max,res_a,res_Req,res_de,V_of_R)]
+        if partial_GamR:
+            hyp_states.append((n_res_max,res_a,res_Req,res_de,lambda R: 1))
+        fc_width = 2*np.pi / np.sqrt(2 * red_mass * max(gs_de, res_de, fin_hyp_a / R_start_EX_max))   # same R grid for the whole scan
+
+        def fc_hyp_chunk(R_starts, store):
+            # FC overlaps of all bound states with the final states of a chunk of R_start values:
+            # [gs_fin, res_fin(, res_fin_woVR)], each (states, len(R_starts))
+            if grid_hyp:
+                return [block.astype(complex) for block in
+                        wf.grid_FC_hyp_blocks(hyp_states,red_mass,fin_hyp_a,fin_hyp_b,R_starts,R_min,R_max,width=fc_width)]
+            blocks = [np.empty((n_max+1, len(R_starts)), dtype=complex) for n_max, *_ in hyp_states]
+            for j, R_start in enumerate(R_starts):
+                for block, (n_max,alpha,Req,De,V), tag in zip(blocks, hyp_states, ['const', V_tag, 'const']):
+                    for n in range(0,n_max+1):
+                        block[n,j] = store(FCfunc, n,alpha,Req,De,red_mass,
+                                                   fin_hyp_a,fin_hyp_b,R_start,R_min,R_max,
+                                                   V_of_R=V, V_tag=tag)
+            return blocks
+
+        def fc_hyp_chunk_worker(R_starts):
+            # fc_hyp_chunk in a worker process, with its own connection to the FC store
+            store = fc_cache.FCCache(fc.path)
+            blocks = fc_hyp_chunk(R_starts, store)
+            store.close()
+            return blocks, store.hits, store.misses
+
+        # The R_start values are processed in rounds of n_workers chunks, evaluated concurrently; the stop criterion is then
+        # applied to the results in the order of R_start, so the outcome is the same as for a scan one R_start at a time.
+        n_workers = args.workers
+        n_scan = 16 if grid_hyp else 1  # R_start values per chunk
+        if (n_workers > 1):
+            pool = multiprocessing.get_context('fork').Pool(n_workers)
+        cap = 256                       # preallocated length of the scan arrays, doubled when needed
+        R_starts = np.empty(cap)
+        fin_blocks = [np.empty((n_max+1, cap), dtype=complex) for n_max, *_ in hyp_states]
+        n_mu = 0
         Req_max = max(gs_Req, res_Req)
         R_start = R_start_EX_max        # Initialize R_start at the lowest considered value (then increase R_start by a constant R_hyp_step)
         thresh_flag = -1                # Initialize flag for FC-calc stop. Counts how often in a (mu) row all FC fall below threshold
         while (thresh_flag < 3):        # Stop FC calc if all |FC| < threshold for 3 consecutive mu
-            E_mu = fin_hyp_a / R_start
-            E_mus.insert(0,E_mu)        # Present loop starts at high energies, but these shall get high mu numbers = stand at the end of the lists -> fill lists from right to left
-            print(f'--- R_start = {R_start:7.4f} au = {sciconv.bohr_to_angstrom(R_start):7.4f} A   ###   E_mu = {E_mu:7.5f} au = {sciconv.hartree_to_ev(E_mu):7.4f} eV   ###   steps: {int((R_start - R_start_EX_max) / R_hyp_step  + 0.1)}')    #?
-    #        outfile.write(f'R_start = {R_start:5.5f} au = {sciconv.bohr_to_angstrom(R_start):5.5f} A, E_mu = {E_mu:5.5f} au = {sciconv.hartree_to_ev(E_mu):5.5f} eV, steps: {int((R_start - R_start_EX_max) / R_hyp_step  + 0.1)}\n')  #?
-            for k in range(0,n_gs_max+1):
-                FC = FCfunc(k,gs_a,gs_Req,gs_de,red_mass,
-                            fin_hyp_a,fin_hyp_b,R_start,R_min,R_max)
-                gs_fin[k].insert(0,FC)
-                print(f'k = {k}, gs_fin  = {FC: 10.10E}, |gs_fin|  = {np.abs(FC):10.10E}')   #?
-    #            outfile.write(f'k = {k}, gs_fin  = {FC: 10.10E}, |gs_fin|  = {np.abs(FC):10.10E}\n')   #?
-            for l in range(0,n_res_max+1):
-                FC = FCfunc(l,res_a,res_Req,res_de,red_mass,
-                            fin_hyp_a,fin_hyp_b,R_start,R_min,R_max,
-                            V_of_R=V_of_R)
-                res_fin[l].insert(0,FC)
-                print(f'l = {l}, res_fin = {FC: 10.10E}, |res_fin| = {np.abs(FC):10.10E}')   #?
-    #            outfile.write(f'l = {l}, res_fin = {FC: 10.10E}, |res_fin| = {np.abs(FC):10.10E}\n')   #?
-                if partial_GamR:
-                    FC = FCfunc(l,res_a,res_Req,res_de,red_mass,
-                                fin_hyp_a,fin_hyp_b,R_start,R_min,R_max,
-                                V_of_R=lambda R: 1)
-                    res_fin_woVR[l].insert(0,FC)
-                    print(f'l = {l}, res_fin_woVR = {FC: 10.10E}, |res_fin_woVR| = {np.abs(FC):10.10E}')   #?
-    #               outfile.write(f'l = {l}, res_fin_woVR = {FC: 10.10E}, |res_fin_woVR| = {np.abs(FC):10.10E}\n')   #?
-            if (R_start > Req_max):         # Do not stop FC calc as long as R_start has not surpassed all Req
-                if (all(np.abs( gs_fin[k][0]) < threshold for k in range(0, n_gs_max+1)) and
-                    all(np.abs(res_fin[l][0]) < threshold for l in range(0,n_res_max+1)) ): # To keep consistency, the res_fin_woVR are not included in this check
-                    if (thresh_flag != -1):     # -1 can only occur at lowest R_start values (once any FC > threshold: flag is set to 0, then stays >= 0) -> dont stop calc right at start just bc FC are small there
-                        thresh_flag = thresh_flag + 1
-                else:
-                    thresh_flag = 0         # If any FC overlap > threshold, reset flag -> only (mu-)consecutive threshold check passes shall stop calc
-            print(f'thresh_flag = {thresh_flag}')                                                                               #?
-    #        outfile.write(f'thresh_flag = {thresh_flag}\n')                                                                               #?
-            R_start = R_start + R_hyp_step
+            chunks = []
+            for c in range(n_workers):
+                chunk = []
+                for j in range(n_scan):
+                    chunk.append(R_start)
+                    R_start = R_start + R_hyp_step
+                chunks.append(chunk)
+            if (n_workers > 1):
+                results = pool.map(fc_hyp_chunk_worker, chunks)
+                fc.hits   += sum(res[1] for res in results)
+                fc.misses += sum(res[2] for res in results)
+                results = [res[0] for res in results]
+            else:
+                results = [fc_hyp_chunk(chunk, fc) for chunk in chunks]
+            for chunk, blocks in zip(chunks, results):
+                for j, R_mu in enumerate(chunk):
+                    if (thresh_flag >= 3):
+                        break
+                    if (n_mu == cap):
+                        cap = 2 * cap
+                        R_starts = np.resize(R_starts, cap)
+                        fin_blocks = [np.concatenate((arr, np.empty_like(arr)), axis=1) for arr in fin_blocks]
+                    R_starts[n_mu] = R_mu
+                    for arr, block in zip(fin_blocks, blocks):
+                        arr[:,n_mu] = block[:,j]
+                    E_mu = fin_hyp_a / R_mu
+                    print(f'--- R_start = {R_mu:7.4f} au = {sciconv.bohr_to_angstrom(R_mu):7.4f} A   ###   E_mu = {E_mu:7.5f} au = {sciconv.hartree_to_ev(E_mu):7.4f} eV   ###   steps: {int((R_mu - R_start_EX_max) / R_hyp_step  + 0.1)}')    #?
+                    for k in range(0,n_gs_max+1):
+                        FC = fin_blocks[0][k,n_mu]
+                        print(f'k = {k}, gs_fin  = {FC: 10.10E}, |gs_fin|  = {np.abs(FC):10.10E}')   #?
+                    for l in range(0,n_res_max+1):
+                        FC = fin_blocks[1][l,n_mu]
+                        print(f'l = {l}, res_fin = {FC: 10.10E}, |res_fin| = {np.abs(FC):10.10E}')   #?
+                        if partial_GamR:
+                            FC = fin_blocks[2][l,n_mu]
+                            print(f'l = {l}, res_fin_woVR = {FC: 10.10E}, |res_fin_woVR| = {np.abs(FC):10.10E}')   #?
+                    if (R_mu > Req_max):            # Do not stop FC calc as long as R_start has not surpassed all Req
+                        if (np.all(np.abs(fin_blocks[0][:,n_mu]) < threshold) and
+                            np.all(np.abs(fin_blocks[1][:,n_mu]) < threshold) ): # To keep consistency, the res_fin_woVR are not included in this check
+                            if (thresh_flag != -1):     # -1 can only occur at lowest R_start values (once any FC > threshold: flag is set to 0, then stays >= 0) -> dont stop calc right at start just bc FC are small there
+                                thresh_flag = thresh_flag + 1
+                        else:
+                            thresh_flag = 0         # If any FC overlap > threshold, reset flag -> only (mu-)consecutive threshold check passes shall stop calc
+                    print(f'thresh_flag = {thresh_flag}')                                                                               #?
+                    n_mu = n_mu + 1
+        if (n_workers > 1):
+            pool.close()
+            pool.join()
+
+        # The scan starts at high energies, but these shall get high mu numbers = stand at the end of the lists
+        E_mus = list(fin_hyp_a / R_starts[n_mu-1::-1])
+        gs_fin  = fin_blocks[0][:,n_mu-1::-1].tolist()
+        res_fin = fin_blocks[1][:,n_mu-1::-1].tolist()
+        if partial_GamR:
+            res_fin_woVR = fin_blocks[2][:,n_mu-1::-1].tolist()
 
         # Enforce FC sum rule: for a bound vibr state |b> (b=kappa,lambda), int_0^inf dEmu <b|mu><mu|b> = 1, or discretized, sum_Emu DeltaE <b|mu><mu|b> = 1, i. e. sum_Rmu = DeltaR Va/Rmu^2 <b|mu><mu|b> = 1
     #    norm_fin_gs = []        # Current values of the sum_Rmu with |b> = |kappa>
@@ -594,6 +716,45 @@ elif (fin_pot_type in ('hyperbel','hypfree')):
                     break
         n_fin_max_X = len(E_mus) - 1                            # Will be used in hyperbel/hypfree case as the very highest nmu
 
+if (args.fc_engine == 'grid' and not args.fc and not args.no_fc_check):     # spot check of the grid engine against mpmath
+    # (name, block, mpmath overlap for block[b][a]); the first and last entry of the first and last row of each block are checked
+    checks = [('gs-res ', gs_res,  lambda b, a: wf.mp_FCmor_mor(a,res_a,res_Req,res_de,red_mass,b,gs_a,gs_Req,gs_de,R_min,R_max))]
+    if (fin_pot_type == 'morse'):
+        checks.append(('gs-fin ', gs_fin,  lambda b, a: wf.mp_FCmor_mor(a,fin_a,fin_Req,fin_de,red_mass,b,gs_a,gs_Req,gs_de,R_min,R_max)))
+        checks.append(('res-fin', res_fin, lambda b, a: wf.mp_FCmor_mor(a,fin_a,fin_Req,fin_de,red_mass,b,res_a,res_Req,res_de,R_min,R_max,
+                                                                      V_of_R=V_of_R)))
+    elif (fin_pot_type == 'hyperbel'):     # index mu of gs_fin, res_fin belongs to R_start = R_start_EX_max + (n_fin_max_X - mu) * R_hyp_step
+        checks.append(('gs-fin ', gs_fin,  lambda b, a: wf.mp_FCmor_hyp(b,gs_a,gs_Req,gs_de,red_mass,fin_hyp_a,fin_hyp_b,
+                                                                      R_start_EX_max + (n_fin_max_X - a) * R_hyp_step,R_min,R_max)))
+        checks.append(('res-fin', res_fin, lambda b, a: wf.mp_FCmor_hyp(b,res_a,res_Req,res_de,red_mass,fin_hyp_a,fin_hyp_b,
+                                                                      R_start_EX_max + (n_fin_max_X - a) * R_hyp_step,R_min,R_max,
+                                                                      V_of_R=V_of_R)))
+    print('Check of the grid FC overlaps against mpmath')
+    outfile.write('Check of the grid FC overlaps against mpmath' + '\n')
+    fc_dev = 0.             # largest deviation, relative to the largest overlap of the respective block
+    for name, block, mp_FC in checks:
+        scale = max(abs(FC) for row in block for FC in row) or 1.
+        for b in sorted({0, len(block)-1}):
+            for a in sorted({0, len(block[b])-1}):
+                FC = mp_FC(b, a)
+                fc_dev = max(fc_dev, abs(block[b][a] - FC) / scale)
+                if args.fc_check:
+                    print(f'{name} {b:4d} {a:5d}  grid = {block[b][a]: 14.10E}  mpmath = {FC: 14.10E}  diff = {abs(block[b][a] - FC): 9.2E}')
+                    outfile.write(f'{name} {b:4d} {a:5d}  grid = {block[b][a]: 14.10E}  mpmath = {FC: 14.10E}  diff = {abs(block[b][a] - FC): 9.2E}\n')
+    print(f'Largest relative deviation of the grid FC overlaps from mpmath: {fc_dev:9.2E}')
+    outfile.write(f'Largest relative deviation of the grid FC overlaps from mpmath: {fc_dev:9.2E}\n')
+    if (fc_dev > 1E-3):
+        close_files()
+        sys.exit('!!! The grid FC overlaps deviate from mpmath by more than 1E-3. Use --fc-engine mpmath. Programme terminated.')
+    elif (fc_dev > 1E-6):
+        print('!!! Warning: the grid FC overlaps deviate from mpmath by more than 1E-6, consider --fc-engine mpmath')
+        outfile.write('!!! Warning: the grid FC overlaps deviate from mpmath by more than 1E-6, consider --fc-engine mpmath\n')
+
+if (fc.hits + fc.misses > 0):
+    print('FC overlaps taken from the store:', fc.hits, ', newly calculated:', fc.misses)
+    outfile.write('FC overlaps taken from the store: ' + str(fc.hits) + ', newly calculated: ' + str(fc.misses) + '\n')
+fc.close()
+
 # print FC integrals
 #   gs-res
 print()
@@ -748,76 +909,21 @@ in_out.check_input(Er_au, E_fin_au, Gamma_au,
                    tmax_au, timestep_au, E_step_au)
 #-------------------------------------------------------------------------
 # physical definitions of functions
-# functions for the shape of the XUV pulse
+# functions for the shape of the XUV pulse (see pulses.py; array in, array out)
 if (X_sinsq):
     print('use sinsq function')
-    f_t1  = lambda t1: 1./4 * ( np.exp(2j * np.pi * (t1 + TX_au/2) / TX_au) # There should be a minus sign in front [from (1/2i)**2]
-                          + 2                                               # & this 2 be negative [sin**2 = (exp - exp*)**2 = exp**2 - 2 exp exp* + (exp*)**2]
-                          + np.exp(-2j * np.pi * (t1 + TX_au/2) /TX_au) )
-    # fp_t1 = f'(t1)
-    fp_t1 = lambda t1: np.pi/(2j*TX_au) * ( - np.exp(2j*np.pi* (t1 + TX_au/2) / TX_au)  # Accordingly, these signs must be flipped
-                                         + np.exp(-2j*np.pi* (t1 + TX_au/2) / TX_au) )
+    X_pulse = pulses.XUVPulse(A0X, Omega_au, 'sinsq', Xshape, TX_au=TX_au)
 elif (X_gauss):
     print('use gauss function')
-    f_t1  = lambda t1: ( 1./ np.sqrt(2*np.pi * sigma**2)
-                       * np.exp(-t1**2 / (2*sigma**2)))
-    # fp_t1 = f'(t1)
-    fp_t1 = lambda t1: ( -t1 / np.sqrt(2*np.pi) / sigma**3
-                       * np.exp(-t1**2 / (2*sigma**2)))
+    X_pulse = pulses.XUVPulse(A0X, Omega_au, 'gauss', Xshape, sigma=sigma)
 else:
     print('no pulse shape selected')
 
 print()
 
-if (Xshape == 'convoluted'):    # Calculate field strength EX = -(AX fX)'
-    FX_t1 = lambda t1: (
-                        0
-                        - (A0X
-                           * np.cos(Omega_au * t1)
-                           * fp_t1(t1)
-                          )
-                        + (A0X
-                           * Omega_au
-                           * np.sin(Omega_au * t1)
-                           * f_t1(t1)
-                          )
-                       )
-elif (Xshape == 'infinite'):
-    FX_t1 = lambda t1: + A0X * Omega_au * np.cos(Omega_au * t1)
-    #FX_t1 = lambda t1: - A0X * np.sin(Omega_au * t1)
-                       
-
-#-------------------------------------------------------------------------
-# technical definitions of functions (remember: FX is the field strength EX)
-#direct ionization
-fun_t_dir_1 = lambda t1: FX_t1(t1)   * np.exp(1j * E_fin_au * (t1-t_au)) \
-                                     * np.exp(1j * E_kin_au * (t1-t_au))        # Note: before any of these fncts are called, E_fin is redefined to also include E_mu
-fun_TX2_dir_1 = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * (t1-t_au)) \
-                                     * np.exp(1j * E_kin_au * (t1-t_au))        # Same as fun_t_dir_1 - why keep ?
-
-#res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * W_au + 1j*(Er_au))) \
-#                           * IR_during(t2)
-
-if (integ == 'romberg'):                                                        # numerical inner int not possible (res_inner_fun deactivated) ?
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
-elif (integ == 'quadrature'):
-    res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
-elif (integ == 'analytic'):
-    # analytic inner integral
-    res_inner = lambda t1: (1./(1j*(E_kin_au + E_fin_au - Er_au - E_lambda)     # See the above note on E_fin also including E_mu
-                                    - np.pi * W_au)
-                            * (np.exp(t_au * (1j*(E_kin_au + E_fin_au
-                                                  - Er_au - E_lambda)
-                                                  - np.pi * W_au))
-                              - np.exp(t1 * (1j*(E_kin_au + E_fin_au
-                                                 - Er_au - E_lambda)
-                                                  - np.pi * W_au)))
-                            * np.exp(-1j*t_au * (E_kin_au + E_fin_au + E_p_au))
-                           )
-
-res_outer_fun = lambda t1: FX_t1(t1) \
-                           * np.exp(t1 * (np.pi* W_au + 1j*(Er_au + E_lambda + E_p_au))) \
-                           * res_inner(t1)
+f_t1  = X_pulse.f
+fp_t1 = X_pulse.fp              # fp_t1 = f'(t1)
+FX_t1 = X_pulse.FX              # field strength EX = -(AX fX)' (convoluted) or A0X Omega cos(Omega t1) (infinite)
 
 
 # for wavepacket in resonance state
@@ -853,17 +959,23 @@ t_au = -TX_au/2
 
 # construct list of energy points for E_kin (secondary electron)
 Ekins = []
+Ekins_au = []
 E_kin_au = E_min_au
 while (E_kin_au <= E_max_au):
     Ekins.append(sciconv.hartree_to_ev(E_kin_au))
+    Ekins_au.append(E_kin_au)
     E_kin_au = E_kin_au + E_step_au
+Ekins_au = np.array(Ekins_au)
 
 # construct list of energy points for E_p (photoelectron)
 Ep = []
+Eps_au = []
 E_p_au = Ep_min_au
 while (E_p_au <= Ep_max_au):
     Ep.append(sciconv.hartree_to_ev(E_p_au))
+    Eps_au.append(E_p_au)
     E_p_au = E_p_au + Ep_step_au
+Eps_au = np.array(Eps_au)
 
 #-------------------------------------------------------------------------
 # constants / prefactors
@@ -883,6 +995,80 @@ wp_prefs = [(1.j/(n_res_max+1) * rdg_au * gs_res[0][nlambda] \
                + mp.pi/(n_res_max+1) * VEr_au * cdg_au_V * indir_FCsums[nlambda])
             for nlambda in range(n_res_max+1)]
 
+# coefficients of the transition amplitudes on the (E_kin, E_p, mu, lambda) grid (see amplitudes.py)
+if not (integ == 'analytic'):
+    close_files()
+    sys.exit('!!! Only the analytic inner integral is available for the transition amplitudes. Programme terminated.')
+E_fins = E_fin_au_1 + np.array(E_mus[:n_fin_max+1])        # E_fin + E_mu for all considered mu
+dir_coeffs = prefac_dir1 * np.array(gs_fin[0][:n_fin_max+1])
+nondir_coeffs = np.zeros((n_res_max+1, n_fin_max+1), dtype=complex)
+for nlambda in range(n_res_max+1):
+    nmu_max = n_fin_max_list[nlambda] if (fin_pot_type in ('hyperbel','hypfree')) else n_fin_max    # J_nondir,mu,lambda = 0 if repulsive |fin>|mu> lies higher than |res>|lambda>
+    res_fin_pre = res_fin[nlambda] if not partial_GamR == 'exp' else res_fin_woVR[nlambda]
+    nondir_coeffs[nlambda,:nmu_max+1] = ((prefac_res1 * gs_res[0][nlambda] + prefac_indir1 * indir_FCsums[nlambda])
+                                         * np.array(res_fin_pre[:nmu_max+1]))
+if (fin_pot_type in ('hyperbel','hypfree')):
+    mu_weights = R_hyp_step * np.array(E_mus[:n_fin_max+1])**2 / fin_hyp_a      # R-DOS for 'integration' over R_mu instead of [E_]mu
+else:
+    mu_weights = np.ones(n_fin_max+1)
+
+integ_kwargs = {}
+if (integ_outer == 'analytic'):     # closed form of the outer integrals in terms of the Faddeeva function
+    if not (X_gauss and Xshape == 'convoluted'):
+        close_files()
+        sys.exit('!!! The analytic outer integral is only available for the convoluted Gaussian XUV pulse. Programme terminated.')
+    integ_kwargs['gauss'] = (A0X, Omega_au, sigma)
+elif (integ_outer == 'filon'):     # oscillatory quadrature: FX = sum of smooth envelopes times exp(+- i Omega t1)
+    integ_kwargs['envelopes'] = X_pulse.envelopes()
+
+n_chunk = max(1, 2**18 // (len(Eps_au) * (n_fin_max+1)))   # E_kin values per chunk, limits the size of the (E_kin, E_p, mu) arrays
+n_chunk = min(n_chunk, -(-len(Ekins_au) // args.workers))   # at least one chunk per worker
+grids = amp.split_grid(Ekins_au, n_chunk, Eps_au, E_fins, E_lambdas, W_lambda, Er_au,
+                       dir_coeffs, nondir_coeffs, mu_weights, FX_t1, integ_outer, **integ_kwargs)
+workers = amp.GridWorkers(grids, args.workers if not wavepac_only else 1)
+if (workers.nworkers > 1):
+    print('The E_kin grid is split into', len(grids), 'chunks on', workers.nworkers, 'processes')
+    outfile.write('The E_kin grid is split into ' + str(len(grids)) + ' chunks on ' + str(workers.nworkers) + ' processes\n')
+
+def calc_wavepacket(t_au, T_up):
+    # projections wp_pref * wp_res_int of the wavepacket in the resonance state for all lambda and E_p   (lambda, E_p)
+    global E_lambda, W_au, E_p_au
+    if not (X_gauss and Xshape == 'convoluted'):   # no closed form: the outer integrals of the pulse
+        return np.array([complex(pref) for pref in wp_prefs])[:,None] \
+               * amp.wp_res_ints_pulse(t_au, T_up, -TX_au/2, Er_au + np.array(E_lambdas[:n_res_max+1]),
+                                       W_lambda[:n_res_max+1], Eps_au, FX_t1)
+    if not args.wp_mpmath:
+        return np.array([complex(pref) for pref in wp_prefs])[:,None] \
+               * amp.wp_res_ints(t_au, T_up, -TX_au/2, Er_au + np.array(E_lambdas[:n_res_max+1]),
+                                 W_lambda[:n_res_max+1], Eps_au, A0X, Omega_au, sigma)
+    wp_all = np.empty((n_res_max+1, len(Eps_au)), dtype=complex)
+    for nlambda in range (0,n_res_max+1):
+        E_lambda = E_lambdas[nlambda]
+        W_au = W_lambda[nlambda]
+        for n_p, E_p_au in enumerate(Eps_au):
+            wp_all[nlambda,n_p] = complex(wp_prefs[nlambda] * wp_res_int(t_au, T_up))
+    return wp_all
+
+def calc_spectrum(t_au, t_up):
+    # |J|**2 on the whole (E_kin, E_p) grid at time t_au with the outer integrals running up to t_up
+    return workers.squares(t_au, -TX_au/2, t_up, args.cumulative)      # (E_kin, E_p)
+
+
+if not text_output:
+    n_t = 0                     # number of time steps of the two loops below
+    t_count = t_au
+    while ((t_count <= TX_au/2) and (t_count <= tmax_au)):
+        n_t, t_count = n_t + 1, t_count + timestep_au
+    while ((t_count >= TX_au/2) and (t_count <= tmax_au)):
+        n_t, t_count = n_t + 1, t_count + timestep_au
+    res_out = in_out.BinaryOutput(args.output_format, Ekins_au, Eps_au, n_res_max+1, n_t,
+                                  spectrum=not wavepac_only)
+    print('Spectrum and wavepacket projections are written in the format', args.output_format)
+    outfile.write('Spectrum and wavepacket projections are written in the format ' + args.output_format + '\n')
+else:
+    res_out = in_out.TextOutput(pure_out, movie_out, wp_res_out, Ekins_au, Eps_au, n_res_max+1,
+                                spectrum=not wavepac_only)
+
 
 ########################################
 # now follow the integrals themselves, for the temporal phases:
@@ -895,113 +1081,12 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print('during the first pulse')
 
-    outlines = []       # will contain lines containing E_kin, E_p, time and signal intensity
-    squares = np.array([])  # signal intensity ( = |amplitude|**2 = |J|**2 )
-    E_kin_au = E_min_au
-    
     t_s = sciconv.atu_to_second(t_au)
     print('t_s = ', t_s)
     outfile.write('t_s = ' + str(t_s) + '\n')
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
-    cnt = 0     # initialize counter for printing progress
     if not wavepac_only: 
-        while (E_kin_au <= E_max_au):
-            if (cnt == 4):  # print progress: for each E_kin one '-', but for every fifth one '|' instead
-                print('|', end = '', flush = True)
-                cnt = 0
-            else:
-                print('-', end = '', flush = True)
-                cnt = cnt + 1
-            E_p_au = Ep_min_au
-            while (E_p_au <= Ep_max_au):
-                #print(f'{sciconv.hartree_to_ev(E_kin_au):.2} eV')           #?
-                #outfile.write(f'{sciconv.hartree_to_ev(E_kin_au):.2} eV\n') #?
-                p_au = np.sqrt(2*E_kin_au)
-                sum_square = 0      # Total spectrum |J @ E_kin|**2 = sum_mu |J_mu @ E_kin|**2  (sum of contributions of all final states with E_kin); for continuous mu: int ~ sum
-                if t_au==-TX_au/2:
-                    squares = np.append(squares, 0.)
-                    string = in_out.prep_output(0., E_kin_au, t_au, E_p_au)
-                    outlines.append(string)
-                    E_p_au = E_p_au + Ep_step_au
-                    continue
-    
-                for nmu in range (0, n_fin_max + 1):           # loop over all mu, calculate J_mu = J_dir,mu + J_nondir,mu
-                    E_fin_au = E_fin_au_1 + E_mus[nmu]      # E_fin_au_1: inputted electronic E_fin_au, E_mus: vibrational eigenvalues of fin state
-        #                Er_au = Er_a_au
-                    
-                    # Direct term
-                    if (integ_outer == "quadrature"):
-                        I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), t_au)
-                        dir_J1 = prefac_dir1 * I1[0] * gs_fin[0][nmu]        # [0] of quad integ result = integral (rest is est error & info); FC = <mu_n|kappa_0>
-    
-                    elif (integ_outer == "romberg"):
-                        I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), t_au)
-                        dir_J1 = prefac_dir1 * I1 * gs_fin[0][nmu]           # romberg returns only the integral, so no [0] necessary
-                     
-                    # J_nondir,mu = sum_lambda J_nondir,mu,lambda = sum_lambda (J_res,mu,lambda + J_indir,mu,lambda)
-                    J = 0
-                    for nlambda in range (0,n_res_max+1):
-                        if (fin_pot_type in ('hyperbel','hypfree') and nmu > n_fin_max_list[nlambda]):  # J_nondir,mu,lambda = 0 if repulsive |fin>|mu> lies higher than |res>|lambda>
-                            continue
-                        E_lambda = E_lambdas[nlambda]
-                        W_au = W_lambda[nlambda]
-                        if (integ_outer == "quadrature"):
-                            res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), t_au)
-        
-                            if not partial_GamR == 'exp':
-                                res_J1 = (prefac_res1 * res_I[0]
-                                          * gs_res[0][nlambda] * res_fin[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I[0]
-                                            * indir_FCsums[nlambda] * res_fin[nlambda][nmu])
-                            else:
-                                res_J1 = (prefac_res1 * res_I[0]
-                                          * gs_res[0][nlambda] * res_fin_woVR[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I[0]
-                                            * indir_FCsums[nlambda] * res_fin_woVR[nlambda][nmu])
-    
-                        elif (integ_outer == "romberg"):
-                            res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), t_au)
-                        
-                            if not partial_GamR == 'exp':
-                                res_J1 = (prefac_res1 * res_I
-                                          * gs_res[0][nlambda] * res_fin[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I
-                                            * indir_FCsums[nlambda] * res_fin[nlambda][nmu])
-                            else:
-                                res_J1 = (prefac_res1 * res_I
-                                          * gs_res[0][nlambda] * res_fin_woVR[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I
-                                            * indir_FCsums[nlambda] * res_fin_woVR[nlambda][nmu])
-        
-                        J = (J
-                             + res_J1
-                             + indir_J1
-                             )
-        
-                    # Total trs prob (@E_kin, t) = sum_mu |J_mu|**2
-                    # For cont rep fin: int (dE_mu |J_mu|**2 E-DOS(E_mu)) = int (dR_mu |J_mu|**2 R-DOS(R_mu))
-                    #   R-DOS = E-DOS * Va / R_mu**2 = E-DOS * E_mu**2 / Va. If E-DOS = 1 & R_hyp_step = const: int (dR_mu |J_mu|**2 R-DOS) ~ sum_mu (R_hyp_step |J_mu|**2 E_mu**2 / Va)
-                    square = np.absolute(J + dir_J1)**2     # |J_mu|**2
-                    if (fin_pot_type in ('hyperbel','hypfree')):
-                        factor = R_hyp_step * E_mus[nmu]**2 / fin_hyp_a
-                        old_square = square
-                        square = square * factor
-                    sum_square = sum_square + square        # |J|**2 = sum_mu |J_mu|**2
-                    #print(f'nmu = {nmu:>3}  f = {factor:.5f}  osq = {old_square:.5E}  sq = {square:.5E}  sum = {sum_square:.5E}')
-                    #outfile.write(f'nmu = {nmu:>3}  f = {factor:.5f}  osq = {old_square:.5E}  sq = {square:.5E}  sum = {sum_square:.5E}\n')
-    
-                squares = np.append(squares, sum_square)
-    
-                string = in_out.prep_output(sum_square, E_kin_au, t_au, E_p_au)     # returns str: E_kin_eV, E_p_eV, t_s, sum_square = intensity
-                outlines.append(string)
-
-                E_p_au = E_p_au + Ep_step_au
-            
-            E_kin_au = E_kin_au + E_step_au     # @ t = const.
-        
-        
-        in_out.doout_1f(pure_out, outlines)     # writes each (E_kin, E_p, t = const, |J|**2) quadruple in a sep line into output file
-        in_out.doout_movie(movie_out, outlines)
+        squares_grid = calc_spectrum(t_au, t_au)
+        squares = squares_grid.ravel()  # signal intensity ( = |amplitude|**2 = |J|**2 ), E_p running fastest
         print()
         max_pos = argrelextrema(squares, np.greater)[0]      # finds position of relative (i. e. local) maxima of |J|**2 in an array
         if (len(max_pos > 0)):                               # if there are such:
@@ -1010,20 +1095,8 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
                 outfile.write(str(Ekins[max_pos[i] // len(Ep)]) + '  ' + str(Ep[max_pos[i] % len(Ep)]) + '  ' + str(squares[max_pos[i]]) + '\n')
     
     # wavepacket in resonance state(s)
-    wp_ampls = []
-    for nlambda in range (0,n_res_max+1):
-        E_lambda = E_lambdas[nlambda]
-        W_au = W_lambda[nlambda]
-        wp_pref = wp_prefs[nlambda] 
-        E_p_au = Ep_min_au
-        while (E_p_au <= Ep_max_au):
-            wp_I = wp_res_int(t_au,t_au)
-            wp_ampl = wp_pref * wp_I
-            wp_string = format(nlambda, 'd') + '   ' + format(sciconv.hartree_to_ev(E_p_au), '>8.5f') + '   ' + '   ' + format(sciconv.atu_to_second(t_au), ' .18f') \
-                    + '   ' + format(complex(wp_ampl), ' .15e')
-            wp_ampls.append(wp_string)
-            E_p_au = E_p_au + Ep_step_au
-    in_out.doout_1f(wp_res_out, wp_ampls)
+    wp_all = calc_wavepacket(t_au, t_au)                   # (lambda, E_p)
+    res_out.write(t_au, squares_grid if not wavepac_only else None, wp_all)     # full.dat, movie.dat, wp_res.dat or binary; flushed
 
 
     t_au = t_au + timestep_au
@@ -1040,112 +1113,12 @@ while (t_au >= TX_au/2\
 
     # all equal to during-1st-pulse section, except for integrating over entire XUV pulse now
 
-    outlines = []       # will contain lines containing E_kin, E_p, time and signal intensity
-    squares = np.array([])  # signal intensity ( = |amplitude|**2 = |J|**2 )
-    E_kin_au = E_min_au
-    
     t_s = sciconv.atu_to_second(t_au)
     print('t_s = ', t_s)
     outfile.write('t_s = ' + str(t_s) + '\n')
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
-    cnt = 0     # initialize counter for printing progress
     if not wavepac_only: 
-        while (E_kin_au <= E_max_au):
-            if (cnt == 4):  # print progress: for each E_kin one '-', but for every fifth one '|' instead
-                print('|', end = '', flush = True)
-                cnt = 0
-            else:
-                print('-', end = '', flush = True)
-                cnt = cnt + 1
-            E_p_au = Ep_min_au
-            while (E_p_au <= Ep_max_au):
-                #print(f'{sciconv.hartree_to_ev(E_kin_au):.2} eV')           #?
-                #outfile.write(f'{sciconv.hartree_to_ev(E_kin_au):.2} eV\n') #?
-                p_au = np.sqrt(2*E_kin_au)
-                sum_square = 0      # Total spectrum |J @ E_kin|**2 = sum_mu |J_mu @ E_kin|**2  (sum of contributions of all final states with E_kin)
-    
-                for nmu in range (0, n_fin_max + 1):           # loop over all mu, calculate J_mu = J_dir,mu + J_nondir,mu
-                    E_fin_au = E_fin_au_1 + E_mus[nmu]      # E_fin_au_1: inputted electronic E_fin_au, E_mus: vibrational eigenvalues of fin state
-        #                Er_au = Er_a_au
-                    
-                    # Direct term
-                    if (integ_outer == "quadrature"):
-                        I1 = ci.complex_quadrature(fun_t_dir_1, (-TX_au/2), TX_au/2)
-                        dir_J1 = prefac_dir1 * I1[0] * gs_fin[0][nmu]        # [0] of quad integ result = integral (rest is est error & info); FC = <mu_n|kappa_0>
-    #                        print(nmu, gs_fin[0][nmu], dir_J1)   #?
-        
-                    elif (integ_outer == "romberg"):
-                        I1 = ci.complex_romberg(fun_t_dir_1, (-TX_au/2), TX_au/2)
-                        dir_J1 = prefac_dir1 * I1 * gs_fin[0][nmu]           # romberg returns only the integral, so no [0] necessary
-    
-                    # J_nondir,mu = sum_lambda J_nondir,mu,lambda = sum_lambda (J_res,mu,lambda + J_indir,mu,lambda)
-                    J = 0
-                    for nlambda in range (0,n_res_max+1):
-                        if (fin_pot_type in ('hyperbel','hypfree') and nmu > n_fin_max_list[nlambda]):  # J_nondir,mu,lambda = 0 if repulsive |fin>|mu> lies higher than |res>|lambda>
-    #                        print(nmu, nlambda, 'skipped')  #?
-                            continue
-                        E_lambda = E_lambdas[nlambda]
-                        W_au = W_lambda[nlambda]
-                        if (integ_outer == "quadrature"):
-                            res_I = ci.complex_quadrature(res_outer_fun, (-TX_au/2), TX_au/2)
-                            
-                            if not partial_GamR == 'exp':
-                                res_J1 = (prefac_res1 * res_I[0]
-                                          * gs_res[0][nlambda] * res_fin[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I[0]
-                                            * indir_FCsums[nlambda] * res_fin[nlambda][nmu])
-    #                            print(nmu, nlambda, 'res_J1 =', res_J1, 'indir_J1 =', indir_J1)   #?
-                            else:
-                                res_J1 = (prefac_res1 * res_I[0]
-                                          * gs_res[0][nlambda] * res_fin_woVR[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I[0]
-                                            * indir_FCsums[nlambda] * res_fin_woVR[nlambda][nmu])
-    #                            print(nmu, nlambda, 'res_J1 =', res_J1, 'indir_J1 =', indir_J1)   #?
-        
-                        elif (integ_outer == "romberg"):
-                            res_I = ci.complex_romberg(res_outer_fun, (-TX_au/2), TX_au/2)
-                            
-                            if not partial_GamR == 'exp':
-                                res_J1 = (prefac_res1 * res_I
-                                          * gs_res[0][nlambda] * res_fin[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I
-                                            * indir_FCsums[nlambda] * res_fin[nlambda][nmu])
-                            else:
-                                res_J1 = (prefac_res1 * res_I
-                                          * gs_res[0][nlambda] * res_fin_woVR[nlambda][nmu])
-                                indir_J1 = (prefac_indir1 * res_I
-                                            * indir_FCsums[nlambda] * res_fin_woVR[nlambda][nmu])
-    
-    
-                        J = (J
-                             + res_J1
-                             + indir_J1
-                             )
-        
-                    # Total trs prob (@E_kin, t) = sum_mu |J_mu|**2
-                    # For cont rep fin: int (dE_mu |J_mu|**2 E-DOS(E_mu)) = int (dR_mu |J_mu|**2 R-DOS(R_mu))
-                    #   R-DOS = E-DOS * Va / R_mu**2 = E-DOS * E_mu**2 / Va. If E-DOS = 1 & R_hyp_step = const: int (dR_mu |J_mu|**2 R-DOS) ~ sum_mu (R_hyp_step |J_mu|**2 E_mu**2 / Va)
-                    square = np.absolute(J + dir_J1)**2     # |J_mu|**2
-                    if (fin_pot_type in ('hyperbel','hypfree')):
-                        factor = R_hyp_step * E_mus[nmu]**2 / fin_hyp_a
-                        old_square = square
-                        square = square * factor
-                    sum_square = sum_square + square        # |J|**2 = sum_mu |J_mu|**2
-                    #print(f'nmu = {nmu:>3}  f = {factor:.5f}  osq = {old_square:.5E}  sq = {square:.5E}  sum = {sum_square:.5E}')
-                    #outfile.write(f'nmu = {nmu:>3}  f = {factor:.5f}  osq = {old_square:.5E}  sq = {square:.5E}  sum = {sum_square:.5E}\n')
-    
-                squares = np.append(squares, sum_square)
-    
-                string = in_out.prep_output(sum_square, E_kin_au, t_au, E_p_au)     # returns str: E_kin_eV, E_p_eV, t_s, sum_square = intensity
-                outlines.append(string)
-
-                E_p_au = E_p_au + Ep_step_au
-            
-            E_kin_au = E_kin_au + E_step_au     # @ t = const.
-        
-        
-        in_out.doout_1f(pure_out, outlines)     # writes each (E_kin, t = const, |J|**2) triple in a sep line into output file
-        in_out.doout_movie(movie_out, outlines)
+        squares_grid = calc_spectrum(t_au, TX_au/2)
+        squares = squares_grid.ravel()  # signal intensity ( = |amplitude|**2 = |J|**2 ), E_p running fastest
         print()
         max_pos = argrelextrema(squares, np.greater)[0]      # finds position of relative (i. e. local) maxima of |J|**2 in an array
         if (len(max_pos > 0)):                               # if there are such:
@@ -1154,20 +1127,8 @@ while (t_au >= TX_au/2\
                 outfile.write(str(Ekins[max_pos[i] // len(Ep)]) + '  ' + str(Ep[max_pos[i] % len(Ep)]) + '  ' + str(squares[max_pos[i]]) + '\n')
     
     # wavepacket in resonance state(s)
-    wp_ampls = []
-    for nlambda in range (0,n_res_max+1):
-        E_lambda = E_lambdas[nlambda]
-        W_au = W_lambda[nlambda]
-        wp_pref = wp_prefs[nlambda] 
-        E_p_au = Ep_min_au
-        while (E_p_au <= Ep_max_au):
-            wp_I = wp_res_int(t_au,TX_au/2)
-            wp_ampl = wp_pref * wp_I
-            wp_string = format(nlambda, 'd') + '   ' + format(sciconv.hartree_to_ev(E_p_au), '>8.5f') + '   ' + '   ' + format(sciconv.atu_to_second(t_au), ' .18f') \
-                    + '   ' + format(complex(wp_ampl), ' .15e')
-            wp_ampls.append(wp_string)
-            E_p_au = E_p_au + Ep_step_au
-    in_out.doout_1f(wp_res_out, wp_ampls)
+    wp_all = calc_wavepacket(t_au, TX_au/2)                   # (lambda, E_p)
+    res_out.write(t_au, squares_grid if not wavepac_only else None, wp_all)     # full.dat, movie.dat, wp_res.dat or binary; flushed
 
 
     t_au = t_au + timestep_au
@@ -1175,6 +1136,7 @@ while (t_au >= TX_au/2\
 
 
 
+res_out.close()
 print('In order to process the wavepacket results, consider running res_wavepacket.py')
 
 dt_end = datetime.now()
@@ -1183,4 +1145,5 @@ print(str(dt_end))
 outfile.write('\n' + str(dt_end) + '\n')
 outfile.write('Total runtime:' + ' ' + str(dt_end - dt_start))
 
+workers.close()
 close_files()
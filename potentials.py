@@ -35,6 +35,17 @@ def gammar6(a,r_au):
     Gamma_au = a / r_au**6
     Vr_au = np.sqrt(Gamma_au / 2 / np.pi)
     return Vr_au
+
+# analytic derivatives dV/dR (hartree / bohr) of the potentials above
+def expr6_grad(a,b,c,d,r_au):
+    r = sc.bohr_to_angstrom(r_au)
+    dV = -a*b * np.exp(-b*r) - 6*c / r**7
+    return sc.ev_to_hartree(dV) * sc.bohr_to_angstrom(1.)
+
+def hyperbel_grad(a,b,r_au):
+    r = sc.bohr_to_angstrom(r_au)
+    dV = -a / r**2
+    return sc.ev_to_hartree(dV) * sc.bohr_to_angstrom(1.)
     
 
 ##-------------------------------------------------------------------------
@@ -12,6 +12,7 @@
 ##########################################################################
 
 import numpy as np
+from scipy.special import wofz
 
 ##-------------------------------------------------------------------------
 ##Variante mit TX
@@ -51,15 +52,175 @@ def f_t1(t1, sigma):
 def fp_t1(t1, sigma):
     func = lambda t1: ( -t1 / np.sqrt(2*np.pi) / sigma**3
                        * np.exp(-t1**2 / (2*sigma**2)))
+    return func
 
 def FX_t1(t1,
           A0X, Omega_au,
           sigma):
-    func = lambda t1: (- A0X * np.cos(Omega_au * t1) * fp_t1(t1, sigma)
-                       + A0X * Omega_au * np.sin(Omega_au * (t1)) * f_t1(t1, sigma)
+    f = f_t1(t1, sigma)
+    fp = fp_t1(t1, sigma)
+    func = lambda t1: (- A0X * np.cos(Omega_au * t1) * fp(t1)
+                       + A0X * Omega_au * np.sin(Omega_au * (t1)) * f(t1)
                       )
     return func
 
+
+#-------------------------------------------------------------------------
+#   pulse objects: array in, array out
+
+class GridCache:
+    # values of a pulse on the last time grid(s) used, so that loops over energies
+    # evaluating the same t grid again only pay for a comparison
+    def __init__(self, size=4):
+        self.size = size
+        self.entries = []
+
+    def get(self, name, t, func):
+        t = np.asarray(t, dtype=float)
+        for key, grid, values in self.entries:
+            if (key == name and grid.shape == t.shape and np.array_equal(grid, t)):
+                return values
+        values = func(t)
+        self.entries.insert(0, (name, t.copy(), values))
+        del self.entries[self.size:]
+        return values
+
+
+class XUVPulse:
+    # XUV pulse with vector potential A(t) = A0X f(t) cos(Omega t)
+    #   shape = 'gauss':  f(t) = exp(-t**2 / (2 sigma**2)) / sqrt(2 pi sigma**2)
+    #           'sinsq':  f(t) = sin**2(pi (t + TX/2) / TX) for |t| <= TX/2, 0 otherwise
+    #                     (the lambdas of the older scripts have cos**2 here, which vanishes at t = 0:
+    #                      the sign errors noted there; so far only nuclear_dyn.py uses this class)
+    #   form  = 'convoluted':  field FX = -(A f)' = - A0X cos(Omega t) f'(t) + A0X Omega sin(Omega t) f(t)
+    #           'infinite':    FX = A0X Omega cos(Omega t)
+    # f, fp (= f') and FX take arrays of t; with cache=True the values on the last time grids are kept.
+    def __init__(self, A0X, Omega_au, shape='gauss', form='convoluted', sigma=None, TX_au=None,
+                 cache=False):
+        if (shape == 'gauss' and sigma is None) or (shape == 'sinsq' and TX_au is None):
+            raise ValueError('XUV pulse shape ' + str(shape) + ' needs sigma (gauss) or TX_au (sinsq)')
+        if shape not in ('gauss', 'sinsq') or form not in ('convoluted', 'infinite'):
+            raise ValueError('Unknown XUV pulse: ' + str(shape) + ', ' + str(form))
+        self.A0X = A0X
+        self.Omega_au = Omega_au
+        self.shape = shape
+        self.form = form
+        self.sigma = sigma
+        self.TX_au = TX_au
+        self.cache = GridCache() if cache else None
+
+    def _cached(self, name, t, func):
+        if self.cache is None:
+            return func(np.asarray(t, dtype=float))
+        return self.cache.get(name, t, func)
+
+    def _f(self, t):
+        if (self.shape == 'gauss'):
+            return 1./ np.sqrt(2*np.pi * self.sigma**2) * np.exp(-t**2 / (2*self.sigma**2))
+        return np.where(np.abs(t) <= self.TX_au/2, np.sin(np.pi * (t + self.TX_au/2) / self.TX_au)**2, 0.)
+
+    def _fp(self, t):
+        if (self.shape == 'gauss'):
+            return -t / np.sqrt(2*np.pi) / self.sigma**3 * np.exp(-t**2 / (2*self.sigma**2))
+        return np.where(np.abs(t) <= self.TX_au/2,
+                        np.pi / self.TX_au * np.sin(2*np.pi * (t + self.TX_au/2) / self.TX_au), 0.)
+
+    def _FX(self, t):
+        if (self.form == 'infinite'):
+            return self.A0X * self.Omega_au * np.cos(self.Omega_au * t)
+        return (- self.A0X * np.cos(self.Omega_au * t) * self._fp(t)
+                + self.A0X * self.Omega_au * np.sin(self.Omega_au * t) * self._f(t))
+
+    def f(self, t):
+        return self._cached('f', t, self._f)
+
+    def fp(self, t):
+        return self._cached('fp', t, self._fp)
+
+    def FX(self, t):
+        return self._cached('FX', t, self._FX)
+
+    def envelopes(self):
+        # FX = sum_j g_j(t) exp(i omega_j t) with smooth g_j, as needed by complex_integration.filon_integrals
+        A0X, Omega_au = self.A0X, self.Omega_au
+        if (self.form == 'infinite'):
+            return [(lambda t: A0X * Omega_au / 2 * np.ones(np.shape(t)), Omega_au),
+                    (lambda t: A0X * Omega_au / 2 * np.ones(np.shape(t)), -Omega_au)]
+        return [(lambda t: - A0X / 2 * self._fp(t) + A0X * Omega_au / 2j * self._f(t), Omega_au),
+                (lambda t: - A0X / 2 * self._fp(t) - A0X * Omega_au / 2j * self._f(t), -Omega_au)]
+
+
+def gauss_cumulative(s, omega, sigma):
+    # int_-inf^s du exp(-u**2 / (2 sigma**2)) exp(i omega u)  for an array of s (omega >= 0)
+    # in terms of the Faddeeva function, finite also where erf of the complex argument would overflow
+    s = np.asarray(s, dtype=float)
+    pref = sigma * np.sqrt(np.pi/2)
+    gauss = np.exp(-s**2 / (2*sigma**2) + 1j * omega * s)
+    lower = pref * gauss * wofz((-1j * s - sigma**2 * omega) / (np.sqrt(2) * sigma))             # s < 0
+    upper = pref * (2 * np.exp(-sigma**2 * omega**2 / 2)
+                    - gauss * wofz((1j * s + sigma**2 * omega) / (np.sqrt(2) * sigma)))        # s >= 0
+    return np.where(s < 0, lower, upper)
+
+
+class IRPulse:
+    # IR vector potential A(t) = A0L f_L(t) cos(omega (t - t_ref) + phi)
+    #   shape = 'sinsq':  f_L = sin**2(pi (t - delta_t + TL/2) / TL) for |t - delta_t| <= TL/2, 0 otherwise
+    #           'gauss':  f_L = exp(-(t - delta_t)**2 / (2 sigma_L**2))
+    # t_ref = 0 gives the carrier cos(omega t + phi) of most scripts, t_ref = delta_t_au
+    # a carrier phase relative to the pulse centre.
+    # A_int(t) = int_t_start^t A(t') dt' analytically, t_start = delta_t - TL/2 (sinsq) or -inf (gauss).
+    def __init__(self, A0L, omega_au, shape='sinsq', TL_au=None, sigma_L=None,
+                 delta_t_au=0., phi=0., t_ref=0., cache=False):
+        if (shape == 'sinsq' and TL_au is None) or (shape == 'gauss' and sigma_L is None):
+            raise ValueError('IR pulse shape ' + str(shape) + ' needs TL_au (sinsq) or sigma_L (gauss)')
+        if shape not in ('sinsq', 'gauss'):
+            raise ValueError('Unknown IR pulse shape: ' + str(shape))
+        self.A0L = A0L
+        self.omega_au = omega_au
+        self.shape = shape
+        self.TL_au = TL_au
+        self.sigma_L = sigma_L
+        self.delta_t_au = delta_t_au
+        self.phi = phi
+        self.t_ref = t_ref
+        self.cache = GridCache() if cache else None
+
+    def _cached(self, name, t, func):
+        if self.cache is None:
+            return func(np.asarray(t, dtype=float))
+        return self.cache.get(name, t, func)
+
+    def _A(self, t):
+        carrier = np.cos(self.omega_au * (t - self.t_ref) + self.phi)
+        s = t - self.delta_t_au
+        if (self.shape == 'gauss'):
+            return self.A0L * np.exp(-s**2 / (2*self.sigma_L**2)) * carrier
+        return self.A0L * np.where(np.abs(s) <= self.TL_au/2,
+                                   np.sin(np.pi * (s + self.TL_au/2) / self.TL_au)**2, 0.) * carrier
+
+    def _A_int(self, t):
+        theta0 = self.omega_au * (self.delta_t_au - self.t_ref) + self.phi     # carrier phase at the centre
+        if (self.shape == 'gauss'):
+            return self.A0L * np.real(np.exp(1j * theta0)
+                                      * gauss_cumulative(t - self.delta_t_au, self.omega_au, self.sigma_L))
+        # sin**2 = (1 + cos(kappa s)) / 2 with kappa = 2 pi / TL, s = t - delta_t:
+        #   A = A0L/2 cos(theta) + A0L/4 [cos(theta + kappa s) + cos(theta - kappa s)],  theta = omega s + theta0
+        # int_0^s cos(a s' + theta0) ds' = s cos(theta0 + a s/2) sinc(a s / 2 pi) also holds for a = 0 (n_L = 1)
+        kappa = 2*np.pi / self.TL_au
+        w = self.omega_au
+        cos_int = lambda a, s: s * np.cos(theta0 + a * s / 2) * np.sinc(a * s / (2*np.pi))
+        prim = lambda s: (self.A0L / 2 * cos_int(w, s)
+                          + self.A0L / 4 * (cos_int(w + kappa, s) + cos_int(w - kappa, s)))
+        s = np.clip(t - self.delta_t_au, -self.TL_au/2, self.TL_au/2)
+        return prim(s) - prim(-self.TL_au/2)
+
+    def A(self, t):
+        return self._cached('A', t, self._A)
+
+    def A_int(self, t):
+        # int_t_start^t A(t') dt'
+        return self._cached('A_int', t, self._A_int)
+
 ## IR pulse
 ##-------------------------------------------------------------------------
 #A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
@@ -147,6 +308,45 @@ def IR_after(t1, p_au,
                  )
     return IR_after
 
+class VolkovPhase:
+    # Accumulated streaking phase of an electron with momentum p in the IR field,
+    #   phase(p, t1, t2) = int_t1^t2 (p + A(t))**2 dt = p**2 (t2 - t1) + 2 p [S1(t2) - S1(t1)] + S2(t2) - S2(t1)
+    # with S1 = int A = pulse.A_int (analytic) and S2 = int A**2, tabulated once on a fine grid of the
+    # pulse (Gauss-Legendre on each interval, accumulated); a lookup adds the Gauss-Legendre integral
+    # from the next lower grid point, so every phase costs O(1) evaluations of A.
+    # Outside the tabulated window (sinsq: the pulse, gauss: delta_t +- n_sigma sigma_L) A is taken as 0.
+    # p, t1 and t2 may be arrays (broadcast against each other).
+    def __init__(self, pulse, points_per_cycle=16, n_sigma=10):
+        self.pulse = pulse
+        if (pulse.shape == 'sinsq'):
+            t_lo, t_hi = pulse.delta_t_au - pulse.TL_au/2, pulse.delta_t_au + pulse.TL_au/2
+        else:
+            t_lo, t_hi = pulse.delta_t_au - n_sigma * pulse.sigma_L, pulse.delta_t_au + n_sigma * pulse.sigma_L
+        n = int(np.ceil((t_hi - t_lo) * pulse.omega_au / (2*np.pi) * points_per_cycle)) + 1
+        self.t = np.linspace(t_lo, t_hi, n)
+        self.S2_grid = np.concatenate(([0.], np.cumsum(self.A2_int(self.t[:-1], self.t[1:]))))
+
+    def A2_int(self, a, b):
+        # int_a^b A**2 dt by 6-point Gauss-Legendre (a, b within one grid interval)
+        x, w = np.polynomial.legendre.leggauss(6)
+        hl = 0.5 * (b - a)
+        mid = 0.5 * (b + a)
+        return hl * np.sum(w * self.pulse.A(mid[...,None] + hl[...,None] * x)**2, axis=-1)
+
+    def S1(self, t):
+        return self.pulse.A_int(t)
+
+    def S2_at(self, t):
+        t = np.clip(np.asarray(t, dtype=float), self.t[0], self.t[-1])
+        i = np.clip(np.searchsorted(self.t, t, side='right') - 1, 0, len(self.t) - 2)
+        return self.S2_grid[i] + self.A2_int(self.t[i], t)
+
+    def __call__(self, p, t1, t2):
+        p, t1, t2 = (np.asarray(x, dtype=float) for x in (p, t1, t2))
+        return (p**2 * (t2 - t1) + 2 * p * (self.S1(t2) - self.S1(t1))
+                + self.S2_at(t2) - self.S2_at(t1))
+
+
 ##-------------------------------------------------------------------------
 ## technical defintions of functions
 #
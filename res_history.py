@@ -0,0 +1,112 @@
+##########################################################################
+#            RESONANCE HISTORY FOR THE CLASSICAL-NUCLEI SCRIPTS          #
+##########################################################################
+# Purpose:                                                               #
+#          - Running sums of the resonance amplitudes created at the     #
+#            earlier time steps (measure_tmin, measure_interfere,        #
+#            measure_split), replacing the list res_tuples.              #
+#                                                                        #
+##########################################################################
+# At time step k the resonance amplitudes r1_k, r2_k (one pair per       #
+# E_kin) are created with the energy phi_k = T_K + E_fin of that step.   #
+# At a later time t each of them contributes                             #
+#     (r1_k * Ires - r2_k * X_k) * exp(-1j * t * (E_kin + phi_k)),       #
+# X_1 = I1, X_k = Ires otherwise, either coherently (added to J) or      #
+# incoherently (|contribution + dir_J|**2 added to the intensity).       #
+# Steps with the same phi share one running sum of r1 - r2 per E_kin.    #
+# As long as the nuclei do not move (all steps before n_limit) phi is    #
+# step-invariant: there is a single sum per E_kin and a time step costs  #
+# O(N_E), linear in the number of time steps overall.                    #
+# Moving nuclei give every step its own phi. Then the sums cannot be     #
+# collapsed: a step costs one dot of length n per E_kin (O(N_E * n), the #
+# vectorized form of the res_tuples loop), and after n steps the history #
+# holds up to 2 * N_E * n complex sums (res_tuples had N_E * n tuples).  #
+# The phases exp(-i t phi) of the columns are computed once per step.    #
+##########################################################################
+
+import numpy as np
+
+
+class ResonanceHistory:
+    # n_E, n_phi: initial number of E_kin points (E_index = 0 ... n_E-1) and of distinct phi,
+    # the arrays are doubled when more are needed
+    def __init__(self, n_E, n_phi=1):
+        n_E = max(n_E, 1)
+        self.phi = np.zeros(n_phi)
+        self.coh = np.zeros((n_E, n_phi), dtype=complex)     # sum of r1 - r2 over coherent steps, per phi
+        self.inc = np.zeros((n_E, n_phi), dtype=complex)     # the same for incoherent steps
+        self.n_phi = 0
+        self.index = {}                                      # phi -> column
+        self.inc_abs = np.zeros(n_E)                         # sum of |r1 - r2|**2 over incoherent steps
+        self.inc_count = np.zeros(n_E, dtype=int)
+        self.first = {}                                      # step k = 1, which is integrated with I1: E_index -> (r1, r2, phi, coherent)
+        self.phi_phases = (None, 0, None)                    # (t, n_phi, exp(-i t phi) of the columns)
+
+    def column(self, phi):
+        if phi in self.index:
+            return self.index[phi]
+        if (self.n_phi == len(self.phi)):
+            self.phi = np.concatenate((self.phi, np.zeros_like(self.phi)))
+            self.coh = np.concatenate((self.coh, np.zeros_like(self.coh)), axis=1)
+            self.inc = np.concatenate((self.inc, np.zeros_like(self.inc)), axis=1)
+        self.phi[self.n_phi] = phi
+        self.index[phi] = self.n_phi
+        self.n_phi += 1
+        return self.n_phi - 1
+
+    def add(self, E_index, n, r1, r2, phi, coherent=True):
+        # resonance amplitudes created at time step n
+        while (E_index >= len(self.inc_abs)):
+            self.coh = np.concatenate((self.coh, np.zeros_like(self.coh)), axis=0)
+            self.inc = np.concatenate((self.inc, np.zeros_like(self.inc)), axis=0)
+            self.inc_abs = np.concatenate((self.inc_abs, np.zeros_like(self.inc_abs)))
+            self.inc_count = np.concatenate((self.inc_count, np.zeros_like(self.inc_count)))
+        if (n == 1):
+            self.first[E_index] = (r1, r2, phi, coherent)
+            return
+        col = self.column(phi)
+        if coherent:
+            self.coh[E_index, col] += r1 - r2
+        else:
+            self.inc[E_index, col] += r1 - r2
+            self.inc_abs[E_index] += np.absolute(r1 - r2)**2
+            self.inc_count[E_index] += 1
+
+    def phases(self, t_au, E_kin_au):
+        # exp(-i t (E_kin + phi)) of all columns; the phi part is shared by all E_kin of a time step
+        t_last, n_last, phi_phases = self.phi_phases
+        if (t_last != t_au or n_last != self.n_phi):
+            phi_phases = np.exp(-1j * t_au * self.phi[:self.n_phi])
+            self.phi_phases = (t_au, self.n_phi, phi_phases)
+        return np.exp(-1j * t_au * E_kin_au) * phi_phases
+
+    def column_sum(self, sums, E_index, t_au, E_kin_au):
+        # sum over the columns of sums[E_index] with their phases
+        if (self.n_phi == 1):                   # step-invariant phi: the single running sum
+            return sums[E_index, 0] * np.exp(-1j * t_au * (E_kin_au + self.phi[0]))
+        return np.dot(sums[E_index, :self.n_phi], self.phases(t_au, E_kin_au))
+
+    def first_part(self, E_index, t_au, E_kin_au, Ires, I1):
+        r1, r2, phi, coherent = self.first[E_index]
+        return (r1 * Ires - r2 * I1) * np.exp(-1j * t_au * (E_kin_au + phi)), coherent
+
+    def coherent_sum(self, E_index, t_au, E_kin_au, Ires, I1):
+        # sum of the contributions of all coherent steps at time t_au
+        J = Ires * self.column_sum(self.coh, E_index, t_au, E_kin_au)
+        if E_index in self.first:
+            part, coherent = self.first_part(E_index, t_au, E_kin_au, Ires, I1)
+            if coherent:
+                J = J + part
+        return J
+
+    def incoherent_sum(self, E_index, t_au, E_kin_au, Ires, I1, dir_J):
+        # sum of |contribution + dir_J|**2 over all incoherent steps at time t_au
+        cross = Ires * self.column_sum(self.inc, E_index, t_au, E_kin_au)
+        square = (np.absolute(Ires)**2 * self.inc_abs[E_index]
+                  + self.inc_count[E_index] * np.absolute(dir_J)**2
+                  + 2 * np.real(np.conj(dir_J) * cross))
+        if E_index in self.first:
+            part, coherent = self.first_part(E_index, t_au, E_kin_au, Ires, I1)
+            if not coherent:
+                square = square + np.absolute(part + dir_J)**2
+        return square
@@ -125,9 +125,10 @@ sata[3] = np.tile(R_arr, len(data[0]))
 
 # At each point, multiply the WF of the vibrational state with the projection of the total WF on it
 sata[4] = complex(0)
+psi_R = wf.psi_all(R_arr, N_lambda-1, alpha, Req, red_mass, De)      # all vibrational WFs on R_arr, (lambda, R)
 for n in range(N_lambda):
     s_down, s_up = n*len(data[0])//N_lambda, (n+1)*len(data[0])//N_lambda-1     # select block with the current quantum number n
-    sata.loc[s_down:s_up,4] = sata.loc[s_down:s_up,2] * wf.psi_n(sata.loc[s_down:s_up,3], int(data[0][n]), alpha, Req, red_mass, De)
+    sata.loc[s_down:s_up,4] = sata.loc[s_down:s_up,2] * np.tile(psi_R[int(data[0][n])], s_up - s_down + 1)
 
 # Prepare an additional block for the whole resonance wavepacket, indicate by quantum number -1
 fata = pd.concat((sata, sata[sata[0] == 0].set_index(sata[sata[0] == 0].index + sata.index[-1] + 1)))
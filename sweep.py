@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+##########################################################################
+#                          PARAMETER SWEEPS                              #
+##########################################################################
+# Purpose:                                                               #
+#          - Runs a simulation script (eldest.py, nuclear_dyn.py, ...)   #
+#            for all points of a grid of input parameters on a pool of   #
+#            processes and keeps the results in one sqlite store.        #
+#                                                                        #
+##########################################################################
+# Every point gets a copy of the base input file (photo.in or            #
+# photonucl.in format) in which the lines of the swept parameters are    #
+# replaced (they have to be set in it), and is run in its own directory. #
+# The requested output files of the point (default full.dat and          #
+# eldest.out) are stored under a hash of the script contents, the base   #
+# input and the parameter values, together with the values themselves.   #
+# Points that are already in the store are skipped, so an interrupted    #
+# sweep is simply started again.                                         #
+# Examples of the serial sweeps of the older scripts:                    #
+#   Omega_eldest.py:            -p Omega_eV=45:50:0.1                    #
+#   nX_var.py:                  -p n_X=5:1000:5                          #
+#   two_streak.py, loop_Asquare.py:  -p delta_t_s=-5E-15:5E-15:1E-16     #
+#   screen_pot.py (nuclear_dyn.py, photonucl.in):                        #
+#                               -p res_de=0.01:0.05:0.01 -p res_a=1,1.5  #
+##########################################################################
+
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+#-------------------------------------------------------------------------
+#   parameter grid
+
+def parse_range(spec):
+    # 'name=start:stop:step' (stop included, as in the while loops of the scripts) or 'name=v1,v2,...'
+    # returns (name, [values as strings for the input file])
+    name, _, values = spec.partition('=')
+    if not values:
+        raise ValueError('Parameter range has to be name=start:stop:step or name=v1,v2,...: ' + spec)
+    if (':' in values):
+        start, stop, step = values.split(':')
+        if all(v.lstrip('+-').isdigit() for v in (start, stop, step)):
+            start, stop, step = int(start), int(stop), int(step)
+            return name.strip(), [str(v) for v in range(start, stop + (1 if step > 0 else -1), step)]
+        start, stop, step = float(start), float(stop), float(step)
+        n = int(np.floor((stop - start) / step + 1E-9)) + 1
+        return name.strip(), [format(start + i * step, '.12g') for i in range(max(n, 0))]
+    return name.strip(), [v.strip() for v in values.split(',') if v.strip()]
+
+
+def grid_points(ranges):
+    # all combinations of the parameter values, the last parameter varies fastest
+    names = [name for name, values in ranges]
+    return [dict(zip(names, values)) for values in itertools.product(*[values for name, values in ranges])]
+
+
+def check_names(base_lines, names):
+    # the swept parameters have to be set in the base input: read_input ignores unknown names,
+    # so a misspelt one would silently run the same point again and again
+    known = set(line.split()[0] for line in base_lines if line.split() and not line.startswith('#'))
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError('Swept parameters not set in the base input: ' + ', '.join(unknown))
+
+
+def write_input(base_lines, point, path):
+    # base input with the lines of the parameters in point replaced (name = value)
+    check_names(base_lines, point)
+    with open(path, 'w') as f:
+        for line in base_lines:
+            words = line.split()
+            if words and words[0] in point:
+                comment = line[line.index('#'):].rstrip('\n') if '#' in line else ''
+                line = (words[0] + ' = ' + point[words[0]] + '   ' + comment).rstrip() + '\n'
+            f.write(line)
+
+
+#-------------------------------------------------------------------------
+#   result store
+
+class SweepStore:
+    # sqlite store of the sweep results
+    #   points: key, script, params (json), status ('ok' or 'failed'), returncode, elapsed time, log
+    #   files:  key, name, content of the output file
+    def __init__(self, path):
+        self.path = path
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS points (key TEXT PRIMARY KEY, script TEXT, params TEXT,
+                           status TEXT, returncode INTEGER, elapsed REAL, log TEXT)''')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS files (key TEXT, name TEXT, data BLOB,
+                           PRIMARY KEY (key, name))''')
+        self.db.commit()
+
+    @staticmethod
+    def key(script, base_input, point, script_args=()):
+        # the script enters with its contents, so a changed script runs all points again
+        # (the modules it imports do not enter the key)
+        with open(script, 'rb') as f:
+            script_hash = hashlib.sha256(f.read()).hexdigest()
+        desc = repr((script_hash, list(script_args), hashlib.sha256(base_input.encode()).hexdigest(),
+                     sorted(point.items())))
+        return hashlib.sha256(desc.encode()).hexdigest()
+
+    def done(self, key):
+        row = self.db.execute('SELECT status FROM points WHERE key = ?', (key,)).fetchone()
+        return row is not None and row[0] == 'ok'
+
+    def add(self, key, script, point, returncode, elapsed, log, files):
+        status = 'ok' if (returncode == 0) else 'failed'
+        self.db.execute('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (key, os.path.basename(script), json.dumps(point, sort_keys=True),
+                         status, returncode, elapsed, log))
+        self.db.execute('DELETE FROM files WHERE key = ?', (key,))
+        self.db.executemany('INSERT INTO files VALUES (?, ?, ?)',
+                            [(key, name, data) for name, data in files.items()])
+        self.db.commit()
+
+    def points(self, status='ok'):
+        # [(key, params)] of all points with the given status
+        rows = self.db.execute('SELECT key, params FROM points WHERE status = ?', (status,)).fetchall()
+        return [(key, json.loads(params)) for key, params in rows]
+
+    def file(self, key, name):
+        row = self.db.execute('SELECT data FROM files WHERE key = ? AND name = ?', (key, name)).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def table(self, key, name='full.dat'):
+        # numerical content of a stored text output (e.g. full.dat) as an array
+        data = self.file(key, name)
+        return None if data is None else np.loadtxt(io.BytesIO(data), ndmin=2)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def load_results(path, name='full.dat'):
+    # {(params as sorted tuple): array} of all finished points of a store
+    store = SweepStore(path)
+    results = {tuple(sorted(params.items())): store.table(key, name) for key, params in store.points()}
+    store.close()
+    return results
+
+
+#-------------------------------------------------------------------------
+#   running the points
+
+def run_point(job):
+    # runs one point in its own directory; job = (key, point, script, base_lines, options)
+    key, point, script, base_lines, opts = job
+    rundir = os.path.join(opts['workdir'], key[:16])
+    os.makedirs(rundir, exist_ok=True)
+    write_input(base_lines, point, os.path.join(rundir, opts['input_name']))
+    cmd = [opts['python'], os.path.abspath(script)] + opts['script_args'] + [opts['input_name']]
+    start = time.time()
+    with open(os.path.join(rundir, 'sweep.log'), 'w') as log:
+        returncode = subprocess.call(cmd, cwd=rundir, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.time() - start
+    with open(os.path.join(rundir, 'sweep.log'), 'r', errors='replace') as log:
+        log_tail = ''.join(log.readlines()[-20:])
+    files = {}
+    for name in opts['outputs']:
+        path = os.path.join(rundir, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                files[name] = f.read()
+    if (returncode == 0 and not opts['keep']):
+        shutil.rmtree(rundir, ignore_errors=True)
+    return key, point, returncode, elapsed, log_tail, files
+
+
+def run_sweep(script, base_input, ranges, store, workers=1, **opts):
+    # runs all points of the grid that are not yet in store; returns the number of failed points
+    with open(base_input, 'r') as f:
+        base_lines = f.readlines()
+    check_names(base_lines, [name for name, values in ranges])
+    options = {'workdir': 'sweep_runs', 'python': sys.executable, 'script_args': [],
+               'outputs': ['full.dat', 'eldest.out'], 'keep': False,
+               'input_name': os.path.basename(base_input)}
+    options.update(opts)
+    points = grid_points(ranges)
+    jobs = []
+    for point in points:
+        key = store.key(script, ''.join(base_lines), point, options['script_args'])
+        if not store.done(key):
+            jobs.append((key, point, script, base_lines, options))
+    print('Sweep over', len(points), 'points,', len(points) - len(jobs), 'already done,',
+          len(jobs), 'to run on', max(1, min(workers, len(jobs))), 'processes')
+
+    failed = 0
+    pool = multiprocessing.Pool(max(1, min(workers, len(jobs)))) if jobs else None
+    try:
+        results = pool.imap_unordered(run_point, jobs) if pool else []
+        for cnt, (key, point, returncode, elapsed, log, files) in enumerate(results):
+            store.add(key, script, point, returncode, elapsed, log, files)
+            status = 'ok' if (returncode == 0) else 'FAILED (return code ' + str(returncode) + ')'
+            print(str(cnt + 1) + '/' + str(len(jobs)), point, status, format(elapsed, '.1f'), 's')
+            if (returncode != 0):
+                failed += 1
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return failed
+
+
+if __name__ == '__main__':
+    # set up argument parser
+    parser = argparse.ArgumentParser(
+            description='''ELDEST -- sweep.py :
+            Runs a simulation script for all combinations of the given parameter values
+            and stores the results in one sqlite file. Points already in the store are skipped.''',
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('script', help='Simulation script, e.g. eldest.py or nuclear_dyn.py')
+    parser.add_argument('infile', help='Base input file, probably photo.in or photonucl.in')
+    parser.add_argument('-p', '--param', action='append', default=[], help='''Swept parameter as in the input file,
+                        name=start:stop:step (stop included) or name=v1,v2,...; may be given several times,
+                        all combinations are run.''')
+    parser.add_argument('-s', '--store', default='sweep.sqlite', help='sqlite file with the results.')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of points run at the same time.')
+    parser.add_argument('-o', '--output', action='append', default=None, help='''Output file of the script that is
+                        stored for every point (may be given several times, default full.dat and eldest.out).''')
+    parser.add_argument('--workdir', default='sweep_runs', help='Directory for the runs of the single points.')
+    parser.add_argument('--keep', action='store_true', help='Keep the run directories of successful points.')
+    parser.add_argument('--python', default=sys.executable, help='Interpreter for the script.')
+    parser.add_argument('--script-args', default='', help='Further arguments of the script, e.g. "--workers 2".')
+    args = parser.parse_args()
+
+    if not args.param:
+        sys.exit('!!! No parameter to sweep over (-p name=start:stop:step). Programme terminated.')
+    try:
+        ranges = [parse_range(spec) for spec in args.param]
+        with open(args.infile, 'r') as f:
+            check_names(f.readlines(), [name for name, values in ranges])
+    except ValueError as err:
+        sys.exit('!!! ' + str(err) + '. Programme terminated.')
+    for name, values in ranges:
+        print(name, ':', len(values), 'values from', values[0] if values else '-', 'to', values[-1] if values else '-')
+
+    store = SweepStore(args.store)
+    failed = run_sweep(args.script, args.infile, ranges, store, args.workers,
+                       workdir=os.path.abspath(args.workdir), python=args.python,
+                       script_args=args.script_args.split(),
+                       outputs=args.output or ['full.dat', 'eldest.out'], keep=args.keep)
+    print('Finished points in', args.store, ':', len(store.points()))
+    store.close()
+    if failed:
+        sys.exit('!!! ' + str(failed) + ' points failed, they are run again at the next start.')
@@ -0,0 +1,5 @@
+# the modules of the package live in the top directory of the repository
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
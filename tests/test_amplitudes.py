@@ -0,0 +1,145 @@
+import mpmath as mp
+import numpy as np
+import pytest
+from scipy import integrate
+
+import amplitudes as amp
+
+
+A0X, Omega, sigma = 0.7, 3.5, 4.0
+t_low = -20.0
+
+f = lambda t: 1./ np.sqrt(2*np.pi * sigma**2) * np.exp(-t**2 / (2*sigma**2))
+fp = lambda t: - t / sigma**2 * f(t)
+FX_t1 = lambda t: - A0X * np.cos(Omega * t) * fp(t) + A0X * Omega * np.sin(Omega * t) * f(t)
+envelopes = [(lambda t: - A0X / 2 * fp(t) + A0X * Omega / 2j * f(t), Omega),
+             (lambda t: - A0X / 2 * fp(t) - A0X * Omega / 2j * f(t), -Omega)]
+integ_kwargs = {'analytic': {'gauss': (A0X, Omega, sigma)},
+                'filon': {'envelopes': envelopes},
+                'quadrature': {'epsabs': 1E-12, 'epsrel': 1E-12},
+                'romberg': {'divmax': 14},
+                'gauss-legendre': {'order': 40, 'panels': 8}}
+
+
+def grid_args():
+    rng = np.random.RandomState(3)
+    Ekins = np.linspace(2.0, 4.0, 5)
+    Eps = np.array([0.1, 0.3])
+    E_fins = np.array([0.0, 0.05, 0.12])
+    E_lambdas = np.array([0.0, 0.04])
+    W_lambda = np.array([0.01, 0.02])
+    Er = 1.2
+    dir_coeffs = rng.rand(3) + 1j * rng.rand(3)
+    nondir_coeffs = rng.rand(2, 3) + 1j * rng.rand(2, 3)
+    nondir_coeffs[1,0] = 0
+    weights = np.array([1.0, 0.5, 2.0])
+    return (Ekins, Eps, E_fins, E_lambdas, W_lambda, Er, dir_coeffs, nondir_coeffs, weights)
+
+
+def reference_squares(t, t_up):
+    # |J|**2 element by element: J_mu = J_dir,mu + sum_lambda nondir_coeffs J_res,mu,lambda
+    Ekins, Eps, E_fins, E_lambdas, W_lambda, Er, dir_coeffs, nondir_coeffs, weights = grid_args()
+    G = lambda z: amp.pulse_integrals(FX_t1, np.array([z]), t_low, t_up, 'analytic',
+                                      gauss=(A0X, Omega, sigma))[0]
+    squares = np.zeros((len(Ekins), len(Eps)))
+    for i, E_kin in enumerate(Ekins):
+        for p, E_p in enumerate(Eps):
+            for mu, E_fin in enumerate(E_fins):
+                E_dir = E_kin + E_fin
+                J = dir_coeffs[mu] * np.exp(-1j * t * E_dir) * G(1j * E_dir)
+                for l, (E_l, W_l) in enumerate(zip(E_lambdas, W_lambda)):
+                    iDW = 1j * (E_dir - Er - E_l) - np.pi * W_l
+                    G_res = G(np.pi * W_l + 1j * (Er + E_l + E_p))
+                    J += (nondir_coeffs[l,mu] * np.exp(-1j * t * (E_dir + E_p)) / iDW
+                          * (np.exp(t * iDW) * G_res - G(1j * (E_dir + E_p))))
+                squares[i,p] += weights[mu] * abs(J)**2
+    return squares
+
+
+@pytest.mark.parametrize('integ_outer', ['quadrature', 'filon', 'romberg', 'gauss-legendre'])
+def test_pulse_integrals_against_closed_form(integ_outer):
+    z = np.array([1j * 2.5, 0.03 + 1j * 1.3, 1j * 4.1])
+    exact = amp.pulse_integrals(FX_t1, z, t_low, 3.0, 'analytic', **integ_kwargs['analytic'])
+    G = amp.pulse_integrals(FX_t1, z, t_low, 3.0, integ_outer, **integ_kwargs[integ_outer])
+    assert np.allclose(G, exact, rtol=1E-7, atol=1E-9)
+
+
+def test_pulse_integrals_empty_interval():
+    assert np.all(amp.pulse_integrals(FX_t1, np.ones(3), 1.0, 1.0) == 0)
+    with pytest.raises(ValueError):
+        amp.pulse_integrals(FX_t1, np.ones(3), 0.0, 1.0, 'simpson')
+
+
+def test_pulse_integrals_romberg_tolerances():
+    z = np.array([1j * 2.5, 0.03 + 1j * 1.3])
+    exact = amp.pulse_integrals(FX_t1, z, t_low, 3.0, 'analytic', **integ_kwargs['analytic'])
+    G = amp.pulse_integrals(FX_t1, z, t_low, 3.0, 'romberg', tol=1E-13, rtol=1E-13, divmax=16)
+    assert np.allclose(G, exact, rtol=1E-11, atol=1E-13)
+    with pytest.warns(integrate.IntegrationWarning):
+        amp.pulse_integrals(FX_t1, z, t_low, 3.0, 'romberg', tol=1E-13, rtol=1E-13, divmax=5)
+
+
+def test_pulse_integrals_gauss_legendre_warning():
+    with pytest.warns(integrate.IntegrationWarning):
+        amp.pulse_integrals(FX_t1, np.array([1j * 2.5]), t_low, 3.0, 'gauss-legendre', order=6, panels=2)
+
+
+@pytest.mark.parametrize('t, T_up', [(-2.0, -2.0), (30.0, 20.0)])
+def test_wp_res_ints_pulse_against_closed_form(t, T_up):
+    E_res, W, Eps = np.array([1.2, 1.24]), np.array([0.01, 0.02]), np.array([0.1, 0.3, 2.1])
+    exact = amp.wp_res_ints(t, T_up, t_low, E_res, W, Eps, A0X, Omega, sigma)
+    I = amp.wp_res_ints_pulse(t, T_up, t_low, E_res, W, Eps, FX_t1)
+    assert I.shape == (2, 3)
+    assert np.allclose(I, exact, rtol=1E-9, atol=1E-12)
+
+
+def wp_res_int_mpmath(t, T_up, E_res, W, E_p):
+    # wp_res_int of nuclear_dyn.py (mpmath, point by point)
+    w = E_res + E_p - 1.j*mp.pi*W
+    t_pm = lambda x, O: 1/(sigma*mp.sqrt(2)) * (x - 1.j*sigma**2*(w + O))
+    gamma = lambda O: (w * (mp.erf(t_pm(T_up, O)) - mp.erf(t_pm(t_low, O)))
+                       + 1.j/sigma * mp.sqrt(2/mp.pi) * (mp.exp(-t_pm(T_up, O)**2) - mp.exp(-t_pm(t_low, O)**2)))
+    return (A0X*0.25j * mp.exp(-1.j*t*w)
+            * (mp.exp(-sigma**2/2 * (w + Omega)**2) * gamma(Omega)
+               + mp.exp(-sigma**2/2 * (w - Omega)**2) * gamma(-Omega)))
+
+
+@pytest.mark.parametrize('t, T_up', [(-2.0, -2.0), (30.0, 20.0), (2000.0, 20.0), (20000.0, 20.0)])
+def test_wp_res_ints_against_mpmath(t, T_up):
+    E_res, W, Eps = np.array([0.4, 1.2, 3.6]), np.array([1E-4, 3E-3, 0.01]), np.array([0.1, 0.3, 2.1])
+    I = amp.wp_res_ints(t, T_up, t_low, E_res, W, Eps, A0X, Omega, sigma)
+    ref = np.array([[complex(wp_res_int_mpmath(t, T_up, E, W_l, E_p)) for E_p in Eps]
+                    for E, W_l in zip(E_res, W)])
+    assert np.all(ref != 0)
+    assert np.all(np.abs(I - ref) <= 1E-11 * np.abs(ref))
+
+
+@pytest.mark.parametrize('t, t_up', [(-2.0, -2.0), (5.0, 5.0), (30.0, 20.0)])
+def test_squares_against_elementwise_amplitudes(t, t_up):
+    grid = amp.AmplitudeGrid(*grid_args(), FX_t1=FX_t1, integ_outer='analytic', gauss=(A0X, Omega, sigma))
+    assert np.allclose(grid.squares(t, t_low, t_up), reference_squares(t, t_up), rtol=1E-10, atol=1E-14)
+
+
+@pytest.mark.parametrize('integ_outer', ['quadrature', 'romberg'])
+def test_cumulative_integration(integ_outer):
+    args = grid_args()
+    grid = amp.AmplitudeGrid(*args, FX_t1=FX_t1, integ_outer=integ_outer, **integ_kwargs[integ_outer])
+    cumul = amp.AmplitudeGrid(*args, FX_t1=FX_t1, integ_outer=integ_outer, **integ_kwargs[integ_outer])
+    for t in (-5.0, 0.0, 4.0, 12.0):
+        assert np.allclose(cumul.squares(t, t_low, t, cumulative=True), grid.squares(t, t_low, t),
+                           rtol=1E-8, atol=1E-14)
+
+
+@pytest.mark.parametrize('nworkers', [1, 2])
+def test_split_grid_workers(nworkers, capsys):
+    Ekins, rest = grid_args()[0], grid_args()[1:]
+    whole = amp.AmplitudeGrid(Ekins, *rest, FX_t1=FX_t1, integ_outer='analytic', gauss=(A0X, Omega, sigma))
+    grids = amp.split_grid(Ekins, 2, *rest, FX_t1=FX_t1, integ_outer='analytic', gauss=(A0X, Omega, sigma))
+    assert [len(grid.Ekins) for grid in grids] == [2, 2, 1]
+    workers = amp.GridWorkers(grids, nworkers)
+    try:
+        for t in (0.0, 25.0):
+            assert np.allclose(workers.squares(t, t_low, min(t, 20.0)), whole.squares(t, t_low, min(t, 20.0)))
+    finally:
+        workers.close()
+    assert capsys.readouterr().out == '---' * 2           # one progress mark per chunk and time step
@@ -0,0 +1,189 @@
+import cmath
+import math
+import warnings
+
+import numpy as np
+import pytest
+from scipy import integrate
+
+import complex_integration as ci
+
+
+def quad_parts(func, a, b):
+    return ci.complex_quadrature_parts(func, a, b, epsabs=1E-13, epsrel=1E-13, limit=400)[0]
+
+
+f_osc = lambda t: np.exp(-t**2 / 8.) * np.exp(1j * 3.5 * t) * (1 + 0.2j * t)
+
+
+#-------------------------------------------------------------------------
+#   adaptive quadrature
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_complex_quadrature(vectorized):
+    I, err_re, err_im = ci.complex_quadrature(f_osc, -12., 9., epsabs=1E-12, epsrel=1E-12,
+                                              vectorized=vectorized)
+    assert abs(I - quad_parts(f_osc, -12., 9.)) < 1E-11
+    assert err_re[0] < 1E-11 and err_im[0] < 1E-11
+    assert abs(ci.complex_quadrature(f_osc, 9., -12.)[0] + I) < 1E-8
+
+
+def test_complex_quadrature_args_points_and_infinite_limits():
+    step = lambda t, c: np.exp(1j * c * t) * (t > 0.3)
+    I = ci.complex_quadrature(step, 0., 2., args=(2.,), points=[0.3])[0]
+    assert abs(I - (np.exp(4j) - np.exp(0.6j)) / 2j) < 1E-10
+    I = ci.complex_quadrature(f_osc, -np.inf, np.inf)[0]
+    assert abs(I - quad_parts(f_osc, -30., 30.)) < 1E-8
+
+
+def test_complex_quadrature_rejects_unknown_keywords():
+    with pytest.raises(TypeError):
+        ci.complex_quadrature(f_osc, 0., 1., full_output=1)
+
+
+def test_complex_quadrature_limit_warning():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        ci.complex_quadrature(lambda t: np.exp(1j * 400 * t), 0., 10., limit=3)
+    assert any(issubclass(w.category, integrate.IntegrationWarning) for w in caught)
+
+
+#-------------------------------------------------------------------------
+#   fixed-order Gauss-Legendre
+
+def test_gauss_legendre_is_computed_once():
+    assert ci.gauss_legendre(7) is ci.gauss_legendre(7)
+    x, w = ci.gauss_legendre(7)
+    assert np.isclose(np.sum(w), 2.) and np.isclose(np.sum(w * x**12), 2./13)
+
+
+def test_batch_nodes():
+    a = np.array([0., -1., 2.])
+    b = np.array([1., 3., 2.5])
+    nodes, weights = ci.batch_nodes(a, b, 5, 3)
+    assert nodes.shape == weights.shape == (15, 3)
+    assert np.allclose(np.sum(weights * nodes**9, axis=0), (b**10 - a**10) / 10)
+    assert np.allclose(np.sum(weights * np.cos(nodes), axis=0), np.sin(b) - np.sin(a), atol=1E-9)
+
+
+@pytest.mark.parametrize('chunk', [None, 2])
+def test_batch_integrate_against_complex_quadrature(chunk):
+    k = np.array([0.5, 2.0, 3.5, 6.0, -1.2])
+    a = np.array([-12., -12., -5., 0., -3.])
+    func = lambda x, k: np.exp(-x**2 / 8.) * np.exp(1j * k * x) * (1 + 0.2j * x)
+    I, err = ci.batch_integrate(func, a, 9., k, order=30, panels=6, chunk=chunk)
+    assert I.shape == err.shape == (5,)
+    for i in range(5):
+        exact = ci.complex_quadrature(lambda x: func(x, k[i]), a[i], 9., epsabs=1E-13, epsrel=1E-13)[0]
+        assert abs(I[i] - exact) < 1E-11
+    assert np.all(err < 1E-8)
+    I_low, err_low = ci.batch_integrate(func, a, 9., k, order=4)        # too few nodes: the estimate shows it
+    assert np.all(err_low > 0.1 * np.abs(I_low - I))
+
+
+#-------------------------------------------------------------------------
+#   Filon quadrature
+
+def test_filon_moments():
+    c = np.array([0.3j, 1.5 - 2j, 14j, -20. + 3j, 8.])          # both the quadrature and the recursion
+    M = ci.filon_moments(c, 10)
+    for i, c_i in enumerate(c):
+        for k in range(10):
+            exact = quad_parts(lambda x: x**k * np.exp(c_i * x), -1., 1.)
+            assert abs(M[i,k] - exact) < 1E-10 * max(1, abs(exact))
+
+
+def test_filon_integrals():
+    g = lambda t: np.exp(-t**2 / 8.) * (1 + 0.2j * t)
+    z = np.array([0., 1j * 2.0, 0.05 - 1j * 3.4, 1j * 40.])
+    G = ci.filon_integrals([(g, 3.5)], z, -12., 9.)
+    for zi, Gi in zip(z, G):
+        assert abs(Gi - quad_parts(lambda t: f_osc(t) * np.exp(zi * t), -12., 9.)) < 1E-10
+
+
+#-------------------------------------------------------------------------
+#   Romberg
+
+def test_trapezoid_levels_reuse_the_nodes():
+    nodes = []
+    def func(x):
+        nodes.append(x)
+        return x**2
+    levels = ci.trapezoid_levels(func, 0., 1.)
+    T = [next(levels) for k in range(4)]
+    assert len(nodes) == 2 + 1 + 2 + 4
+    assert np.isclose(T[3], 1./3 + 1./(6 * 8**2))
+
+
+@pytest.mark.parametrize('vec_func', [False, True])
+def test_complex_romberg(vec_func):
+    I = ci.complex_romberg(f_osc, -12., 9., vec_func=vec_func, divmax=14)
+    assert abs(I - quad_parts(f_osc, -12., 9.)) < 1E-8
+    assert ci.complex_romberg(f_osc, 2., 2.) == 0
+
+
+def test_complex_romberg_array_valued():
+    k = np.array([1., 2.5, 4.])
+    func = lambda t: np.exp(1j * np.multiply.outer(t, k))
+    I = ci.complex_romberg(func, 0., 2., vec_func=True, block=7)
+    assert np.allclose(I, (np.exp(2j * k) - 1) / (1j * k), atol=1E-8)
+
+
+def test_complex_romberg_divmax_warning():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        ci.complex_romberg(f_osc, -12., 9., divmax=3)
+    assert any(issubclass(w.category, integrate.IntegrationWarning) for w in caught)
+
+
+def test_complex_romberg_divmax_zero():
+    # no extrapolation at all: the trapezoidal rule with one interval
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        I = ci.complex_romberg(np.exp, 0., 1., divmax=0)
+    assert np.isclose(I, 0.5 * (1. + np.e))
+    assert any(issubclass(w.category, integrate.IntegrationWarning) for w in caught)
+
+
+def test_complex_romberg_converges_on_the_whole_block():
+    # the tiny second entry is not resolved relative to itself, only relative to the largest one
+    func = lambda t: np.exp(1j * np.multiply.outer(t, [1., 30.])) * [1., 1E-9]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        I = ci.complex_romberg(func, 0., 2., vec_func=True, rtol=1E-8, tol=0.)
+    assert abs(I[0] - (np.exp(2j) - 1) / 1j) < 1E-8
+    with pytest.warns(integrate.IntegrationWarning):
+        ci.complex_romberg(func, 0., 2., vec_func=True, rtol=1E-14, tol=0., divmax=6)
+
+
+def test_cumulative_romberg():
+    k = np.array([1., 2.5, 4.])
+    func = lambda t: np.exp(1j * np.multiply.outer(t, k))
+    I = ci.CumulativeRomberg(func, 0., vec_func=True)
+    for b in (0.5, 1.3, 2., 0.7):               # the last one starts again from a
+        assert np.allclose(I(b), (np.exp(1j * b * k) - 1) / (1j * k), atol=1E-8)
+    assert I(0.) == 0
+
+
+#-------------------------------------------------------------------------
+#   double integrals
+
+def test_complex_double_quadrature_scalar_callables():
+    # math/cmath integrands do not take arrays: the default evaluates them node by node
+    outer = lambda x: cmath.exp(1j * x)
+    inner = lambda y: math.exp(-y)
+    I, err = ci.complex_double_quadrature(outer, inner, 0., 2., 0., lambda x: x)
+    exact = (np.exp(2j) - 1) / 1j - (np.exp((1j - 1) * 2) - 1) / (1j - 1)
+    assert abs(I - exact) < 1E-10 and err[0] < 1E-8
+
+
+def test_complex_double_quadrature_against_inner_closed_form():
+    # the inner integral int_-5^x exp(c y) dy = (exp(c x) - exp(-5 c)) / c leaves a single quad
+    c = -0.1 + 1.3j
+    outer = lambda x: np.exp(-x**2 / 4.) * np.exp(2j * x)
+    inner = lambda y: np.exp(c * y)
+    I = ci.complex_double_quadrature(outer, inner, -5., 3., -5., lambda x: x, vectorized=True,
+                                     epsabs=1E-12, epsrel=1E-12)[0]
+    ref = ci.complex_quadrature(lambda x: outer(x) * (np.exp(c * x) - np.exp(-5. * c)) / c,
+                                -5., 3., epsabs=1E-13, epsrel=1E-13)[0]
+    assert abs(I - ref) < 1E-9
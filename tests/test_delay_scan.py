@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from scipy import fft
+from scipy import integrate
+from scipy.special import erf
+
+import amplitudes as amp
+import complex_integration as ci
+import delay_scan as ds
+
+
+A0X, Omega, sigma = 0.7, 3.5, 4.0
+TX = 5 * sigma
+
+f = lambda t: 1./ np.sqrt(2*np.pi * sigma**2) * np.exp(-t**2 / (2*sigma**2))
+fp = lambda t: - t / sigma**2 * f(t)
+FX_t1 = lambda t: - A0X * np.cos(Omega * t) * fp(t) + A0X * Omega * np.sin(Omega * t) * f(t)
+
+N_coeff, d_tau = 32, 1.5
+sort_freq = fft.fftshift(fft.fftfreq(N_coeff, d_tau))
+delta_ts = -7.3 + 0.9 * np.arange(6)
+
+
+@pytest.mark.parametrize('delta_ts', [delta_ts, delta_ts[2:3]])
+def test_delay_sums_against_direct_sum(delta_ts):
+    rng = np.random.RandomState(5)
+    b = rng.rand(N_coeff, 3) + 1j * rng.rand(N_coeff, 3)
+    direct = np.exp(-2j*np.pi * np.outer(delta_ts, sort_freq)).dot(b)
+    S = ds.delay_sums(b, sort_freq, N_coeff * d_tau, delta_ts)
+    assert S.shape == (len(delta_ts), 3)
+    assert np.allclose(S, direct, rtol=1E-12, atol=1E-12)
+    assert np.allclose(ds.delay_sums(b[:,0], sort_freq, N_coeff * d_tau, delta_ts), direct[:,0],
+                       rtol=1E-12, atol=1E-12)
+
+
+def test_resonant_sums_against_delay_loop():
+    # res_I of loop_delta.py (integ = analytic) for each delay: the outer integral of
+    # FX(t1) exp(t1 z_r) exp(-i gamma delta_t) / N sum_k c_k integ_res_k(t1)
+    rng = np.random.RandomState(2)
+    coeffs = rng.rand(N_coeff, 2) + 1j * rng.rand(N_coeff, 2)
+    E_kins, E_fin, Er, VEr = np.array([2.1, 2.6]), 1.0, 3.4, 0.05
+    t_au = 40.
+    gammas = Er - E_kins - E_fin - 1j*np.pi*VEr**2
+    z_r = np.pi * VEr**2 + 1j*Er
+    nu = 2*np.pi * sort_freq
+    G = amp.pulse_integrals(FX_t1, 1j * (E_kins + E_fin + nu[:,None]), -TX/2, TX/2, 'analytic',
+                            gauss=(A0X, Omega, sigma))
+    G_res = amp.pulse_integrals(FX_t1, np.array([z_r]), -TX/2, TX/2, 'analytic', gauss=(A0X, Omega, sigma))[0]
+    res = ds.resonant_sums(coeffs, sort_freq, N_coeff * d_tau, G, G_res, gammas, t_au, delta_ts)
+    assert res.shape == (len(delta_ts), 2)
+    for m, delta_t in enumerate(delta_ts):
+        for E_ind, gamma in enumerate(gammas):
+            integ_res = lambda t1: (1./(1j * nu - 1j*gamma)
+                                    * (np.exp(1j * (t_au - delta_t) * (nu - gamma))
+                                       - np.exp(1j * (t1 - delta_t) * (nu - gamma))))
+            loop = ci.complex_quadrature(lambda t1: FX_t1(t1) * np.exp(t1 * z_r) / N_coeff
+                                                    * np.exp(-1j * gamma * delta_t)
+                                                    * np.dot(coeffs[:,E_ind], integ_res(t1)),
+                                         -TX/2, TX/2, epsabs=0., epsrel=1E-12, limit=500)[0]
+            assert abs(res[m,E_ind] - loop) < 1E-9 * abs(loop)
+
+
+def gauss_phase(tau, sigma_L=6., omega=0.8):
+    # IR_phase of loop_delta.py for the gauss IR pulse, with the factor of alpha that keeps it of order one
+    return (np.exp(-omega**2 * sigma_L**2 / 2)
+            * np.real(erf(tau/np.sqrt(2)/sigma_L + 1j*omega * sigma_L / np.sqrt(2))))
+
+
+def test_direct_integrals_against_quadrature():
+    E_dir, alphas = np.array([2.1, 3.3, 4.0]), np.array([0.5, 1.2, 2.0])
+    I1, err = ds.direct_integrals(FX_t1, -TX/2, TX/2, E_dir, alphas, gauss_phase, delta_ts,
+                                  order=10, panels=2, epsrel=1E-12)
+    assert I1.shape == (len(delta_ts), 3) and err <= 1E-12 * np.max(np.abs(I1))
+    for m, delta_t in enumerate(delta_ts):
+        for E_ind in range(3):
+            ref = ci.complex_quadrature(lambda t1: FX_t1(t1) * np.exp(1j * E_dir[E_ind] * t1)
+                                                   * np.exp(1j * alphas[E_ind] * gauss_phase(t1 - delta_t)),
+                                        -TX/2, TX/2, epsabs=1E-13, epsrel=1E-11, limit=500)[0]
+            assert abs(I1[m,E_ind] - ref) < 1E-11 * np.max(np.abs(I1))
+
+
+def test_direct_integrals_warn_when_under_resolved():
+    with pytest.warns(integrate.IntegrationWarning):
+        I1, err = ds.direct_integrals(FX_t1, -TX/2, TX/2, [2.1], [0.5], gauss_phase, delta_ts,
+                                      order=4, panels=1, maxpanels=2)
+    assert err > 1E-8 * np.max(np.abs(I1))
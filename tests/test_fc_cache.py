@@ -0,0 +1,43 @@
+import fc_cache
+
+
+calls = []
+
+def overlap(n, alpha, Req, V_of_R=None):
+    calls.append(n)
+    return complex(n * alpha, Req) if V_of_R else n * alpha
+
+
+def test_without_path_calls_through():
+    del calls[:]
+    fc = fc_cache.FCCache(None)
+    assert fc(overlap, 2, 0.5, 1.0) == 1.0
+    assert fc(overlap, 2, 0.5, 1.0) == 1.0
+    assert calls == [2, 2]
+    assert (fc.hits, fc.misses) == (0, 0)
+    fc.close()
+
+
+def test_stored_overlaps_are_reused(tmp_path):
+    del calls[:]
+    path = str(tmp_path / 'fc_cache.sqlite')
+    fc = fc_cache.FCCache(path)
+    assert fc(overlap, 2, 0.5, 1.0) == 1.0
+    assert fc(overlap, 2, 0.5, 1.0, V_of_R=lambda R: R, V_tag='R6') == complex(1.0, 1.0)
+    fc.close()
+
+    fc = fc_cache.FCCache(path)          # a later run reads both from the file
+    assert fc(overlap, 2, 0.5, 1.0) == 1.0
+    assert fc(overlap, 2, 0.5, 1.0, V_of_R=lambda R: R, V_tag='R6') == complex(1.0, 1.0)
+    assert fc(overlap, 3, 0.5, 1.0) == 1.5
+    assert calls == [2, 2, 3]
+    assert (fc.hits, fc.misses) == (2, 1)
+    fc.close()
+
+
+def test_file_tag_depends_on_content(tmp_path):
+    a, b = tmp_path / 'a.dill', tmp_path / 'b.dill'
+    a.write_bytes(b'gamma 1')
+    b.write_bytes(b'gamma 2')
+    assert fc_cache.file_tag(str(a)) != fc_cache.file_tag(str(b))
+    assert fc_cache.file_tag(str(a)).startswith('file:')
@@ -0,0 +1,133 @@
+import io
+
+import numpy as np
+import pytest
+
+import in_out
+import sciconv
+
+
+def read_ensemble(tmp_path, text):
+    path = tmp_path / 'photonucl.in'
+    path.write_text(text)
+    return in_out.read_ensemble_input(str(path), io.StringIO())
+
+
+def test_read_ensemble_input_defaults(tmp_path):
+    assert read_ensemble(tmp_path, 'Er_a_eV = 150.0\n') == (0, 0, 0, 1, 1, 0)
+
+
+def test_read_ensemble_input(tmp_path):
+    text = ('gs_de   = 1.32E-4   # comment\n'
+            'gs_a    = 1.0\n'
+            'gs_Req  = 5.84\n'
+            'n_traj  = 64\n'
+            'ens_workers = 4\n'
+            'ens_seed = 7\n')
+    assert read_ensemble(tmp_path, text) == (1.32E-4, 1.0, 5.84, 64, 4, 7)
+
+
+def test_ensemble_needs_the_ground_state(tmp_path):
+    with pytest.raises(SystemExit):
+        read_ensemble(tmp_path, 'n_traj = 8\ngs_de = 1.32E-4\n')
+
+
+def test_spectrum_writer_ensemble_average():
+    full, movie = io.StringIO(), io.StringIO()
+    spec_out = in_out.SpectrumWriter(full, movie, n_rows=2)
+    Ekins_au = sciconv.ev_to_hartree(np.array([1., 2., 3.]))
+    spec_out.extend(Ekins_au, [1., 2., 3.])
+    spec_out.extend(Ekins_au, [3., 4., 5.])
+    assert np.allclose(spec_out.write(sciconv.second_to_atu(1E-16), ensemble=2), [2., 3., 4.])
+    lines = full.getvalue().split('\n')
+    assert [float(line.split()[0]) for line in lines[:3]] == [1., 2., 3.]
+    assert [float(line.split()[2]) for line in lines[:3]] == [2., 3., 4.]
+    assert lines[3] == ''
+    assert spec_out.rows()[0].size == 0
+
+
+def spectrum_grid():
+    Ekins_au = sciconv.ev_to_hartree(np.array([0.5, 1.25, 4.0]))
+    Eps_au = sciconv.ev_to_hartree(np.array([0.0, 0.1]))
+    t_au = [sciconv.second_to_atu(t_s) for t_s in (-2E-16, 0., 3.5E-15)]
+    squares = [np.arange(6.).reshape(3, 2) * 10.**k + 1E-9 for k in range(3)]
+    return Ekins_au, Eps_au, t_au, squares
+
+
+def test_spectrum_writer_grid_lines_as_before():
+    Ekins_au, Eps_au, t_au, squares = spectrum_grid()
+    full, movie = io.StringIO(), io.StringIO()
+    old_full, old_movie = io.StringIO(), io.StringIO()
+    spec_out = in_out.SpectrumWriter(full, movie, Ekins_au, Eps_au)
+    for t, sq in zip(t_au, squares):
+        spec_out.write(t, sq)
+        outlines = [in_out.prep_output(sq[i,j], Ekins_au[i], t, Eps_au[j])
+                    for i in range(len(Ekins_au)) for j in range(len(Eps_au))]
+        in_out.doout_1f(old_full, outlines)
+        old_movie.write(in_out.prep_movie_header(t) + '\n')
+        in_out.doout_movie(old_movie, outlines)
+    assert full.getvalue() == old_full.getvalue()
+    assert movie.getvalue() == old_movie.getvalue()
+
+
+def test_spectrum_writer_rows_grow():
+    full = io.StringIO()
+    spec_out = in_out.SpectrumWriter(full, n_rows=1)
+    Ekins_au = sciconv.ev_to_hartree(np.linspace(1., 5., 5))
+    for E_kin_au in Ekins_au:
+        spec_out.add(2 * E_kin_au, E_kin_au)
+    assert np.allclose(spec_out.write(0.), 2 * Ekins_au)
+    lines = full.getvalue().split('\n')
+    assert lines[0] == format(1., '>8.5f') + '   ' + format(0., ' .18f') + '   ' + format(2 * Ekins_au[0], '.15e')
+    assert len(lines) == 5 + 2
+
+
+def test_text_output_wp_lines_as_before():
+    Ekins_au, Eps_au, t_au, squares = spectrum_grid()
+    wp_res, old_wp_res = io.StringIO(), io.StringIO()
+    out = in_out.TextOutput(io.StringIO(), None, wp_res, Ekins_au, Eps_au, 2)
+    wp = np.array([[1+2j, -0.5j], [3., 4e-12+1j]])
+    out.write(t_au[1], squares[1], wp)
+    in_out.doout_1f(old_wp_res, [in_out.prep_output_wp(nlambda, wp[nlambda,j], t_au[1], Eps_au[j])
+                                 for nlambda in range(2) for j in range(2)])
+    assert wp_res.getvalue() == old_wp_res.getvalue()
+
+
+@pytest.mark.parametrize('fmt', ['npz', 'npy-mmap', 'hdf5'])
+def test_binary_output_round_trip(tmp_path, fmt):
+    if (fmt == 'hdf5'):
+        pytest.importorskip('h5py')
+    Ekins_au, Eps_au, t_au, squares = spectrum_grid()
+    wps = [np.array([[1+2j, -0.5j], [3., 4e-12+1j]]) * (k + 1) for k in range(3)]
+    prefix = str(tmp_path / 'full')
+    out = in_out.BinaryOutput(fmt, Ekins_au, Eps_au, 2, 5, prefix=prefix)
+    text = in_out.TextOutput(io.StringIO(), io.StringIO(), io.StringIO(), Ekins_au, Eps_au, 2)
+    for t, sq, wp in zip(t_au, squares, wps):
+        out.write(t, sq, wp)
+        text.write(t, sq, wp)
+    out.close()
+
+    path = {'npz': prefix + '.npz', 'npy-mmap': prefix + '_squares.npy', 'hdf5': prefix + '.h5'}[fmt]
+    data = in_out.read_binary_output(path)
+    assert np.array_equal(data['t_au'], t_au)           # npy-mmap: only the 3 of 5 preallocated steps that were written
+    assert np.array_equal(data['squares'], squares)
+    assert np.array_equal(data['wp'], wps)
+    assert np.array_equal(data['Ekins_au'], Ekins_au) and np.array_equal(data['Eps_au'], Eps_au)
+
+    full, movie, wp_res = io.StringIO(), io.StringIO(), io.StringIO()
+    in_out.binary_to_text(data, full, movie, wp_res)
+    assert full.getvalue() == text.spec.full.getvalue()
+    assert movie.getvalue() == text.spec.movie.getvalue()
+    assert wp_res.getvalue() == text.wp_res.getvalue()
+
+
+def test_binary_output_without_spectrum(tmp_path):
+    Ekins_au, Eps_au, t_au, squares = spectrum_grid()
+    prefix = str(tmp_path / 'full')
+    out = in_out.BinaryOutput('npz', Ekins_au, Eps_au, 1, 3, prefix=prefix, spectrum=False)
+    out.write(t_au[0], None, np.ones((1, 2)))
+    out.close()
+    data = in_out.read_binary_output(prefix + '.npz')
+    assert data['squares'].shape == (1, 0, 0) and data['wp'].shape == (1, 1, 2)
+    with pytest.raises(ValueError):
+        in_out.BinaryOutput('csv', Ekins_au, Eps_au, 1, 3, prefix=prefix)
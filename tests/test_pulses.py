@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from scipy import integrate
+
+import pulses
+
+
+A0X, Omega, sigma = 0.7, 3.5, 4.0
+t = np.linspace(-15., 15., 61)
+
+
+def quad(func, a, b):
+    re = integrate.quad(lambda s: np.real(func(s)), a, b, epsabs=1E-12, epsrel=1E-10, limit=400)[0]
+    im = integrate.quad(lambda s: np.imag(func(s)), a, b, epsabs=1E-12, epsrel=1E-10, limit=400)[0]
+    return re + 1j * im
+
+
+def test_xuv_gauss_matches_the_lambdas():
+    X = pulses.XUVPulse(A0X, Omega, sigma=sigma)
+    assert np.allclose(X.f(t), pulses.f_t1(None, sigma)(t))
+    assert np.allclose(X.fp(t), pulses.fp_t1(None, sigma)(t))
+    assert np.allclose(X.FX(t), pulses.FX_t1(None, A0X, Omega, sigma)(t))
+
+
+@pytest.mark.parametrize('kwargs', [{'shape': 'gauss', 'sigma': sigma},
+                                    {'shape': 'sinsq', 'TX_au': 20.},
+                                    {'shape': 'gauss', 'sigma': sigma, 'form': 'infinite'}])
+def test_xuv_derivative_and_envelopes(kwargs):
+    X = pulses.XUVPulse(A0X, Omega, **kwargs)
+    h = 1E-5
+    s = t + 0.25                                # away from the kinks of sinsq at +-TX/2
+    assert np.allclose(X.fp(s), (X.f(s + h) - X.f(s - h)) / (2*h), atol=1E-8)
+    FX = sum(g(t) * np.exp(1j * omega * t) for g, omega in X.envelopes())
+    assert np.allclose(FX, X.FX(t), atol=1E-14)
+
+
+def test_xuv_sinsq_envelope():
+    X = pulses.XUVPulse(A0X, Omega, shape='sinsq', TX_au=20.)
+    assert np.allclose(X.f(np.array([-10., -5., 0., 5., 10.])), [0., 0.5, 1., 0.5, 0.], atol=1E-15)
+    assert np.all(X.f(np.array([-15., 10.5])) == 0) and np.all(X.FX(np.array([-15., 10.5])) == 0)
+
+
+def test_xuv_pulse_errors():
+    with pytest.raises(ValueError):
+        pulses.XUVPulse(A0X, Omega, shape='sinsq', sigma=sigma)
+    with pytest.raises(ValueError):
+        pulses.XUVPulse(A0X, Omega, shape='lorentz', sigma=sigma)
+
+
+def test_grid_cache():
+    calls = []
+    def func(s):
+        calls.append(len(s))
+        return 2*s
+    cache = pulses.GridCache(size=2)
+    first = cache.get('A', t, func)
+    assert cache.get('A', t.copy(), func) is first
+    cache.get('B', t, func)
+    cache.get('A', t[:10], func)                # pushes the first entry out
+    assert np.array_equal(cache.get('A', t, func), 2*t)
+    assert calls == [61, 61, 10, 61]
+
+    X = pulses.XUVPulse(A0X, Omega, sigma=sigma, cache=True)
+    assert X.FX(t) is X.FX(t)
+
+
+@pytest.mark.parametrize('omega, sig', [(0., 3.), (0.057, 400.), (2.5, 4.)])
+def test_gauss_cumulative(omega, sig):
+    integrand = lambda u: np.exp(-u**2 / (2*sig**2)) * np.exp(1j * omega * u)
+    for s in (-3*sig, -0.2*sig, 0., 1.5*sig):
+        exact = quad(integrand, -12*sig, s)
+        assert abs(pulses.gauss_cumulative(s, omega, sig) - exact) < 1E-9 * sig
+    assert np.all(np.isfinite(pulses.gauss_cumulative(np.linspace(-40., 40., 9), 10., 20.)))
+
+
+@pytest.mark.parametrize('kwargs', [{'shape': 'sinsq', 'TL_au': 300.},
+                                    {'shape': 'sinsq', 'TL_au': 2*np.pi / 0.3},          # one cycle: omega = kappa
+                                    {'shape': 'gauss', 'sigma_L': 40.},
+                                    {'shape': 'sinsq', 'TL_au': 300., 't_ref': 20.}])
+def test_ir_pulse_A_int(kwargs):
+    L = pulses.IRPulse(0.02, 0.3, delta_t_au=20., phi=0.4, **kwargs)
+    t_start = 20. - kwargs['TL_au']/2 if 'TL_au' in kwargs else 20. - 12 * kwargs['sigma_L']
+    for s in (-100., 0., 35., 200.):
+        exact = quad(L.A, t_start, s) if s > t_start else 0.
+        assert abs(L.A_int(s) - exact) < 1E-9
+    if 'TL_au' in kwargs:
+        assert L.A(20. + kwargs['TL_au']) == 0
+        assert L.A_int(t_start - 10.) == 0
+
+
+def test_ir_pulse_errors():
+    with pytest.raises(ValueError):
+        pulses.IRPulse(0.02, 0.3, shape='gauss', TL_au=300.)
+    with pytest.raises(ValueError):
+        pulses.IRPulse(0.02, 0.3, shape='box', TL_au=300.)
+
+
+#-------------------------------------------------------------------------
+#   Volkov phase
+
+@pytest.mark.parametrize('kwargs', [{'shape': 'sinsq', 'TL_au': 300.}, {'shape': 'gauss', 'sigma_L': 40.}])
+def test_volkov_phase(kwargs):
+    L = pulses.IRPulse(0.05, 0.3, delta_t_au=20., phi=0.4, **kwargs)
+    volkov = pulses.VolkovPhase(L)
+    p = np.array([0.5, 1.2])[:,None]
+    t1 = np.array([-300., -60., 10.])
+    t2 = 90.
+    phase = volkov(p, t1, t2)
+    assert phase.shape == (2, 3)
+    for i in range(2):
+        for j in range(3):
+            exact = quad(lambda s: (p[i,0] + L.A(s))**2, t1[j], t2)
+            assert abs(phase[i,j] - exact) < 1E-9
+    # outside the pulse only p**2 (t2 - t1) is left
+    t_end = volkov.t[-1]
+    assert np.allclose(volkov(p, t_end + 5., t_end + 50.), p**2 * 45., rtol=1E-12)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import res_history
+
+
+def old_sums(res_tuples, n_E, n, n_limit, E_index, t_au, E_kin_au, Ires, I1, dir_J):
+    # the loop over res_tuples that measure_tmin, measure_interfere and measure_split used before
+    J = 0
+    square = 0
+    for time in range(0,n+1):
+        first = res_tuples[n_E*time + E_index][1] * Ires
+        if (time !=1):
+            sec = res_tuples[n_E*time + E_index][2] * Ires
+        else:
+            sec = res_tuples[n_E*time + E_index][2] * I1
+        new_part = (first - sec) \
+                   * np.exp(-1j * t_au * (E_kin_au
+                            + res_tuples[n_E*time + E_index][3]))
+        if (time < n_limit):
+            J = J + new_part
+        else:
+            square = square + np.absolute(new_part + dir_J)**2
+    return J, square
+
+
+@pytest.mark.parametrize('n_limit', [0, 1, 2, 5, 40])
+def test_against_res_tuples(n_limit):
+    rng = np.random.RandomState(n_limit)
+    n_E, n_steps = 3, 25
+    E_kins = np.array([0.1, 0.5, 2.0])
+    hist = res_history.ResonanceHistory(1, n_phi=2)          # both arrays have to grow
+    res_tuples = []
+    for n in range(n_steps):
+        # constant energy up to n_limit (frozen nuclei), then a new one at most steps and a repeated one at some
+        if (n < n_limit):
+            phi = 0.8
+        elif (n % 4 == 0):
+            phi = 0.9
+        else:
+            phi = 0.8 + 0.01 * n
+        for E_index in range(n_E):
+            r1, r2 = rng.randn(2) + 1j * rng.randn(2)
+            if (n % 7 == 6):
+                r1, r2 = 0, 0                   # E_res_R < E_fin_R: no resonance amplitude in this step
+            res_tuples.append(tuple((n, r1, r2, phi)))
+            hist.add(E_index, n, r1, r2, phi, coherent=(n < n_limit))
+
+        t_au = 3.0 + 1.7 * n
+        for E_index in range(n_E):
+            Ires, I1, dir_J = rng.randn(3) + 1j * rng.randn(3)
+            J, square = old_sums(res_tuples, n_E, n, n_limit, E_index, t_au, E_kins[E_index], Ires, I1, dir_J)
+            assert np.allclose(hist.coherent_sum(E_index, t_au, E_kins[E_index], Ires, I1), J,
+                               rtol=1E-12, atol=1E-12)
+            assert np.allclose(hist.incoherent_sum(E_index, t_au, E_kins[E_index], Ires, I1, dir_J), square,
+                               rtol=1E-12, atol=1E-12)
+
+
+def test_empty_history():
+    hist = res_history.ResonanceHistory(4)
+    assert hist.coherent_sum(2, 1.0, 0.5, 1+1j, 2.) == 0
+    assert hist.incoherent_sum(2, 1.0, 0.5, 1+1j, 2., 3j) == 0
+
+
+def test_steps_with_one_energy_share_a_column():
+    hist = res_history.ResonanceHistory(2)
+    for n in range(10):
+        hist.add(0, n, 1., 0.5, 0.8)
+        hist.add(1, n, 2., 0.5, 0.8)
+    assert hist.n_phi == 1
+    assert np.allclose(hist.coh[:, 0], [9 * 0.5, 9 * 1.5])    # step 1 is kept apart for I1
+
+
+def test_new_columns_within_a_time_step():
+    # the scripts add the amplitudes of a step E_kin by E_kin between the sums at the same time
+    hist = res_history.ResonanceHistory(2)
+    hist.add(0, 2, 1., 0.5, 0.8)
+    assert np.isclose(hist.coherent_sum(0, 4.0, 0.3, 1., 1.), 0.5 * np.exp(-4j * 1.1))
+    hist.add(1, 2, 2., 0.5, 0.9)                # second column at the same t
+    assert np.isclose(hist.coherent_sum(1, 4.0, 0.3, 1., 1.), 1.5 * np.exp(-4j * 1.2))
+    assert np.isclose(hist.coherent_sum(0, 4.0, 0.3, 1., 1.), 0.5 * np.exp(-4j * 1.1))
+
+
+def test_split_form_against_res_tuples():
+    # measure_split: incoherent steps with r2 = 0 and Ires = I1 = 1
+    rng = np.random.RandomState(7)
+    n_E = 4
+    E_kins = np.linspace(0.2, 1.4, n_E)
+    hist = res_history.ResonanceHistory(n_E)
+    res_tuples = []
+    for n in range(12):
+        for E_index in range(n_E):
+            store = rng.randn() + 1j * rng.randn()
+            res_tuples.append(tuple((n, store, 0.3 + 0.02 * (n % 5))))
+            hist.add(E_index, n, store, 0, 0.3 + 0.02 * (n % 5), coherent=False)
+        t_au = 2.0 + 0.9 * n
+        for E_index in range(n_E):
+            dir_J1 = rng.randn() + 1j * rng.randn()
+            square = 0
+            for time in range(0,n+1):
+                square = square + np.absolute(res_tuples[n_E*time + E_index][1]
+                         * np.exp(-1j * t_au * (E_kins[E_index] + res_tuples[n_E*time + E_index][2]))
+                         + dir_J1 )**2
+            assert np.allclose(hist.incoherent_sum(E_index, t_au, E_kins[E_index], 1, 1, dir_J1), square,
+                               rtol=1E-12, atol=1E-12)
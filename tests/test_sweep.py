@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import sweep
+
+
+# stand-in for a simulation script: writes x * y to full.dat, fails for y = 3
+SCRIPT = '''import sys
+params = dict(line.split('#')[0].split('=') for line in open(sys.argv[-1]) if '=' in line)
+x, y = float(params['x ']), float(params['y '])
+open('full.dat', 'w').write('1.0 ' + repr(x * y) + '\\n')
+sys.exit(1 if y == 3 else 0)
+'''
+
+
+def test_parse_range():
+    assert sweep.parse_range('n_X=5:20:5') == ('n_X', ['5', '10', '15', '20'])
+    assert sweep.parse_range('n=3:1:-1') == ('n', ['3', '2', '1'])
+    assert sweep.parse_range('Omega_eV=45:45.3:0.1') == ('Omega_eV', ['45', '45.1', '45.2', '45.3'])
+    assert sweep.parse_range('delta_t_s=-1E-16:1E-16:1E-16') == ('delta_t_s', ['-1e-16', '0', '1e-16'])
+    assert sweep.parse_range(' res_a = 1, 1.5 ') == ('res_a', ['1', '1.5'])
+    with pytest.raises(ValueError):
+        sweep.parse_range('res_a')
+
+
+def test_grid_points():
+    points = sweep.grid_points([('a', ['1', '2']), ('b', ['x', 'y', 'z'])])
+    assert len(points) == 6
+    assert points[:2] == [{'a': '1', 'b': 'x'}, {'a': '1', 'b': 'y'}]
+
+
+def test_write_input(tmp_path):
+    base = ['# photo.in\n', 'Omega_eV = 45.0   # XUV energy\n', 'n_X   = 5\n', 'tmax_s = 1E-15\n']
+    path = tmp_path / 'photo.in'
+    sweep.write_input(base, {'Omega_eV': '46.5', 'n_X': '10'}, str(path))
+    assert path.read_text().splitlines() == ['# photo.in', 'Omega_eV = 46.5   # XUV energy', 'n_X = 10',
+                                             'tmax_s = 1E-15']
+    with pytest.raises(ValueError, match='res_a'):           # read_input would ignore it
+        sweep.write_input(base, {'Omega_eV': '46.5', 'res_a': '1.5'}, str(path))
+
+
+def test_run_sweep_rejects_unknown_names(tmp_path):
+    base = tmp_path / 'photo.in'
+    base.write_text('x = 0.0\n')
+    store = sweep.SweepStore(str(tmp_path / 'sweep.sqlite'))
+    with pytest.raises(ValueError):
+        sweep.run_sweep(str(tmp_path / 'script.py'), str(base), [sweep.parse_range('X=1,2')], store,
+                        workdir=str(tmp_path / 'runs'))
+    store.close()
+    assert not (tmp_path / 'runs').exists()
+
+
+def test_store_key(tmp_path):
+    script, copy = tmp_path / 'eldest.py', tmp_path / 'copy.py'
+    script.write_text(SCRIPT)
+    copy.write_text(SCRIPT)
+    key = sweep.SweepStore.key(str(script), 'x = 1\n', {'x': '2', 'y': '1'})
+    assert key == sweep.SweepStore.key(str(copy), 'x = 1\n', {'y': '1', 'x': '2'})
+    assert key != sweep.SweepStore.key(str(script), 'x = 2\n', {'x': '2', 'y': '1'})
+    assert key != sweep.SweepStore.key(str(script), 'x = 1\n', {'x': '2', 'y': '1'}, ['--workers', '2'])
+    script.write_text(SCRIPT + '# changed\n')
+    assert key != sweep.SweepStore.key(str(script), 'x = 1\n', {'x': '2', 'y': '1'})
+
+
+def test_run_sweep(tmp_path, capsys):
+    script = tmp_path / 'script.py'
+    script.write_text(SCRIPT)
+    base = tmp_path / 'photo.in'
+    base.write_text('x = 0.0   # first\ny = 0.0\n')
+    store_path = str(tmp_path / 'db' / 'sweep.sqlite')
+    ranges = [sweep.parse_range('x=1,2'), sweep.parse_range('y=1:3:1')]
+    opts = {'workdir': str(tmp_path / 'runs'), 'outputs': ['full.dat']}
+
+    store = sweep.SweepStore(store_path)
+    assert sweep.run_sweep(str(script), str(base), ranges, store, workers=2, **opts) == 2
+    assert len(store.points()) == 4 and len(store.points('failed')) == 2
+    store.close()
+
+    results = sweep.load_results(store_path)
+    assert sorted(results) == [(('x', x), ('y', y)) for x in ('1', '2') for y in ('1', '2')]
+    for params, table in results.items():
+        assert np.allclose(table, [[1.0, float(params[0][1]) * float(params[1][1])]])
+
+    # the finished points are skipped, the failed ones are run again
+    store = sweep.SweepStore(store_path)
+    capsys.readouterr()
+    assert sweep.run_sweep(str(script), str(base), ranges, store, workers=1, **opts) == 2
+    store.close()
+    assert 'Sweep over 6 points, 4 already done, 2 to run' in capsys.readouterr().out
+    assert len(list((tmp_path / 'runs').iterdir())) == 2          # only the failed points keep their directory
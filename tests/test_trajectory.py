@@ -0,0 +1,153 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+import in_out
+import potentials
+import trajectory
+
+
+red_mass = 18218.
+k = 0.05                                    # harmonic force constant (hartree / bohr**2)
+harm_grad = lambda t, R: k * (R - 5.8)
+omega = np.sqrt(k / red_mass)
+
+
+def test_time_grid_includes_tmax():
+    t = trajectory.time_grid(-10., 2.5, 5.)
+    assert np.allclose(t, [-10., -7.5, -5., -2.5, 0., 2.5, 5.])
+    assert len(trajectory.time_grid(0., 1., -1.)) == 1
+
+
+@pytest.mark.parametrize('method, tol', [('verlet', 1E-5), ('rk45', 1E-8)])
+def test_harmonic_oscillator(method, tol):
+    t = trajectory.time_grid(0., 5., 2000.)
+    R0 = np.array([5.9, 5.7, 5.8])
+    P0 = np.array([0., 1., -2.])
+    R, P = trajectory.propagate(R0, P0, red_mass, t, harm_grad, method)
+    assert R.shape == P.shape == (len(t), 3)
+    exact_R = 5.8 + (R0 - 5.8) * np.cos(omega * t[:,None]) + P0 / (red_mass * omega) * np.sin(omega * t[:,None])
+    assert np.max(np.abs(R - exact_R)) < tol
+
+
+def test_verlet_and_rk45_agree_on_expr6():
+    V = (-33.179112, 1.930064, 37.757254, 47.6930)
+    grad = lambda t, R: potentials.expr6_grad(*(V + (R,)))
+    t = trajectory.time_grid(0., 10., 5000.)
+    Rv, Pv = trajectory.propagate(6.2, 0., red_mass, t, grad, 'verlet')
+    Rr, Pr = trajectory.propagate(6.2, 0., red_mass, t, grad, 'rk45')
+    assert np.max(np.abs(Rv - Rr)) < 1E-5
+    energy = Pv[:,0]**2 / (2*red_mass) + potentials.expr6(*(V + (Rv[:,0],)))
+    assert np.max(np.abs(energy - energy[0])) < 1E-8
+
+
+def test_grid_switching_potential():
+    # frozen up to t = 0: the nuclei start to move only with the first step ending after t = 0
+    t = trajectory.time_grid(-20., 5., 20.)
+    grad = lambda s, R: np.zeros_like(R) if (s <= 0) else harm_grad(s, R)
+    R, P = trajectory.propagate(6.0, 0., red_mass, t, grad)
+    assert np.all(R[t <= 0] == 6.0) and np.all(P[t <= 0] == 0.)
+    assert np.all(R[t > 0] < 6.0)
+
+
+def test_unknown_propagator():
+    with pytest.raises(ValueError):
+        trajectory.propagate(6.0, 0., red_mass, [0., 1.], harm_grad, 'euler')
+
+
+@pytest.mark.parametrize('name, V', [('expr6', (-33.179112, 1.930064, 37.757254, 47.6930)),
+                                     ('hyperbel', (13.915571, 42.516162))])
+def test_potential_gradients(name, V):
+    R = np.linspace(4.5, 9., 10)
+    h = 1E-5
+    fun = getattr(potentials, name)
+    numerical = (fun(*(V + (R + h,))) - fun(*(V + (R - h,)))) / (2*h)
+    assert np.allclose(getattr(potentials, name + '_grad')(*(V + (R,))), numerical, rtol=1E-6)
+
+
+def test_nuclear_tables():
+    t = trajectory.time_grid(-3., 0.5, 2.)
+    R = 5. + np.outer(t, [1., 2.])
+    tables = trajectory.NuclearTables(t, R, np.zeros_like(R), twice=lambda R: 2*R)
+    assert np.array_equal(tables.twice, 2*R)
+    t_au = -3.
+    for n in range(len(t)):
+        assert tables.index(t_au) == n          # t_au accumulated as in the scripts
+        t_au = t_au + 0.5
+    assert tables.index(-100.) == 0
+    assert tables.index(100.) == len(t) - 1
+
+
+def test_kinetic_energy_of_moving_starts():
+    # Wigner-type starts away from the minimum with P0 != 0: T_K is P**2 / (2 mu), i. e. the total energy
+    # of each trajectory minus V(R), not V(R_eq) - V(R) of a start at rest in the minimum
+    V = lambda R: k / 2 * (R - 5.8)**2
+    t = trajectory.time_grid(0., 5., 2000.)
+    R0 = np.array([5.9, 5.7, 5.8])
+    P0 = np.array([0., 1., -2.])
+    R, P = trajectory.propagate(R0, P0, red_mass, t, harm_grad, 'rk45')
+    tables = trajectory.NuclearTables(t, R, P, E_res=V)
+    T_K = tables.kinetic(red_mass)
+    assert T_K.shape == (len(t), 3) and np.all(T_K >= 0)
+    assert np.allclose(T_K[0], P0**2 / (2*red_mass))
+    assert np.allclose(T_K, P0**2 / (2*red_mass) + V(R0) - tables.E_res, rtol=0, atol=1E-9)
+    assert np.min(V(5.8) - tables.E_res) < -1E-4     # the formula for a start at rest goes negative
+
+
+#-------------------------------------------------------------------------
+#   ensembles
+
+def test_morse_wigner_moments():
+    De, alpha, Req = 0.01, 1.0, 5.8
+    R0, P0 = trajectory.morse_wigner(De, alpha, Req, red_mass, 20000, seed=1)
+    R = np.linspace(Req - 2., Req + 3., 20001)
+    rho = trajectory.wf.psi_n(R, 0, alpha, Req, red_mass, De)**2
+    rho = rho / np.sum(rho)
+    mean_R = np.sum(R * rho)
+    var_R = np.sum((R - mean_R)**2 * rho)
+    sigma_P = np.sqrt(red_mass * alpha * np.sqrt(2*De / red_mass) / 2)
+    assert abs(np.mean(R0) - mean_R) < 0.05 * np.sqrt(var_R)
+    assert abs(np.var(R0) / var_R - 1) < 0.05
+    assert abs(np.mean(P0)) < 0.05 * sigma_P
+    assert abs(np.std(P0) / sigma_P - 1) < 0.05
+
+
+def test_morse_wigner_seed():
+    first = trajectory.morse_wigner(0.01, 1.0, 5.8, red_mass, 10, seed=4)
+    again = trajectory.morse_wigner(0.01, 1.0, 5.8, red_mass, 10, seed=4)
+    other = trajectory.morse_wigner(0.01, 1.0, 5.8, red_mass, 10, seed=5)
+    assert np.array_equal(first[0], again[0]) and np.array_equal(first[1], again[1])
+    assert not np.array_equal(first[0], other[0])
+
+
+@pytest.mark.parametrize('n_traj, workers', [(5, 1), (5, 3), (2, 4)])
+def test_ensemble_shards_keep_the_order(n_traj, workers):
+    shards = trajectory.EnsembleShards(n_traj, workers)
+    spec_out = in_out.SpectrumWriter(io.StringIO(), n_rows=4)
+    for step in range(2):                   # the processes are forked anew at every time step
+        def traj_step(j):
+            for E in (1., 2., 3.):
+                spec_out.add(100*step + 10*j + E, E)
+        shards.run(traj_step, spec_out)
+        Ekins, squares = spec_out.rows()
+        assert list(Ekins) == [1., 2., 3.] * n_traj
+        assert list(squares) == [100*step + 10*j + E for j in range(n_traj) for E in (1., 2., 3.)]
+        assert np.allclose(spec_out.write(0., ensemble=n_traj), 100*step + 5*(n_traj-1) + np.array([1., 2., 3.]))
+
+
+def test_ensemble_shards_report_failing_workers():
+    shards = trajectory.EnsembleShards(4, 2)
+    spec_out = in_out.SpectrumWriter(io.StringIO(), n_rows=4)
+    def traj_step(j):
+        if (j == 3):
+            raise ValueError('trajectory 3')
+        spec_out.add(1., 1.)
+    with pytest.raises(RuntimeError, match='ValueError: trajectory 3'):
+        shards.run(traj_step, spec_out)
+    def traj_step(j):
+        if (j == 2):
+            os._exit(3)                 # e.g. killed: no result and a non-zero exit code
+    with pytest.raises(RuntimeError, match='exit code 3'):
+        shards.run(traj_step, spec_out)
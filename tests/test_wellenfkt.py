@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+import pytest
+from scipy.special import eval_genlaguerre, gammaln
+
+import wellenfkt as wf
+
+
+red_mass = wf.red_mass_au(20.1797, 20.1797)
+gs_a, gs_Req, gs_de = 0.8, 5.8, 1.1E-4          # two bound states
+res_a, res_Req, res_de = 1.0, 4.5, 0.0184       # 26 bound states
+
+
+#-------------------------------------------------------------------------
+#   grid overlaps of Morse states
+
+def test_R_grid():
+    R, weights = wf.R_grid(3., 10., 0.8, order=12)
+    assert len(R) == 9 * 12 and np.all((R > 3.) & (R < 10.))
+    assert np.isclose(np.sum(weights), 7.)
+    assert np.isclose(np.sum(weights * np.sin(3 * R)), (np.cos(9.) - np.cos(30.)) / 3)
+
+
+def test_V_on_grid():
+    R = np.linspace(4., 6., 5)
+    assert np.array_equal(wf.V_on_grid(lambda R: 1, R), np.ones(5))
+    assert np.allclose(wf.V_on_grid(lambda R: R**2, R), R**2)
+    assert np.allclose(wf.V_on_grid(lambda R: math.exp(-R), R), np.exp(-R))     # scalars only
+
+
+def test_grid_FCmor_mor_orthonormal():
+    S = wf.grid_FCmor_mor(10, res_a, res_Req, res_de, red_mass, 10, res_a, res_Req, res_de, 2., 12.)
+    assert np.allclose(S, np.eye(11), atol=1E-10)
+
+
+@pytest.mark.parametrize('V_of_R', [lambda R: 1, lambda R: np.exp(-(R - 5.)**2)])
+def test_grid_FCmor_mor_against_quad(V_of_R):
+    FC = wf.grid_FCmor_mor(1, gs_a, gs_Req, gs_de, red_mass, 5, res_a, res_Req, res_de, 2., 14., V_of_R=V_of_R)
+    assert FC.shape == (2, 6)
+    for n1, n2 in [(0, 0), (0, 5), (1, 3)]:
+        exact = wf.FCmor_mor(n1, gs_a, gs_Req, gs_de, red_mass, n2, res_a, res_Req, res_de, 2., 14.,
+                             V_of_R=V_of_R, epsabs=1E-13, limit=200)
+        assert abs(FC[n1, n2] - exact) < 1E-10
+
+
+#-------------------------------------------------------------------------
+#   Morse wavefunctions
+
+def laguerre_psi(R, n, alpha, Req, De):
+    # closed form: N z**(s/2) exp(-z/2) L_n^(s)(z),  N**2 = alpha s n! / Gamma(s + n + 1)
+    lambda_param = np.sqrt(2*red_mass*De) / alpha
+    s = 2*lambda_param - 2*n - 1
+    z = 2*lambda_param * np.exp(-alpha * (R - Req))
+    log_N = 0.5 * (np.log(alpha * s) + gammaln(n + 1) - gammaln(s + n + 1))
+    return np.exp(log_N + s/2 * np.log(z) - z/2) * eval_genlaguerre(n, s, z)
+
+
+def test_psi_n_recursion():
+    R = np.linspace(3.5, 8., 7)
+    for n in (0, 1, 4, 12):
+        psi = np.array([wf.psi_n(Ri, n, res_a, res_Req, red_mass, res_de) for Ri in R])
+        assert np.allclose(psi, laguerre_psi(R, n, res_a, res_Req, res_de), rtol=1E-9, atol=1E-12)
+
+
+def test_psi_all():
+    R = np.linspace(2.5, 12., 40)
+    table = wf.psi_all(R, 20, res_a, res_Req, red_mass, res_de)
+    assert table.shape == (21, 40)
+    for n in (0, 3, 20):
+        assert np.allclose(table[n], [wf.psi_n(Ri, n, res_a, res_Req, red_mass, res_de) for Ri in R],
+                           rtol=1E-9, atol=1E-13)
+    mp_table = [float(psi) for psi in wf.mp_psi_all(5.1, 20, res_a, res_Req, red_mass, res_de)]
+    assert np.allclose(wf.psi_all([5.1], 20, res_a, res_Req, red_mass, res_de)[:,0], mp_table, rtol=1E-11)
+
+
+#-------------------------------------------------------------------------
+#   Coulomb final states of the hyperbel potential
+
+fin_a = 0.0833354                           # V = fin_a / R: eta of about 50 to 70
+
+
+def test_psi_hyp_all():
+    R_starts = np.array([5.0, 6.5])
+    R = np.array([1.0, 4.0, 5.5, 6.0, 7.0, 9.0, 12.0])
+    psi = wf.psi_hyp_all(R, fin_a, 0.0, red_mass, R_starts)
+    assert psi.shape == (2, 7)
+    for i, R_start in enumerate(R_starts):
+        ref = np.array([float(wf.mp_psi_hyp(Ri, fin_a, 0.0, red_mass, R_start)) for Ri in R])
+        assert np.allclose(psi[i], ref, rtol=1E-9, atol=1E-12 * np.max(np.abs(ref)))
+    assert np.all(psi[:,0] == 0)            # deep in the barrier
+
+
+def test_grid_FCmor_hyp_against_quadrature():
+    FC = wf.grid_FCmor_hyp(3, res_a, res_Req, res_de, red_mass, fin_a, 0.0, [5.0, 6.5], 2.5, 12.)
+    assert FC.shape == (4, 2)
+    for n, j, R_start in [(0, 0, 5.0), (3, 1, 6.5)]:
+        exact = wf.FCmor_hyp(n, res_a, res_Req, res_de, red_mass, fin_a, 0.0, R_start, 2.5, 12.,
+                             epsabs=1E-12, limit=200)
+        assert abs(FC[n, j] - exact) < 1E-11 * max(1, abs(exact))
+
+
+def test_grid_FC_hyp_blocks_independent_of_the_chunks():
+    # with one width for the whole scan the overlaps do not depend on how the R_start values are batched
+    # (up to the rounding of the matrix products, which differs between array shapes)
+    R_starts = np.array([4.8, 5.3, 5.9, 6.4, 7.2])
+    width = 0.05
+    states = [(1, gs_a, gs_Req, gs_de, lambda R: 1), (4, res_a, res_Req, res_de, lambda R: np.exp(-R / 5.))]
+    whole = wf.grid_FC_hyp_blocks(states, red_mass, fin_a, 0.0, R_starts, 2.5, 12., width=width)
+    chunks = [wf.grid_FC_hyp_blocks(states, red_mass, fin_a, 0.0, R_starts[i:i+2], 2.5, 12., width=width)
+              for i in range(0, 5, 2)]
+    for k, block in enumerate(whole):
+        assert np.allclose(block, np.hstack([chunk[k] for chunk in chunks]), rtol=1E-13, atol=0)
+    single = wf.grid_FCmor_hyp(4, res_a, res_Req, res_de, red_mass, fin_a, 0.0, R_starts, 2.5, 12.,
+                               width=width, V_of_R=lambda R: np.exp(-R / 5.))
+    assert np.allclose(whole[1], single, rtol=1E-13, atol=0)
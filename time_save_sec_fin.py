@@ -37,6 +37,7 @@ print(infile)
 outfile = open("eldest.out", mode='w')
 pure_out = open('full.dat', mode='w')
 movie_out = open('movie.dat', mode='w')
+spec_out = in_out.SpectrumWriter(pure_out, movie_out)
 popfile = open("pop.dat", mode='w')
 
 outfile.write("The results were obtained with time_save_sec_fin.py \n")
@@ -222,7 +223,7 @@ elif (Xshape == 'infinite'):
 # IR pulse
 A_IR = lambda t3: A0L * np.sin(np.pi * (t3 - delta_t_au + TL_au/2) / TL_au)**2 \
                       * np.cos(omega_au * t3 + phi) # Evtly never used (only in integ_IR) ?
-integ_IR = lambda t3: (p_au + A_IR(t3))**2      # Hamiltonian for one electron in EM field      # Evtly never used (only in dress_I and dress_I_after) ?
+integ_IR = lambda t3: (p_au + A_IR(t3))**2      # Hamiltonian for one electron in EM field      # Never used ?
 
 IR_during = lambda t2:  np.exp(-1j * (E_kin_au + E_fin_au) * (t_au - t2))
 
@@ -242,25 +243,12 @@ fun_t_dir_1 = lambda t1: FX_t1(t1)   * np.exp(1j * E_fin_au * (t1-t_au)) \
 fun_TX2_dir_1 = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * (t1-t_au)) \
                                      * np.exp(1j * E_kin_au * (t1-t_au))        # Same as fun_t_dir_1 - why keep ?
 
-dress_I = lambda t1: integrate.quad(integ_IR,t1,t_au)[0]    # Evtly never used (only in dress) ?
-dress = lambda t1: np.exp(-1j/2 * dress_I(t1))  # Evtly never used (only in fun_IR_dir) ?
-
-dress_I_after = lambda t1: integrate.quad(integ_IR,t1,(delta_t_au + TL_au/2))[0]    # Evtly never used (only in dress_after) ?
-dress_after = lambda t1: np.exp(-1j/2 * dress_I_after(t1))  # Evtly never used (only in fun_dress_after) ?
-fun_dress_after = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                              * np.exp(1j * E_kin_au * ((delta_t_au + TL_au/2)-t_au)) \
-                              * dress_after(t1)     # Never used ?
-
-fun_IR_dir = lambda t1: FX_t1(t1) * np.exp(1j * E_fin_au * t1) \
-                                  * dress(t1)   # Never used ?
-
-
 
 res_inner_fun = lambda t2: np.exp(-t2 * (np.pi * (VEr_au**2) + 1j*(Er_au))) \
                            * IR_during(t2)
 
 if (integ == 'romberg'):
-    res_inner = lambda t1: integrate.romberg(res_inner_fun, t1, t_au)
+    res_inner = lambda t1: ci.complex_romberg(res_inner_fun, t1, t_au)
 elif (integ == 'quadrature'):
     res_inner = lambda t1: integrate.quad(res_inner_fun, t1, t_au)[0]
 elif (integ == 'analytic'):
@@ -380,14 +368,11 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
     outfile.write('during the first pulse \n')
     print('during the first pulse')
 
-    outlines = []       # will contain lines containing triples of E_kin, time and signal intensity
-    squares = np.array([])  # signal intensity ( = |amplitude|**2 = |J|**2 )
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
     print('t_s = ', t_s)
     outfile.write('t_s = ' + str(t_s) + '\n')
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     while (E_kin_au <= E_max_au):
         p_au = np.sqrt(2*E_kin_au)
 
@@ -429,18 +414,15 @@ while ((t_au <= TX_au/2) and (t_au <= tmax_au)):
                  )
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
 
-            string = in_out.prep_output(square, E_kin_au, t_au)     # returns str: E_kin_eV, t_s, square = intensity
-            outlines.append(string)
             # end of: if (E_kin < upper_E_min) else
         
         E_kin_au = E_kin_au + E_step_au
         # end of: while (E_kin < E_max), i. e. loop of E at constant t
     
     
-    in_out.doout_1f(pure_out, outlines)     # writes each (E_kin, t = const, |J|**2) triple in a sep line into output file
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)     # writes each (E_kin, t = const, |J|**2) triple in a sep line into output file
     max_pos = argrelextrema(squares, np.greater)[0]      # finds position of relative (i. e. local) maxima of |J|**2 in an array
     if (len(max_pos > 0)):                               # if there are such:
         for i in range (0, len(max_pos)):
@@ -460,12 +442,9 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
     print('between the pulses')
     
     # all equal to during-1st-pulse section, except for integrating over entire XUV pulse now
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print('t_s = ', t_s)
     outfile.write('t_s = ' + str(t_s) + '\n')
     while (E_kin_au <= E_max_au):
@@ -509,17 +488,13 @@ while (t_au >= TX_au/2 and (t_au <= (delta_t_au - a)) and (t_au <= tmax_au)):
                  )
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out, outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -594,12 +569,9 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
     outfile.write('during the second pulse \n')
     print('during the second pulse')
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print('t_s = ', t_s)
     outfile.write('t_s = ' + str(t_s) + '\n')
     
@@ -662,9 +634,7 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
                 res_J2   = prefac_res2 * res_I
     
             square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
 
         elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max): # upper E range = sRICD range -> sRICD params
 # integral 1
@@ -707,16 +677,13 @@ while (t_au >= (delta_t_au - a) and (t_au <= (delta_t_au + a)) and (t_au <= tmax
             E_count = E_count + 1
     
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -736,12 +703,9 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
     outfile.write('after the pulses \n')
     print('after the pulses')
 
-    outlines = []
-    squares = np.array([])
     E_kin_au = E_min_au
     
     t_s = sciconv.atu_to_second(t_au)
-    movie_out.write('"' + format(t_s*1E15, '.3f') + ' fs' + '"' + '\n')
     print('t_s = ', sciconv.atu_to_second(t_au))
     outfile.write('t_s = ' + str(sciconv.atu_to_second(t_au)) + '\n')
     E_count = 0
@@ -775,10 +739,8 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
                 res_J2   = prefac_res2 * res_I
     
             square = np.absolute(res_J2)**2
-            squares = np.append(squares, square)
+            spec_out.add(square, E_kin_au)
 
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
         elif (E_kin_au >= upper_E_min and E_kin_au <= upper_E_max):
 # integral 1
             if (integ_outer == "quadrature"):
@@ -809,17 +771,13 @@ while (t_au >= (delta_t_au + a) and (t_au <= tmax_au)):
             E_count = E_count + 1
             
             square = np.absolute(J)**2
-            squares = np.append(squares, square)
-
-            string = in_out.prep_output(square, E_kin_au, t_au)
-            outlines.append(string)
+            spec_out.add(square, E_kin_au)
         
         E_kin_au = E_kin_au + E_step_au
 
     
     
-    in_out.doout_1f(pure_out,outlines)
-    in_out.doout_movie(movie_out, outlines)
+    squares = spec_out.write(t_au)
     max_pos = argrelextrema(squares, np.greater)[0]
     if (len(max_pos > 0)):
         for i in range (0, len(max_pos)):
@@ -0,0 +1,191 @@
+##########################################################################
+#                   CLASSICAL NUCLEAR TRAJECTORIES                       #
+##########################################################################
+# Purpose:                                                               #
+#          - Propagation of R(t) on the time grid of the classical-      #
+#            nuclei scripts (measure_nucl, measure_nucl_TK) once before  #
+#            the spectrum loops, for one or an ensemble of initial       #
+#            conditions at the same time.                                #
+#                                                                        #
+##########################################################################
+# grad(t, R) returns dV/dR (hartree/bohr) for an array of R; t is the    #
+# time the step leads to, so a grad switching the potential at some t   #
+# (e.g. at the second pulse) moves the nuclei on the potential of the    #
+# temporal phase the step ends in, as the step-by-step scripts did.      #
+# Use potentials.expr6_grad / hyperbel_grad for the analytic gradients.  #
+# Ensembles: morse_wigner samples the initial conditions, EnsembleShards #
+# runs the trajectories of a time step, optionally in several processes  #
+##########################################################################
+
+import multiprocessing
+import sys
+import traceback
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+import wellenfkt as wf
+
+
+def time_grid(t_start, timestep_au, tmax_au):
+    # the times of the script loops: t_start, t_start + timestep_au, ... <= tmax_au
+    n_t = int(np.floor((tmax_au - t_start) / timestep_au + 1E-9)) + 1
+    return t_start + timestep_au * np.arange(max(n_t, 1))
+
+
+def velocity_verlet(R0, P0, red_mass, t_grid, grad):
+    # R, P on t_grid (n_t, N_traj), R[0] = R0, P[0] = P0
+    R0 = np.atleast_1d(np.asarray(R0, dtype=float))
+    P0 = np.broadcast_to(np.asarray(P0, dtype=float), R0.shape)
+    R = np.empty((len(t_grid),) + R0.shape)
+    P = np.empty_like(R)
+    R[0], P[0] = R0, P0
+    for n in range(1, len(t_grid)):
+        dt = t_grid[n] - t_grid[n-1]
+        t = t_grid[n]
+        P_half = P[n-1] - 0.5 * dt * grad(t, R[n-1])
+        R[n] = R[n-1] + dt * P_half / red_mass
+        P[n] = P_half - 0.5 * dt * grad(t, R[n])
+    return R, P
+
+
+def rk45(R0, P0, red_mass, t_grid, grad, rtol=1E-10, atol=1E-12):
+    # R, P on t_grid (n_t, N_traj) with adaptive Runge-Kutta (scipy solve_ivp, RK45);
+    # each interval of t_grid is one integration, so that a grad switching at grid points is followed exactly
+    R0 = np.atleast_1d(np.asarray(R0, dtype=float))
+    P0 = np.broadcast_to(np.asarray(P0, dtype=float), R0.shape)
+    N = R0.size
+    R = np.empty((len(t_grid),) + R0.shape)
+    P = np.empty_like(R)
+    R[0], P[0] = R0, P0
+    for n in range(1, len(t_grid)):
+        t = t_grid[n]
+        rhs = lambda s, y: np.concatenate((y[N:] / red_mass, -grad(t, y[:N])))
+        sol = solve_ivp(rhs, (t_grid[n-1], t), np.concatenate((R[n-1], P[n-1])),
+                        method='RK45', rtol=rtol, atol=atol)
+        R[n], P[n] = sol.y[:N,-1], sol.y[N:,-1]
+    return R, P
+
+
+def propagate(R0, P0, red_mass, t_grid, grad, method='verlet'):
+    if (method == 'verlet'):
+        return velocity_verlet(R0, P0, red_mass, t_grid, grad)
+    elif (method == 'rk45'):
+        return rk45(R0, P0, red_mass, t_grid, grad)
+    raise ValueError('Unknown propagator: ' + str(method))
+
+
+class NuclearTables:
+    # R(t), P(t) and functions of R along the trajectories, evaluated once on the whole time grid
+    #   tables = NuclearTables(t_grid, R, P, E_res=lambda R: potentials.expr6(..., R), ...)
+    #   n = tables.index(t_au);  tables.E_res[n]  (one value per trajectory)
+    def __init__(self, t_grid, R, P, **functions):
+        self.t = np.asarray(t_grid, dtype=float)
+        self.R = R
+        self.P = P
+        for name, fun in functions.items():
+            setattr(self, name, fun(R))
+
+    def kinetic(self, red_mass):
+        # kinetic energy P**2 / (2 red_mass) of the nuclei, (n_t, N_traj)
+        return self.P**2 / (2 * red_mass)
+
+    def index(self, t_au):
+        # grid point of t_au (the scripts advance t_au by adding timestep_au)
+        dt = self.t[1] - self.t[0] if (len(self.t) > 1) else 1.
+        return min(max(int(round((t_au - self.t[0]) / dt)), 0), len(self.t) - 1)
+
+
+#-------------------------------------------------------------------------
+#   ensembles of initial conditions
+
+def morse_wigner(De, alpha, Req, red_mass, n_traj, seed=0, n_R=256, n_P=256):
+    # n_traj pairs (R, P) (atomic units) sampled from the Wigner function of the vibrational ground state
+    # of the Morse potential De, alpha, Req,
+    #   W(R,P) = 1/pi int psi_0(R+y) psi_0(R-y) exp(2i P y) dy,
+    # tabulated on an (R, P) grid of n_R x n_P cells; the small negative parts of W are dropped
+    omega = alpha * np.sqrt(2*De / red_mass)
+    sigma_R = np.sqrt(1. / (2 * red_mass * omega))          # widths of the harmonic approximation
+    sigma_P = np.sqrt(red_mass * omega / 2)
+    R_edges = np.linspace(Req - 6*sigma_R, Req + 10*sigma_R, n_R+1)
+    P_edges = np.linspace(-8*sigma_P, 8*sigma_P, n_P+1)
+    R = (R_edges[1:] + R_edges[:-1]) / 2
+    P = (P_edges[1:] + P_edges[:-1]) / 2
+    dy = min(R[1] - R[0], np.pi / (4 * P_edges[-1]))       # resolves exp(2i P y) up to the largest P
+    y = dy * np.arange(int(np.ceil(8*sigma_R / dy)) + 1)
+    def psi(x):
+        with np.errstate(all='ignore'):
+            return np.nan_to_num(np.where(x > 0, wf.psi_n(np.where(x > 0, x, Req), 0, alpha, Req, red_mass, De), 0.))
+    A = psi(R[:,None] + y[None,:]) * psi(R[:,None] - y[None,:])
+    A[:,1:] *= 2                                            # W is even in y
+    W = dy / np.pi * np.dot(A, np.cos(2 * np.outer(y, P)))
+    prob = np.clip(W, 0, None).ravel()
+    rng = np.random.RandomState(seed)
+    cells = rng.choice(prob.size, size=n_traj, p=prob / prob.sum())
+    i, k = np.unravel_index(cells, W.shape)
+    R0 = R_edges[i] + (R_edges[1] - R_edges[0]) * rng.uniform(size=n_traj)
+    P0 = P_edges[k] + (P_edges[1] - P_edges[0]) * rng.uniform(size=n_traj)
+    return R0, P0
+
+
+def _shard_worker(func, js, spec_out, conn):
+    # runs in a forked process: func(j) for the trajectories of the shard, then the rows of spec_out
+    # (empty at the fork) are sent back; on an error the traceback is sent and the exit code is 1
+    try:
+        for j in js:
+            func(j)
+        conn.send(spec_out.rows())
+    except Exception:
+        conn.send(traceback.format_exc())
+        conn.close()
+        sys.exit(1)
+    conn.close()
+
+
+class EnsembleShards:
+    # the trajectory indices j of one time step, shared among `workers` processes:
+    #   def traj_step(j):
+    #       ... spec_out.add(square, E_kin_au) for trajectory j ...
+    #   shards.run(traj_step, spec_out)
+    # The first range of j is done in the calling process, every other one in a process forked for this
+    # time step (so func sees the current globals of the script); run appends their rows to spec_out in
+    # the order of j. A worker that fails or ends with a non-zero exit code raises a RuntimeError.
+    def __init__(self, n_traj, workers=1):
+        self.n_traj = n_traj
+        self.workers = max(1, min(workers, n_traj))
+
+    def ranges(self):
+        bounds = np.linspace(0, self.n_traj, self.workers+1).astype(int)
+        return [range(bounds[rank], bounds[rank+1]) for rank in range(self.workers)]
+
+    def run(self, func, spec_out):
+        ranges = self.ranges()
+        ctx = multiprocessing.get_context('fork') if hasattr(multiprocessing, 'get_context') else multiprocessing
+        procs = []
+        try:
+            for js in ranges[1:]:
+                conn, child_conn = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=_shard_worker, args=(func, js, spec_out, child_conn))
+                proc.daemon = True
+                proc.start()
+                child_conn.close()
+                procs.append((proc, conn, js))
+            for j in ranges[0]:
+                func(j)
+            for proc, conn, js in procs:
+                try:
+                    res = conn.recv()
+                except EOFError:
+                    res = None
+                proc.join()
+                if (proc.exitcode != 0 or not isinstance(res, tuple)):
+                    raise RuntimeError('trajectory shard ' + str(js[0]) + '-' + str(js[-1]) + ' (process '
+                                       + str(proc.pid) + ') failed with exit code ' + str(proc.exitcode)
+                                       + ('' if res is None else ':\n' + str(res)))
+                spec_out.extend(*res)
+        finally:
+            for proc, conn, js in procs:
+                if proc.is_alive():
+                    proc.terminate()
+                proc.join()
+                conn.close()
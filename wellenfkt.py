@@ -14,7 +14,7 @@ import mpmath
 from mpmath import coulombf, coulombg
 import numpy as np
 import scipy.integrate as integrate
-from scipy.special import factorial
+from scipy.special import factorial, gammaln
 
 import complex_integration as ci
 import sciconv as sc
@@ -104,18 +104,15 @@ def const_s_psi(R,n,s,alpha,Req,lambda_param):
                      * z**(s/4)
                      )
         return psi_0
-    elif (n == 1):
-        psi_1 = ( 1.0 
-                     * (2*n + s -1 -z)
-                     * np.sqrt(1./(n*(s + n)))
-                     )
-        return psi_1 * const_s_psi(R,n-1,s,alpha,Req,lambda_param)
-    else:
-        prefac  =  np.sqrt(1./(n*(s + n)))
-        prefac1 =  (2 * n + s -1 - z)
-        prefac2 = np.sqrt((n-1) * (n + s - 1))
-        return prefac * (  prefac1 * const_s_psi(R,n-1,s,alpha,Req,lambda_param)
-                         - prefac2 * const_s_psi(R,n-2,s,alpha,Req,lambda_param)  )
+    else:                       # upward recursion psi_0, psi_1, ... psi_n with fixed s
+        psi_km2 = 0
+        psi_km1 = const_s_psi(R,0,s,alpha,Req,lambda_param)
+        for k in range(1, n+1):
+            prefac  =  np.sqrt(1./(k*(s + k)))
+            prefac1 =  (2 * k + s -1 - z)
+            prefac2 = np.sqrt((k-1) * (k + s - 1))
+            psi_km2, psi_km1 = psi_km1, prefac * (prefac1 * psi_km1 - prefac2 * psi_km2)
+        return psi_km1
 
 
 def psi_n(R,n,alpha,Req,red_mass,De):
@@ -247,18 +244,15 @@ def mp_const_s_psi(R,n,s,alpha,Req,lambda_param):
                      * z**(s/4)
                      )
         return psi_0
-    elif (n == 1):
-        psi_1 = ( 1.0 
-                     * (2*n + s -1 -z)
-                     * mpmath.sqrt(1./(n*(s + n)))
-                     )
-        return psi_1 * mp_const_s_psi(R,n-1,s,alpha,Req,lambda_param)
-    else:
-        prefac  =  mpmath.sqrt(1./(n*(s + n)))
-        prefac1 =  (2 * n + s -1 - z)
-        prefac2 = mpmath.sqrt((n-1) * (n + s - 1))
-        return prefac * (  prefac1 * mp_const_s_psi(R,n-1,s,alpha,Req,lambda_param)
-                         - prefac2 * mp_const_s_psi(R,n-2,s,alpha,Req,lambda_param)  )
+    else:                       # upward recursion psi_0, psi_1, ... psi_n with fixed s
+        psi_km2 = 0
+        psi_km1 = mp_const_s_psi(R,0,s,alpha,Req,lambda_param)
+        for k in range(1, n+1):
+            prefac  =  mpmath.sqrt(1./(k*(s + k)))
+            prefac1 =  (2 * k + s -1 - z)
+            prefac2 = mpmath.sqrt((k-1) * (k + s - 1))
+            psi_km2, psi_km1 = psi_km1, prefac * (prefac1 * psi_km1 - prefac2 * psi_km2)
+        return psi_km1
 
 
 def mp_psi_n(R,n,alpha,Req,red_mass,De):
@@ -266,6 +260,23 @@ def mp_psi_n(R,n,alpha,Req,red_mass,De):
     s = 2*lambda_param - 2*n - 1
     psi = mp_const_s_psi(R,n,s,alpha,Req,lambda_param)
     return psi
+
+
+def mp_psi_all(R,n_max,alpha,Req,red_mass,De):
+    # [psi_0(R), ... psi_n_max(R)] at a single R, like psi_all but in the working precision of mpmath (for large lambda)
+    lambda_param = mpmath.sqrt(2*red_mass*De) / alpha
+    z = 2* lambda_param * mpmath.exp(-alpha * (R - Req))
+    psi = []
+    for n in range(n_max+1):
+        s = 2*lambda_param - 2*n - 1
+        psi_km2 = 0
+        psi_km1 = mpmath.exp(  0.5 * mpmath.log(alpha) + 0.5 * mpmath.log(s) - 0.5 * mpmath.loggamma(s + 1)
+                             + s/2 * mpmath.log(z) - z / 2)
+        for k in range(1, n+1):
+            psi_km2, psi_km1 = psi_km1, mpmath.sqrt(1./(k*(s + k))) * (  (2 * k + s - 1 - z) * psi_km1
+                                                                       - mpmath.sqrt((k-1) * (k + s - 1)) * psi_km2)
+        psi.append(psi_km1)
+    return psi
     
 
 def mp_psi_freehyp(R,a,b,red_mass,R_start,phase=0):    # model: free particle with energy corresponding to a point (at R_start) on a hyperbola, psi = 0 for section left of R_start
@@ -359,5 +370,176 @@ def mp_FCmor_hyp(n1,alpha1,Req1,De1,red_mass,V2a,V2b,R_start,R_min,R_max,**kwarg
     FC = tmp[0]
     return complex(FC)
 
+## Integrals on a common R grid: all Morse eigenfunctions are tabulated once,
+## the overlap integrals are then weighted matrix products
+
+def R_grid(R_min,R_max,width,order=20):
+    # composite Gauss-Legendre nodes and weights on [R_min, R_max] with panels of at most the given width
+    n_panels = max(1, int(np.ceil((R_max - R_min) / width)))
+    x, w = np.polynomial.legendre.leggauss(order)
+    edges = np.linspace(R_min, R_max, n_panels + 1)
+    half = 0.5 * np.diff(edges)
+    mid  = 0.5 * (edges[1:] + edges[:-1])
+    R = (mid[:,None] + half[:,None] * x[None,:]).ravel()
+    weights = (half[:,None] * w[None,:]).ravel()
+    return R, weights
+
+
+def psi_all(R,n_max,alpha,Req,red_mass,De):
+    # psi_n(R) for n = 0 ... n_max on the array R      (n_max+1, len(R))
+    # Same recursion as in const_s_psi, but iterative and for all n at once (s = 2 lambda - 2n - 1 differs between the n)
+    R = np.asarray(R, dtype=float)
+    lambda_param = np.sqrt(2*red_mass*De) / alpha
+    s = 2*lambda_param - 2*np.arange(n_max+1)[:,None] - 1
+    z = 2* lambda_param * np.exp(-alpha * (R - Req))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore', under='ignore'):
+        psi_km1 = np.exp(0.5 * np.log(alpha) + 0.5 * np.log(s) - 0.5 * gammaln(s + 1)
+                         + s/2 * np.log(z) - z / 2)     # psi_0 for every s
+    psi_km1[~np.isfinite(psi_km1)] = 0.
+    psi_km2 = np.zeros_like(psi_km1)
+    table = np.empty_like(psi_km1)
+    table[0] = psi_km1[0]
+    for k in range(1, n_max+1):                         # step k only needs the rows n >= k
+        sk = s[k:]
+        psi_k = np.zeros_like(psi_km1)
+        psi_k[k:] = np.sqrt(1./(k*(sk + k))) * (  (2 * k + sk - 1 - z) * psi_km1[k:]
+                                                - np.sqrt((k-1) * (k + sk - 1)) * psi_km2[k:])
+        table[k] = psi_k[k]
+        psi_km2, psi_km1 = psi_km1, psi_k
+    return table
+
+
+def V_on_grid(V_of_R,R):
+    # V_of_R on the array R, also for functions that only accept scalars
+    try:
+        V = np.asarray(V_of_R(R), dtype=float)
+    except (TypeError, ValueError):
+        V = np.vectorize(lambda x: float(V_of_R(x)))(R)
+    return np.broadcast_to(V, R.shape)
+
+
+def grid_FCmor_mor(n1_max,alpha1,Req1,De1,red_mass,n2_max,alpha2,Req2,De2,R_min,R_max,**kwargs):
+    # matrix of all <n1|V|n2> for n1 = 0 ... n1_max, n2 = 0 ... n2_max      (n1_max+1, n2_max+1)
+    # The panel width is a fraction of the shortest local de Broglie wavelength 2 pi / sqrt(2 red_mass De) of both potentials.
+    order = kwargs.get("order", 20)
+    V_of_R = kwargs.get("V_of_R", lambda R: 1)
+    k_max = np.sqrt(2 * red_mass * max(De1, De2))
+    width = kwargs.get("width", 2*np.pi / k_max)
+    R, weights = R_grid(R_min, R_max, width, order)
+    psi1 = psi_all(R,n1_max,alpha1,Req1,red_mass,De1)
+    psi2 = psi_all(R,n2_max,alpha2,Req2,red_mass,De2)
+    return np.dot(psi1 * (weights * V_on_grid(V_of_R,R)), psi2.T)
+
+## Coulomb final states of the hyperbel potential a/R + b on an R grid
+
+def cheb_int(N):
+    # Chebyshev points x_j = cos(j pi / N), j = 0 ... N, and the matrix of int_-1^x_j on them (spectral integration)
+    x = np.cos(np.pi * np.arange(N+1) / N)
+    coeffs = np.linalg.inv(np.polynomial.chebyshev.chebvander(x, N))    # columns: Chebyshev coefficients of the Lagrange polynomials
+    S = np.array([np.polynomial.chebyshev.chebval(x, np.polynomial.chebyshev.chebint(c, lbnd=-1)) for c in coeffs.T]).T
+    return x, S
+
+
+def coulomb_F0(eta,K,R,**kwargs):
+    # regular Coulomb function F_0(eta_i, K_i R_j) for batches of (eta, K) on the array R      (len(eta), len(R))
+    # The radial equation u'' = (2 eta K / R - K**2) u is propagated outwards for all (eta, K) at once, in its
+    # integral form on Chebyshev panels of about one wavelength (spectrally accurate, no small steps).
+    # Each solution starts with its WKB form deep in the barrier, where F_0 is exp(-G_start) below its value
+    # at the turning point R_t = 2 eta / K, so the admixture of G_0 has died out long before it matters;
+    # values further inside are set to 0. The scale is fixed by one mpmath.coulombf at the turning point.
+    N = kwargs.get("nodes", 24)
+    G_start = kwargs.get("G_start", 45.)
+    eta = np.atleast_1d(np.asarray(eta, dtype=float))
+    K   = np.atleast_1d(np.asarray(K, dtype=float))
+    R   = np.asarray(R, dtype=float)
+    R_t = 2 * eta / K
+    def growth(x):                      # WKB exponent int_x^R_t kappa dR' = 2 eta (pi/2 - th - sin th cos th), x = R_t sin**2 th
+        th = np.arcsin(np.sqrt(np.clip(x / R_t, 0, 1)))
+        return 2 * eta * (np.pi/2 - th - np.sin(th) * np.cos(th))
+    lo, hi = np.zeros_like(eta), np.ones_like(eta)      # starting points: growth = G_start, by bisection in x / R_t
+    for it in range(60):
+        mid = 0.5 * (lo + hi)
+        inside = growth(mid * R_t) > G_start
+        lo, hi = np.where(inside, mid, lo), np.where(inside, hi, mid)
+    width = kwargs.get("width", 2*np.pi / np.max(K))
+    R_s = np.maximum(lo * R_t, width)                   # the first panel [0, width] would contain the singularity
+
+    i_lo = int(np.min(R_s) // width)                    # panels [i width, (i+1) width] on a fixed lattice: with a given width,
+    R_lo = i_lo * width                                 # each F_0 is independent of the batch it is calculated in
+    R_hi = max(np.max(R), np.max(R_t))
+    n_panels = max(1, int(np.ceil((R_hi - R_lo) / width)))
+    h = 0.5 * width
+    x, S = cheb_int(N)
+    S2 = np.dot(S, S)
+    bary = (-1.)**np.arange(N+1)                        # barycentric weights for interpolation between the nodes
+    bary[[0,-1]] *= 0.5
+    R_all = np.concatenate((R, R_t))                    # the turning points are needed for the scale
+    panel = np.clip((R_all // width).astype(int) - i_lo, -1, n_panels-1)
+    first = np.clip((R_s // width).astype(int) - i_lo, 0, n_panels-1)       # panel in which each solution starts
+
+    u_all = np.zeros((len(eta), len(R_all)))
+    u, du = np.zeros_like(eta), np.zeros_like(eta)
+    for p in range(n_panels):
+        R_left = (i_lo + p) * width
+        new = (first == p)
+        if np.any(new):                                 # WKB start of the growing solution at the left panel edge
+            kappa = K[new] * np.sqrt(np.maximum(R_t[new] / R_left - 1, 1e-300))
+            dkappa = -K[new]**2 * R_t[new] / (2 * R_left**2 * kappa)
+            u[new] = np.exp(-growth(R_left)[new])
+            du[new] = u[new] * (kappa - dkappa / (2 * kappa))
+        R_nodes = R_left + h * (1 + x)
+        g = h**2 * (2 * eta[:,None] * K[:,None] / R_nodes[None,:] - K[:,None]**2)     # u_tt = g u  with  R = R_left + h (1 + t)
+        A = np.eye(N+1)[None] - S2[None] * g[:,None,:]  # u(t) = u(-1) + u_t(-1) (1 + t) + int int g u
+        rhs = u[:,None] + h * du[:,None] * (1 + x[None,:])
+        u_nodes = np.linalg.solve(A, rhs[...,None])[...,0]
+        sel = np.nonzero(panel == p)[0]
+        if len(sel):
+            t = (R_all[sel] - R_left) / h - 1
+            diff = t[:,None] - x[None,:]
+            exact = (diff == 0)
+            diff[exact] = 1
+            B = bary[None,:] / diff
+            B /= B.sum(axis=1)[:,None]
+            rows, cols = np.nonzero(exact)
+            B[rows] = 0
+            B[rows, cols] = 1
+            u_all[:, sel] = np.dot(u_nodes, B.T)
+        u, du = u_nodes[:,0], du + np.dot(g * u_nodes, S[0]) / h
+    u_t = u_all[np.arange(len(eta)), len(R) + np.arange(len(eta))]
+    scale = np.array([float(coulombf(0, e, 2*e)) for e in eta]) / u_t
+    F = u_all[:, :len(R)] * scale[:,None]
+    F[R[None,:] < R_s[:,None]] = 0
+    return F
+
+
+def psi_hyp_all(R,a,b,red_mass,R_starts,**kwargs):
+    # psi_hyp(R) for all R_start in R_starts on the array R, normalized as in psi_hyp      (len(R_starts), len(R))
+    R_starts = np.atleast_1d(np.asarray(R_starts, dtype=float))
+    E_au = a / R_starts                             # = potentials.hyperbel(...) - b  in psi_hyp
+    K_au = np.sqrt(2 * red_mass * E_au)
+    norm = np.sqrt(2 * red_mass / (np.pi * K_au))
+    eta = a * red_mass / K_au
+    return norm[:,None] * coulomb_F0(eta, K_au, R, **kwargs)
+
+
+def grid_FC_hyp_blocks(states,red_mass,V2a,V2b,R_starts,R_min,R_max,**kwargs):
+    # overlap matrices <n1|V|mu> with the hyperbel states of all R_start in R_starts for several sets of Morse states
+    # states: list of (n1_max, alpha1, Req1, De1, V_of_R); returns a list of matrices (n1_max+1, len(R_starts))
+    # The final states are evaluated only once for all sets. Pass the same width for all calls of a scan over R_start
+    # to make the results independent of how the R_start values are batched.
+    order = kwargs.get("order", 20)
+    k_max = np.sqrt(2 * red_mass * max(max(state[3] for state in states), V2a / np.min(R_starts)))
+    width = kwargs.get("width", 2*np.pi / k_max)
+    R, weights = R_grid(R_min, R_max, width, order)
+    psi2 = psi_hyp_all(R,V2a,V2b,red_mass,R_starts,width=width)
+    return [np.dot(psi_all(R,n1_max,alpha1,Req1,red_mass,De1) * (weights * V_on_grid(V_of_R,R)), psi2.T)
+            for n1_max,alpha1,Req1,De1,V_of_R in states]
+
+
+def grid_FCmor_hyp(n1_max,alpha1,Req1,De1,red_mass,V2a,V2b,R_starts,R_min,R_max,**kwargs):
+    # matrix of all <n1|V|mu> for n1 = 0 ... n1_max and the hyperbel states of all R_start in R_starts      (n1_max+1, len(R_starts))
+    V_of_R = kwargs.pop("V_of_R", lambda R: 1)
+    return grid_FC_hyp_blocks([(n1_max,alpha1,Req1,De1,V_of_R)],red_mass,V2a,V2b,R_starts,R_min,R_max,**kwargs)[0]
+
 #R_min = sc.angstrom_to_bohr(1.5)
 #R_max = sc.angstrom_to_bohr(30.0)